@@ -0,0 +1,196 @@
+"""
+Admission control for realtime voice sessions.
+
+Every started stream used to get its session coroutine immediately, so under a
+traffic spike all calls shared the same loops, CPU and upstream rate limits
+and degraded together. AdmissionController caps the sessions a server process
+runs at once - globally (MAX_CONCURRENT_SESSIONS) and per provider
+(OPENAI_MAX_SESSIONS, ELEVENLABS_MAX_SESSIONS; 0 means no cap) - and parks the
+rest in a FIFO wait queue. Waiting clients get 'queue_position' updates over
+Socket.IO; an admitted session keeps its slot until its coroutine has ended,
+so the sessions that are running keep a predictable share of the server.
+
+The controller is driven by three events:
+
+* request(sid, provider)  - start_stream: admit now, queue, or reject when the
+                            wait queue is full (ADMISSION_QUEUE_MAX);
+* session_done(sid)       - the runtime's session task ended (or a start was
+                            skipped); frees the slot once every start for the
+                            sid has ended and admits the next waiters;
+* cancel(sid) / release(sid) - stop_stream leaves the queue; disconnect also
+                            drops the slot.
+
+Callbacks (admit, notify) run outside the lock, from whichever thread
+delivered the event.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+MAX_CONCURRENT_SESSIONS = int(os.environ.get("MAX_CONCURRENT_SESSIONS", "0"))
+PROVIDER_SESSION_CAPS = {
+    'openai': int(os.environ.get("OPENAI_MAX_SESSIONS", "0")),
+    'elevenlabs': int(os.environ.get("ELEVENLABS_MAX_SESSIONS", "0")),
+}
+ADMISSION_QUEUE_MAX = int(os.environ.get("ADMISSION_QUEUE_MAX", "50"))
+
+ADMITTED = "admitted"
+QUEUED = "queued"
+REJECTED = "rejected"
+
+
+class AdmissionController:
+    """Global and per-provider concurrency caps with a fair FIFO wait queue.
+
+    admit(sid, provider) starts an admitted session; notify(sid, data) sends
+    a 'queue_position' payload to a client.
+    """
+
+    def __init__(self, admit, notify, max_sessions=MAX_CONCURRENT_SESSIONS, provider_caps=None,
+                 queue_max=ADMISSION_QUEUE_MAX, name="admission"):
+        self.admit = admit
+        self.notify = notify
+        self.max_sessions = max_sessions
+        self.provider_caps = dict(PROVIDER_SESSION_CAPS if provider_caps is None else provider_caps)
+        self.queue_max = queue_max
+        self.name = name
+        self._lock = threading.Lock()
+        # _active[sid] = [provider, starts not yet ended]
+        self._active = {}
+        self._per_provider = collections.Counter()
+        # _waiting[sid] = (provider, queued_at); insertion order is the queue order
+        self._waiting = collections.OrderedDict()
+
+    def request(self, sid, provider):
+        """Admit, queue or reject a session start. Returns ADMITTED, QUEUED or REJECTED."""
+        restart = False
+        with self._lock:
+            entry = self._active.get(sid)
+            if entry is not None:
+                entry[1] += 1  # Restart within a held slot (stop_stream + start_stream)
+                restart = True
+                admitted, positions = [], {}
+            else:
+                if sid not in self._waiting:
+                    if len(self._waiting) >= self.queue_max and not self._has_room(provider):
+                        log.warning(f"[{sid}] {self.name}: wait queue full ({self.queue_max}), rejecting {provider} session.")
+                        metrics.incr(f"{self.name}.rejected")
+                        return REJECTED
+                    self._waiting[sid] = (provider, time.monotonic())
+                admitted, positions = self._admit_waiters(changed=True)
+        if restart:
+            self.admit(sid, provider)
+            return ADMITTED
+        self._start_admitted(admitted, positions, requester=sid)
+        if sid in positions:
+            log.info(f"[{sid}] {self.name}: {provider} session queued at position {positions[sid]['position']}.")
+            metrics.incr(f"{self.name}.queued")
+            return QUEUED
+        return ADMITTED
+
+    def session_done(self, sid):
+        """A session task for sid ended; free its slot once no start for it is outstanding."""
+        with self._lock:
+            entry = self._active.get(sid)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            self._free_slot(sid)
+            admitted, positions = self._admit_waiters()
+        self._start_admitted(admitted, positions)
+
+    def cancel(self, sid):
+        """Take sid out of the wait queue (stop_stream before it was admitted)."""
+        with self._lock:
+            if self._waiting.pop(sid, None) is None:
+                return
+            admitted, positions = self._admit_waiters(changed=True)
+        self._start_admitted(admitted, positions)
+
+    def release(self, sid):
+        """Forget sid entirely (client disconnected): leave the queue and free its slot."""
+        with self._lock:
+            queued = self._waiting.pop(sid, None) is not None
+            if sid in self._active:
+                self._free_slot(sid)
+            elif not queued:
+                return
+            admitted, positions = self._admit_waiters(changed=queued)
+        self._start_admitted(admitted, positions)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'active': len(self._active),
+                'active_by_provider': {p: n for p, n in self._per_provider.items() if n},
+                'waiting': len(self._waiting),
+                'max_sessions': self.max_sessions,
+                'provider_caps': dict(self.provider_caps),
+            }
+
+    # --- Internals (called with the lock held) ---
+    def _has_room(self, provider):
+        if self.max_sessions > 0 and len(self._active) >= self.max_sessions:
+            return False
+        cap = self.provider_caps.get(provider, 0)
+        return cap <= 0 or self._per_provider[provider] < cap
+
+    def _take_slot(self, sid, provider):
+        self._active[sid] = [provider, 1]
+        self._per_provider[provider] += 1
+
+    def _free_slot(self, sid):
+        provider, _ = self._active.pop(sid)
+        self._per_provider[provider] -= 1
+
+    def _admit_waiters(self, changed=False):
+        """Admit waiters in queue order; a waiter whose provider is at its cap does not block other providers.
+
+        Returns the admitted (sid, provider, waited_ms) and, when the queue
+        changed, the new position of every remaining waiter.
+        """
+        admitted = []
+        now = time.monotonic()
+        for sid, (provider, queued_at) in list(self._waiting.items()):
+            if self.max_sessions > 0 and len(self._active) >= self.max_sessions:
+                break
+            if self._has_room(provider):
+                del self._waiting[sid]
+                self._take_slot(sid, provider)
+                admitted.append((sid, provider, (now - queued_at) * 1000.0))
+        positions = self._positions() if admitted or changed else {}
+        self._report()
+        return admitted, positions
+
+    def _positions(self):
+        waiting = len(self._waiting)
+        return {sid: {'position': i + 1, 'waiting': waiting} for i, sid in enumerate(self._waiting)}
+
+    def _report(self):
+        metrics.set_gauge(f"{self.name}.active", len(self._active))
+        metrics.set_gauge(f"{self.name}.waiting", len(self._waiting))
+
+    # --- Callbacks (called without the lock) ---
+    def _start_admitted(self, admitted, positions, requester=None):
+        for sid, provider, waited_ms in admitted:
+            metrics.observe(f"{self.name}.wait_ms", waited_ms)
+            if sid != requester:  # Admitted from the queue; the requester never saw a position
+                log.info(f"[{sid}] {self.name}: {provider} session admitted after {waited_ms:.0f}ms in queue.")
+                self._notify_all({sid: {'position': 0, 'waiting': len(positions), 'admitted': True}})
+            self.admit(sid, provider)
+        self._notify_all(positions)
+
+    def _notify_all(self, positions):
+        for sid, data in positions.items():
+            try:
+                self.notify(sid, data)
+            except Exception as e:
+                log.warning(f"[{sid}] {self.name}: error sending queue position: {e}")
@@ -7,8 +7,10 @@ import base64
 import traceback
 import logging
 import threading # Use standard threading
-from queue import Queue # Use standard thread-safe queue
+import contextlib
+import collections
 import re # <<< Import regex
+import time
 import boto3
 from botocore.exceptions import ClientError
 from datetime import datetime, timedelta
@@ -19,6 +21,31 @@ from flask_socketio import SocketIO, emit
 from dotenv import load_dotenv
 import subprocess  # For Salesforce CLI integration
 
+from audio_transport import client_audio_to_bytes, upstream_b64_to_pcm, client_audio_payload, parse_client_sample_rate
+from session_runtime import SessionRuntime, build_session_runtime
+from session_reaper import client_session_reaper
+from admission import REJECTED, AdmissionController
+from audio_queue import BoundedAudioQueue
+from voice_gate import VoiceActivityGate, VOICE_GATE_ENABLED
+from resampler import PolyphaseResampler
+from text_coalescer import TextCoalescer
+from audio_coalescer import AudioCoalescer, SPEECH_BOUNDARY
+from audio_pacer import OutboundAudioPacer
+from upstream_pool import UpstreamPool
+from conversation_log import ConversationLog
+from prompt_registry import PromptRegistry
+from corpus_index import SEARCH_TOOL, CorpusIndex, passage_tokens, split_corpus
+from fund_facts import LOOKUP_TOOL, FundFacts, fund_passages, parse_fund_record
+from knowledge_reload import KnowledgeReloader, SectionCache
+from trigger_matcher import CONFIRMATION, DAY, MEETING_CONFIRMATION
+from event_dispatcher import EventDispatcher, events_snapshot
+import json_codec
+from json_codec import OPENAI_AUDIO_APPEND
+from session_recorder import recorder
+from message_bus import socketio_queue_options
+from sticky_router import tag_worker_sids
+from realtime_metrics import metrics
+
 # --- Load Environment Variables ---
 load_dotenv()
 
@@ -36,10 +63,17 @@ if not OPENAI_API_KEY:
     # exit()
 
 MODEL_ID = "gpt-4o-realtime-preview" # Standard realtime model
-WEBSOCKET_URL = f"wss://api.openai.com/v1/realtime?model={MODEL_ID}"
+WEBSOCKET_URL = os.environ.get("OPENAI_REALTIME_URL", f"wss://api.openai.com/v1/realtime?model={MODEL_ID}")
 INPUT_API_FORMAT_STRING = "pcm16"
 OUTPUT_API_FORMAT_STRING = "pcm16"
 ASSUMED_OUTPUT_SAMPLE_RATE = 24000
+INPUT_SAMPLE_RATE = 24000 # pcm16 input is 24kHz mono
+OPENAI_POOL_SIZE = int(os.environ.get("OPENAI_POOL_SIZE", "2")) # Pre-configured sessions kept warm (0 disables)
+OPENAI_POOL_MAX_AGE_S = int(os.environ.get("OPENAI_POOL_MAX_AGE_S", "600"))
+SESSION_READY_TIMEOUT_S = 10
+OPENAI_RECONNECT_ATTEMPTS = int(os.environ.get("OPENAI_RECONNECT_ATTEMPTS", "3")) # Per upstream drop (0 ends the call as before)
+OPENAI_RECONNECT_BACKOFF_S = float(os.environ.get("OPENAI_RECONNECT_BACKOFF_S", "0.5"))
+RESUMED_EVENT_TYPE = "session.resumed" # Synthetic event the receive loop gets after a reconnect
 
 # --- AWS SES Configuration (HARDCODED FOR DEMO) ---
 AWS_ACCESS_KEY = "YOUR_AWS_ACCESS_KEY"
@@ -54,16 +88,10 @@ SALESFORCE_ORG_ALIAS = "my-org"  # Salesforce org alias
 SALESFORCE_ENABLED = True  # Enable/disable Salesforce integration
 SALESFORCE_CLI_PATH = r"C:\Users\nbalasubramanian1\softwares\node-v22.14.0-win-x64\sf.cmd"  # Full path to sf CLI
 
-# --- Load ETF Corpus ---
-def load_etf_corpus():
-    try:
-        with open('corpus.txt', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        log.warning("corpus.txt not found, using empty ETF content")
-        return ""
-
-ETF_CORPUS = load_etf_corpus()
+# --- ETF Corpus (loaded, indexed and hot-reloaded by the knowledge snapshot below) ---
+ETF_CORPUS_FILE = os.environ.get("ETF_CORPUS_FILE", "corpus.txt")
+# Retrieval instead of embedding: sessions get a search tool over the indexed corpus, not the corpus text
+ETF_RETRIEVAL_ENABLED = os.environ.get("ETF_RETRIEVAL_ENABLED", "true").lower() == "true"
 
 # --- Meeting Parsing and Email Functions ---
 def parse_meeting_details(conversation_text):
@@ -948,136 +976,161 @@ ADVISOR_CONTEXT = """
 """
 
 # --- Helper to Parse Advisor Context ---
-def parse_advisor_context(context_string):
-    advisors = {}
-    client_blocks = re.split(r'\n## CLIENT \d+: ', context_string.strip())[1:]
-    for i, block in enumerate(client_blocks, 1):
-        lines = block.strip().split('\n')
-        full_name = lines[0].strip()
-        advisors[full_name] = {'id': i}
-        current_section = None
-        section_content = []
-        for line in lines[1:]:
-            section_match = re.match(r'###\s+(.+)', line)
-            if section_match:
-                if current_section and section_content:
-                    advisors[full_name][current_section] = '\n'.join(section_content).strip()
-                current_section = section_match.group(1).strip()
-                section_content = []
-            elif current_section and line.strip() and not line.startswith('- **'):
-                 simple_line_match = re.match(r'-\s*\*\*(.+?):\*\*\s*(.*)', line)
-                 if simple_line_match:
-                     key = simple_line_match.group(1).strip()
-                     value = simple_line_match.group(2).strip()
-                     advisors[full_name][f"{current_section}_{key}"] = value
-                 elif not line.strip().startswith('---'):
-                      section_content.append(line.strip())
-        if current_section and section_content:
-            advisors[full_name][current_section] = '\n'.join(section_content).strip()
-        # Flatten specific keys for easier access
-        if f'CONTACT INFORMATION_Full Name' in advisors[full_name]: advisors[full_name]['Full Name'] = advisors[full_name].pop(f'CONTACT INFORMATION_Full Name')
-        if f'PROFESSIONAL DETAILS_Organization' in advisors[full_name]: advisors[full_name]['Firm Name'] = advisors[full_name].pop(f'PROFESSIONAL DETAILS_Organization')
-        if f'ASSETS & BOOK_CG AUM' in advisors[full_name]: advisors[full_name]['AUM String'] = advisors[full_name].pop(f'ASSETS & BOOK_CG AUM') # Keep original string too
-        if f'SALES & REDEMPTIONS_Sales YTD' in advisors[full_name]: advisors[full_name]['Sales String'] = advisors[full_name].pop(f'SALES & REDEMPTIONS_Sales YTD')
-        if f'SALES & REDEMPTIONS_YTD Redemptions' in advisors[full_name]: advisors[full_name]['Redemptions String'] = advisors[full_name].pop(f'SALES & REDEMPTIONS_YTD Redemptions')
-
-    log.info(f"Parsed data for {len(advisors)} advisors.")
-    return advisors
-
-# --- Global Parsed Advisor Data ---
-PARSED_ADVISOR_DATA = parse_advisor_context(ADVISOR_CONTEXT)
+# Markdown in the ADVISOR_CONTEXT format, re-read when it changes; empty: use the built-in dataset above
+ADVISOR_DATA_FILE = os.environ.get("ADVISOR_DATA_FILE", "")
+
+def split_advisor_blocks(context_string):
+    """The text of each '## CLIENT n:' record, starting with the advisor's full name."""
+    return re.split(r'\n## CLIENT \d+: ', context_string.strip())[1:]
+
+def parse_advisor_block(block, advisor_id):
+    """(full name, parsed fields) for one advisor record."""
+    lines = block.strip().split('\n')
+    full_name = lines[0].strip()
+    advisor = {'id': advisor_id}
+    current_section = None
+    section_content = []
+    for line in lines[1:]:
+        section_match = re.match(r'###\s+(.+)', line)
+        if section_match:
+            if current_section and section_content:
+                advisor[current_section] = '\n'.join(section_content).strip()
+            current_section = section_match.group(1).strip()
+            section_content = []
+        elif current_section and line.strip() and not line.startswith('- **'):
+             simple_line_match = re.match(r'-\s*\*\*(.+?):\*\*\s*(.*)', line)
+             if simple_line_match:
+                 key = simple_line_match.group(1).strip()
+                 value = simple_line_match.group(2).strip()
+                 advisor[f"{current_section}_{key}"] = value
+             elif not line.strip().startswith('---'):
+                  section_content.append(line.strip())
+    if current_section and section_content:
+        advisor[current_section] = '\n'.join(section_content).strip()
+    # Flatten specific keys for easier access
+    if f'CONTACT INFORMATION_Full Name' in advisor: advisor['Full Name'] = advisor.pop(f'CONTACT INFORMATION_Full Name')
+    if f'PROFESSIONAL DETAILS_Organization' in advisor: advisor['Firm Name'] = advisor.pop(f'PROFESSIONAL DETAILS_Organization')
+    if f'ASSETS & BOOK_CG AUM' in advisor: advisor['AUM String'] = advisor.pop(f'ASSETS & BOOK_CG AUM') # Keep original string too
+    if f'SALES & REDEMPTIONS_Sales YTD' in advisor: advisor['Sales String'] = advisor.pop(f'SALES & REDEMPTIONS_Sales YTD')
+    if f'SALES & REDEMPTIONS_YTD Redemptions' in advisor: advisor['Redemptions String'] = advisor.pop(f'SALES & REDEMPTIONS_YTD Redemptions')
+    return full_name, advisor
+
+# --- Per-Advisor Profiles (one advisor's record per call instead of the whole dataset) ---
+def split_advisor_profiles(context_string):
+    """Raw markdown record of each advisor, keyed by the same full name as the parsed advisor data."""
+    return {block.strip().split('\n', 1)[0].strip(): block.strip() for block in split_advisor_blocks(context_string)}
+
+# --- Knowledge Snapshot (ETF corpus + advisor data, rebuilt and swapped whole when their files change) ---
+KnowledgeSnapshot = collections.namedtuple('KnowledgeSnapshot', [
+    'version', 'etf_corpus', 'etf_index', 'etf_facts', 'advisor_context', 'advisor_data', 'advisor_profiles'])
+
+# Per-section work kept across reloads: only passages, funds and advisors whose text changed are re-done
+_passage_tokens = SectionCache(passage_tokens)
+_fund_records = SectionCache(parse_fund_record)
+_advisor_records = SectionCache(lambda numbered: parse_advisor_block(numbered[1], numbered[0]))
+
+def build_knowledge_snapshot(texts, version):
+    """KnowledgeSnapshot for the corpus and advisor texts (texts['corpus'], texts['advisors'])."""
+    corpus, advisor_context = texts['corpus'], texts['advisors']
+    passages = split_corpus(corpus)
+    tokens, passages_rebuilt = _passage_tokens.map(((p.title, p.section, p.text), p) for p in passages)
+    records, funds_rebuilt = _fund_records.map(((p.title, p.section, p.text), p) for p in fund_passages(passages))
+    numbered = list(enumerate(split_advisor_blocks(advisor_context), 1))
+    advisors, advisors_rebuilt = _advisor_records.map((block, block) for block in numbered)
+    snapshot = KnowledgeSnapshot(version, corpus, CorpusIndex(passages, tokens), FundFacts(records),
+                                 advisor_context, dict(advisors), split_advisor_profiles(advisor_context))
+    log.info(f"Knowledge v{version}: {len(passages)} passages ({passages_rebuilt} re-indexed), {len(records)} funds "
+             f"({funds_rebuilt} re-parsed), {len(advisors)} advisors ({advisors_rebuilt} re-parsed); "
+             f"retrieval {'enabled' if ETF_RETRIEVAL_ENABLED else 'disabled, corpus embedded in prompt'}.")
+    return snapshot
+
+# Readers take knowledge.current once and use that snapshot throughout
+knowledge = KnowledgeReloader({'corpus': ETF_CORPUS_FILE, 'advisors': ADVISOR_DATA_FILE}, build_knowledge_snapshot,
+                              defaults={'advisors': ADVISOR_CONTEXT})
+
+def resolve_advisor_key(value):
+    """Advisor name for a client-supplied key (full name, last name, nickname or client number), or None."""
+    wanted = str(value or '').strip().lower()
+    if not wanted: return None
+    snapshot = knowledge.current
+    for name, record in snapshot.advisor_data.items():
+        if wanted in (name.lower(), str(record.get('id'))): return name
+    for name, profile in snapshot.advisor_profiles.items():
+        nickname = re.search(r'\*\*Nickname:\*\*\s*(.+)', profile)
+        if wanted == name.split()[-1].lower() or (nickname and wanted == nickname.group(1).strip().lower()):
+            return name
+    return None
+
+def advisor_prompt_context(advisor_key=None, snapshot=None):
+    """Advisor section of the instructions: the advisor on this call, or every record while the advisor is unknown."""
+    snapshot = snapshot or knowledge.current
+    profile = snapshot.advisor_profiles.get(advisor_key) if advisor_key else None
+    if profile is None: return snapshot.advisor_context # Unknown advisor, or removed from the data by a reload
+    return f"# Advisor On This Call\n\n## {profile}"
 
 # --- Flask & SocketIO Setup ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 async_mode = "threading"
 log.info(f"Using {async_mode} async_mode for Flask-SocketIO")
-socketio = SocketIO(app, async_mode=async_mode, cors_allowed_origins="*")
+# SOCKETIO_MESSAGE_QUEUE selects the cross-worker bus when running behind sticky_router.py
+socketio = SocketIO(app, async_mode=async_mode, cors_allowed_origins="*", **socketio_queue_options())
+WORKER_INDEX = os.environ.get("WORKER_INDEX")
+if WORKER_INDEX is not None:
+    tag_worker_sids(socketio.server, WORKER_INDEX) # Lets the sticky router route this worker's sessions back to it
+PORT = int(os.environ.get("PORT", "5050"))
+
+# --- Client State ---
+clients = {} # Structure: clients[sid] = {'client_connected': bool, 'binary_audio': bool, 'input_sample_rate': int}
+
+def client_input_rate(sid):
+    """Capture sample rate reported by the client's page (defaults to the provider rate)."""
+    return clients.get(sid, {}).get('input_sample_rate', INPUT_SAMPLE_RATE)
+
+
+# --- OpenAI Session Setup ---
+OPENAI_HEADERS = { "Authorization": f"Bearer {OPENAI_API_KEY}", "OpenAI-Beta": "realtime=v1" }
+
+
+# --- Realtime Function Tools ---
+# name -> handler(decoded arguments) returning the function_call_output string
+SESSION_TOOLS = {
+    SEARCH_TOOL['name']: lambda arguments: knowledge.current.etf_index.tool_result(arguments),
+    LOOKUP_TOOL['name']: lambda arguments: knowledge.current.etf_facts.tool_result(arguments),
+}
+SESSION_TOOL_DEFINITIONS = [LOOKUP_TOOL, SEARCH_TOOL]
 
-# --- Dedicated Asyncio Loop Setup ---
-task_queue = Queue()
-asyncio_loop = None
-asyncio_thread = None
-clients = {} # Structure: clients[sid] = {'client_connected': bool}
 
-def run_asyncio_loop(loop):
-    log.info("Asyncio thread started.")
-    asyncio.set_event_loop(loop)
+def etf_knowledge_prompt(snapshot):
+    """Knowledge base section of the instructions: a pointer to the search tool (or the whole corpus with retrieval off)."""
+    if not ETF_RETRIEVAL_ENABLED:
+        return snapshot.etf_corpus
+    return (f"Fund facts (objectives, expense ratios, yields, returns, inception dates, positioning FAQs) are not listed here. "
+            f"Before quoting any fund fact or number, call {LOOKUP_TOOL['name']} with the fund's ticker or name for that "
+            f"fund's figures, or {SEARCH_TOOL['name']} with the advisor's question for anything broader, and answer only "
+            f"from what the tool returns.")
+
+
+def run_session_tool(sid, name, arguments, session_metrics):
+    """Run one function call from the model and return its output (errors are returned to the model as JSON)."""
+    started = time.perf_counter()
+    handler = SESSION_TOOLS.get(name)
     try:
-        loop.run_until_complete(process_tasks_from_queue())
+        if handler is None:
+            raise ValueError(f"unknown tool '{name}'")
+        output = handler(json.loads(arguments or "{}"))
     except Exception as e:
-        log.error(f"Exception in asyncio loop's main task: {e}")
-        log.error(traceback.format_exc())
-    finally:
-        log.info("Asyncio loop stopping...");
-        try:
-            tasks = asyncio.all_tasks(loop=loop)
-            for task in tasks:
-                if not task.done(): task.cancel()
-            if tasks: loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
-            loop.run_until_complete(loop.shutdown_asyncgens())
-        except Exception as e: log.error(f"Error during asyncio loop cleanup: {e}")
-        finally: loop.close(); log.info("Asyncio loop closed.")
-
-def start_asyncio_thread():
-    global asyncio_loop, asyncio_thread
-    if asyncio_thread is None or not asyncio_thread.is_alive():
-        asyncio_loop = asyncio.new_event_loop()
-        asyncio_thread = threading.Thread(target=run_asyncio_loop, args=(asyncio_loop,), name="AsyncioThread", daemon=True)
-        asyncio_thread.start()
-        log.info("Dedicated asyncio thread started.")
-
-# --- Background Task Runner (Runs in Asyncio Thread) ---
-async def process_tasks_from_queue():
-    log.info("Asyncio task processor started.")
-    openai_sessions = {} # Structure: openai_sessions[sid] = {'task': Future, 'input_queue': asyncio.Queue}
-
-    while True:
-        try:
-            item = await asyncio_loop.run_in_executor(None, task_queue.get)
-            if item is None: log.info("Task processor stop signal. Shutting down..."); break
-            action = item.get('action'); sid = item.get('sid')
-            if not sid: log.warning("Task without SID."); task_queue.task_done(); continue
-
-            if action == 'start':
-                if clients.get(sid, {}).get('client_connected') and (sid not in openai_sessions or openai_sessions[sid]['task'].done()):
-                    log.info(f"[{sid}] 'start', launching OpenAI task.")
-                    client_async_input_queue = asyncio.Queue()
-                    task_future = asyncio.create_task(openai_session_task(sid, client_async_input_queue))
-                    openai_sessions[sid] = {'task': task_future, 'input_queue': client_async_input_queue}
-                elif sid in openai_sessions and not openai_sessions[sid]['task'].done(): log.warning(f"[{sid}] 'start' received, task active.")
-                else: log.warning(f"[{sid}] 'start', client '{sid}' not connected.")
-            elif action == 'stop':
-                 if sid in openai_sessions:
-                     log.info(f"[{sid}] 'stop', signalling task.")
-                     session_data = openai_sessions[sid]
-                     session_data['input_queue'].put_nowait(None)
-                     del openai_sessions[sid]
-                 else: log.warning(f"[{sid}] 'stop' received, no active session.")
-            elif action == 'audio':
-                 if sid in openai_sessions:
-                     session_data = openai_sessions[sid]
-                     if not session_data['task'].done():
-                         audio_data = item.get('data')
-                         if audio_data: session_data['input_queue'].put_nowait(audio_data)
-            task_queue.task_done()
-        except Exception as e: log.error(f"Error in task processor: {e}\n{traceback.format_exc()}")
-    log.info("Asyncio task processor finished. Cleaning up sessions...");
-    for sid, session_data in list(openai_sessions.items()):
-         log.warning(f"[{sid}] Cancelling remaining session task on processor exit.")
-         session_data['task'].cancel()
-         del openai_sessions[sid]
-    log.info("Processor cleanup complete.")
+        log.error(f"[{sid}] Tool call {name} failed: {e}")
+        output = json.dumps({"error": str(e)})
+    tool_ms = (time.perf_counter() - started) * 1000.0
+    session_metrics.observe("openai.tool_ms", tool_ms)
+    log.info(f"[{sid}] Tool call {name}({arguments}) -> {len(output)} chars in {tool_ms:.2f} ms")
+    return output
 
 
-# --- OpenAI Task (runs in asyncio loop) ---
-async def openai_session_task(sid, client_async_input_queue):
-    log.info(f"[{sid}] OpenAI task {id(asyncio.current_task())} started.")
-    openai_ws = None
-    output_sample_rate = ASSUMED_OUTPUT_SAMPLE_RATE
-    is_connected_to_openai = False
-    loaded_advisor_name = None # <<< Track loaded advisor
-
+def build_openai_session_config(advisor_key=None):
+    """session.update event for a new OpenAI realtime session (built once per advisor by session_prompts, not per call)."""
+    snapshot = knowledge.current # One snapshot for the whole prompt, even if a reload lands mid-build
     session_instructions = f"""
 You are Sarah, a sales specialist at American Funds calling Nat about ETF products.
 
@@ -1164,7 +1217,7 @@ If the caller corrects any detail, **acknowledge the correction** in a straightf
 1. "What are your clients most concerned about in today's market environment?"
 2. "Are you currently using ETFs in your client portfolios? Which ones are working well for you?"
 3. "What gaps do you see in your current ETF lineup—maybe income, growth, or international exposure?"
-   *Share relevant performance when appropriate: "That's interesting, our CGUS has been performing really well - 29.43% over the past year. I can share the numbers, but our wholesaler can walk through how that might fit specific client scenarios."*
+   *Share relevant performance when appropriate: "That's interesting, our CGUS has been performing really well - {snapshot.etf_facts.return_pct('CGUS', default='double digits')} over the past year. I can share the numbers, but our wholesaler can walk through how that might fit specific client scenarios."*
 4. "How important is active management versus passive indexing for your client base?"
 5. "Are your clients asking for more tax-efficient investment options?"
 6. "What's driving the most interest from your clients this quarter—income generation, growth, or capital preservation?"
@@ -1200,13 +1253,13 @@ If the caller corrects any detail, **acknowledge the correction** in a straightf
 "Great—you're covered. Many teams still compare approaches on [topic] once a year. Open to a **short benchmarking chat** with our wholesaler?"
 
 **Performance/specific product questions.**
-"Absolutely! I can share the performance numbers with you. For example, our CGUS returned 29.43% over the past year, and CGGR has done 27.33%. I can give you all the stats, but for diving into how these might specifically fit your client situations and portfolio construction, our wholesaler would be perfect for that conversation."
+"Absolutely! I can share the performance numbers with you. For example, our CGUS returned {snapshot.etf_facts.return_pct('CGUS', default='double digits')} over the past year, and CGGR has done {snapshot.etf_facts.return_pct('CGGR', default='well too')}. I can give you all the stats, but for diving into how these might specifically fit your client situations and portfolio construction, our wholesaler would be perfect for that conversation."
 
 **Advisor Profiles Available:**
-{ADVISOR_CONTEXT}
+{advisor_prompt_context(advisor_key, snapshot)}
 
 **ETF Knowledge Base:**
-{ETF_CORPUS}
+{etf_knowledge_prompt(snapshot)}
 
 **CRITICAL START PROTOCOL:**
 1. FIRST MESSAGE: Copy this EXACTLY: "Hi Nat this is Sarah from American Funds. I'm calling because we noticed you've been looking at ETF products on our webpage, and many advisors like yourself are looking for better ETF solutions. Do you have a few minutes to discuss what you're seeing with your clients right now?"
@@ -1217,243 +1270,523 @@ If the caller corrects any detail, **acknowledge the correction** in a straightf
 
 REMEMBER: You are Sarah calling Nat. NEVER say "Hi there" or "Alex".
     """
-    headers = { "Authorization": f"Bearer {OPENAI_API_KEY}", "OpenAI-Beta": "realtime=v1" }
+    return {
+        "type": "session.update",
+        "session": {
+            "voice": "alloy",
+            "instructions": session_instructions.strip(),
+            "input_audio_format": INPUT_API_FORMAT_STRING,
+            "output_audio_format": OUTPUT_API_FORMAT_STRING,
+            "input_audio_transcription": { "model": "whisper-1" }, # Advisor turns as text, replayed if the session has to be resumed
+            "turn_detection": { "type": "server_vad", "threshold": 0.5, "prefix_padding_ms": 300, "silence_duration_ms": 200, "interrupt_response": True, "create_response": True },
+            **({"tools": SESSION_TOOL_DEFINITIONS, "tool_choice": "auto"} if ETF_RETRIEVAL_ENABLED else {})
+        }
+    }
+
+
+# Conversation item that makes the agent open the call with the scripted greeting
+GREETING_MESSAGE_EVENT = {
+    "type": "conversation.item.create",
+    "item": {
+        "type": "message",
+        "role": "user",
+        "content": [{"type": "input_text", "text": "You are Sarah from American Funds. The person you are calling is named Nat. You must start with these EXACT WORDS without any changes: 'Hi Nat this is Sarah from American Funds. I'm calling because we noticed you've been looking at ETF products on our webpage, and many advisors like yourself are looking for better ETF solutions. Do you have a few minutes to discuss what you're seeing with your clients right now?' Do not say Hi there, do not say Alex, do not change any words. Start now."}]
+    }
+}
+GREETING_MESSAGE_PAYLOAD = json.dumps(GREETING_MESSAGE_EVENT)
+RESPONSE_CREATE_PAYLOAD = json.dumps({"type": "response.create"})
+
+# session.update built and serialized once per advisor key (None: all advisors); sessions send the prebuilt JSON
+session_prompts = PromptRegistry(build_openai_session_config, name="openai.prompts")
+session_prompts.get()
+
+def refresh_session_prompts(snapshot):
+    """New knowledge snapshot: rebuild the prompts for new sessions (running sessions keep theirs)."""
+    session_prompts.invalidate()
+    session_prompts.get()
+
+knowledge.on_swap.append(refresh_session_prompts)
+
+def advisor_instructions_update(advisor_key):
+    """Incremental session.update (instructions only) that narrows a live session to one advisor."""
+    instructions = session_prompts.get(advisor_key).event['session']['instructions']
+    return json.dumps({"type": "session.update", "session": {"instructions": instructions}})
+
+def pooled_instructions_update(ws, advisor_key):
+    """session.update a claimed pool session still needs: the advisor's slice, or the current prompt if it was warmed on an older one."""
+    if advisor_key or getattr(ws, 'prompt_version', None) != session_prompts.version:
+        return advisor_instructions_update(advisor_key)
+    return None
+
+
+async def connect_configured_openai_ws():
+    """Open a realtime websocket and wait until its session.update has been applied (used by the pool)."""
+    async def wait_for_session_updated():
+        while True:
+            event = json.loads(await ws.recv())
+            if event.get("type") == "session.updated":
+                return
+            if event.get("type") == "error":
+                raise RuntimeError(f"OpenAI rejected session.update: {event.get('error', {}).get('message', 'Unknown')}")
+
+    ws = await websockets.connect(WEBSOCKET_URL, extra_headers=OPENAI_HEADERS, ping_interval=5, ping_timeout=20)
+    try:
+        prompt = session_prompts.get()
+        await ws.send(prompt.payload)
+        ws.prompt_version = prompt.version # A knowledge reload while this session sits in the pool makes it stale
+        await asyncio.wait_for(wait_for_session_updated(), SESSION_READY_TIMEOUT_S)
+    except BaseException:
+        await ws.close()
+        raise
+    return ws
+
+
+@contextlib.asynccontextmanager
+async def openai_connection(sid, upstream_pool=None):
+    """Yields (websocket, pooled): a warm session from the shard's pool if one is ready, else a fresh connection."""
+    ws = await upstream_pool.acquire() if upstream_pool is not None else None
+    if ws is not None:
+        log.info(f"[{sid}] Claimed pre-configured OpenAI session from pool.")
+        try:
+            yield ws, True
+        finally:
+            await ws.close()
+        return
+    async with websockets.connect(WEBSOCKET_URL, extra_headers=OPENAI_HEADERS, ping_interval=5, ping_timeout=20) as ws:
+        yield ws, False
+
+
+def emit_to_client(event, data, room):
+    """Socket.IO emit used by session coroutines; worker-process shards swap in a forward to the parent."""
+    socketio.emit(event, data, room=room)
+
+
+# --- OpenAI Task (runs in asyncio loop) ---
+async def openai_session_task(sid, client_async_input_queue, upstream_pool=None, advisor=None, updates=None):
+    log.info(f"[{sid}] OpenAI task {id(asyncio.current_task())} started.")
+    task_started = time.monotonic()
+    openai_ws = None
+    output_sample_rate = ASSUMED_OUTPUT_SAMPLE_RATE
+    is_connected_to_openai = False
+    loaded_advisor_name = advisor # Advisor whose profile the session's instructions carry (None: all advisors)
+    session_metrics = metrics.session(sid)
+    session_events = recorder.session(sid, "openai") # Transcripts, turns and triggers, written off the event loop
+    capture_sample_rate = client_input_rate(sid)
+    input_resampler = PolyphaseResampler(capture_sample_rate, INPUT_SAMPLE_RATE) # Passthrough when the page already captures at 24kHz
 
     def safe_emit(event, data, room):
         if clients.get(sid, {}).get('client_connected', False):
-            try: socketio.emit(event, data, room=room)
+            try: emit_to_client(event, data, room=room)
             except Exception as e: log.warning(f"[{sid}] Error emitting '{event}': {e}")
 
+    def emit_audio_packet(pcm, sample_rate):
+        binary_audio = clients.get(sid, {}).get('binary_audio', False)
+        safe_emit('audio_response', client_audio_payload(pcm, sample_rate, binary_audio), room=sid)
+
+    # Re-frames response.audio.delta into fixed-size, paced 'audio_response' packets
+    output_pacer = OutboundAudioPacer(emit_audio_packet, output_sample_rate, provider="openai", session_metrics=session_metrics)
+    # Merges transcript deltas into fewer 'response_text_update' emits (sentence ends, TRANSCRIPT_COALESCE_MS, response.done)
+    text_updates = TextCoalescer(lambda text: safe_emit('response_text_update', {'text': text, 'is_final': False}, room=sid),
+                                 provider="openai", session_metrics=session_metrics)
+    conversation = ConversationLog() # Spoken turns so far, replayed onto a new socket if the upstream drops
+    upstream_ready = asyncio.Event() # Cleared while reconnecting; the send loop holds audio until it is set
+
     try:
         log.info(f"[{sid}] Connecting to OpenAI WebSocket...")
-        async with websockets.connect(WEBSOCKET_URL, extra_headers=headers, ping_interval=5, ping_timeout=20) as openai_ws:
+        async with openai_connection(sid, upstream_pool) as (openai_ws, pooled):
             log.info(f"[{sid}] Connected to OpenAI WS."); is_connected_to_openai = True
+            session_events.record('session_start', advisor=loaded_advisor_name, pooled=pooled, prompt_version=session_prompts.version)
+            upstream_ready.set()
             safe_emit('status_update', {'message': 'Connected to Voice Mode'}, room=sid)
 
-            config_event = {
-                "type": "session.update",
-                "session": {
-                    "voice": "alloy",
-                    "instructions": session_instructions.strip(),
-                    "input_audio_format": INPUT_API_FORMAT_STRING,
-                    "output_audio_format": OUTPUT_API_FORMAT_STRING,
-                    "turn_detection": { "type": "server_vad", "threshold": 0.5, "prefix_padding_ms": 300, "silence_duration_ms": 200, "interrupt_response": True, "create_response": True }
-                }
-            }
-            log.info(f"[{sid}] Sending config to OpenAI...")
-            log.info(f"[{sid}] FULL INSTRUCTIONS BEING SENT:")
-            log.info(f"[{sid}] {session_instructions}")  # Log COMPLETE instructions
-            await openai_ws.send(json.dumps(config_event))
-            log.info(f"[{sid}] Config sent.")
-            
+            instructions_update = pooled_instructions_update(openai_ws, loaded_advisor_name) if pooled else None
+            if instructions_update:  # Pooled sessions were warmed with the all-advisors prompt of their time
+                await openai_ws.send(instructions_update)
+                log.info(f"[{sid}] Updated pooled session instructions (advisor '{loaded_advisor_name or 'all'}', prompt v{session_prompts.version}).")
+            if not pooled:  # Pooled sessions were configured (and confirmed) while warming up
+                config = session_prompts.get(loaded_advisor_name)
+                log.info(f"[{sid}] Sending config to OpenAI (prompt v{config.version}, sha256 {config.sha256}, {config.size} bytes)...")
+                await openai_ws.send(config.payload)
+                log.info(f"[{sid}] Config sent.")
+                await asyncio.sleep(0.5)  # Small delay to ensure session is ready
+
             # Send a conversation item to trigger the initial greeting
-            await asyncio.sleep(0.5)  # Small delay to ensure session is ready
-            initial_message = {
-                "type": "conversation.item.create",
-                "item": {
-                    "type": "message",
-                    "role": "user",
-                    "content": [{"type": "input_text", "text": "You are Sarah from American Funds. The person you are calling is named Nat. You must start with these EXACT WORDS without any changes: 'Hi Nat this is Sarah from American Funds. I'm calling because we noticed you've been looking at ETF products on our webpage, and many advisors like yourself are looking for better ETF solutions. Do you have a few minutes to discuss what you're seeing with your clients right now?' Do not say Hi there, do not say Alex, do not change any words. Start now."}]
-                }
-            }
-            await openai_ws.send(json.dumps(initial_message))
+            await openai_ws.send(GREETING_MESSAGE_PAYLOAD)
             
             # Trigger response generation
-            response_create = {"type": "response.create"}
-            await openai_ws.send(json.dumps(response_create))
+            await openai_ws.send(RESPONSE_CREATE_PAYLOAD)
             log.info(f"[{sid}] Triggered initial greeting.")
 
+            async def resume_openai_session():
+                """New configured socket with the conversation so far replayed (no greeting), or None."""
+                started = time.monotonic()
+                for attempt in range(1, OPENAI_RECONNECT_ATTEMPTS + 1):
+                    ws = None
+                    try:
+                        ws = await upstream_pool.acquire() if upstream_pool is not None else None
+                        if ws is None: ws = await connect_configured_openai_ws() # Instructions applied and confirmed
+                        instructions_update = pooled_instructions_update(ws, loaded_advisor_name)
+                        if instructions_update: await ws.send(instructions_update)
+                        replay = conversation.replay_events()
+                        for event in replay: await ws.send(json.dumps(event))
+                    except Exception as e:
+                        log.warning(f"[{sid}] OpenAI reconnect attempt {attempt}/{OPENAI_RECONNECT_ATTEMPTS} failed: {e}")
+                        if ws is not None: await ws.close()
+                        await asyncio.sleep(OPENAI_RECONNECT_BACKOFF_S * attempt)
+                        continue
+                    reconnect_ms = (time.monotonic() - started) * 1000.0
+                    session_metrics.incr('openai.reconnects')
+                    session_metrics.observe("openai.reconnect_ms", reconnect_ms)
+                    log.info(f"[{sid}] OpenAI session resumed in {reconnect_ms:.0f} ms ({len(replay)} items replayed, attempt {attempt}).")
+                    session_events.record('resumed', reconnect_ms=round(reconnect_ms), replayed=len(replay), attempt=attempt)
+                    return ws
+                session_metrics.incr('openai.reconnect_failures')
+                return None
+
+            async def upstream_messages():
+                """Messages from the OpenAI socket; when it drops, resumes on a new one and yields RESUMED_EVENT_TYPE."""
+                nonlocal openai_ws
+                while True:
+                    try:
+                        async for message in openai_ws: yield message
+                        log.warning(f"[{sid}] OpenAI WS closed by server.")
+                    except websockets.exceptions.ConnectionClosed as e:
+                        log.warning(f"[{sid}] OpenAI WS dropped: {e.code}")
+                    if not clients.get(sid, {}).get('client_connected', False) or OPENAI_RECONNECT_ATTEMPTS <= 0: return
+                    upstream_ready.clear()
+                    safe_emit('status_update', {'message': 'Reconnecting...'}, room=sid) # The browser call stays up meanwhile
+                    resumed_ws = await resume_openai_session()
+                    await openai_ws.close()
+                    if resumed_ws is None:
+                        log.error(f"[{sid}] Could not resume OpenAI session, ending call.")
+                        safe_emit('error_message', {'message': 'Lost connection to the voice service'}, room=sid)
+                        return
+                    openai_ws = resumed_ws
+                    upstream_ready.set()
+                    yield json.dumps({"type": RESUMED_EVENT_TYPE})
+
+            async def apply_session_updates():
+                """Mid-call changes from SessionRuntime.update_session (e.g. the advisor identified after the greeting)."""
+                nonlocal loaded_advisor_name
+                if updates is None: return
+                while True:
+                    changes = await updates.get()
+                    advisor_key = changes.get('advisor')
+                    if not advisor_key or advisor_key == loaded_advisor_name: continue
+                    loaded_advisor_name = advisor_key # A resume re-applies it if the socket is down right now
+                    await upstream_ready.wait()
+                    try:
+                        await openai_ws.send(advisor_instructions_update(advisor_key))
+                        log.info(f"[{sid}] Session instructions narrowed to advisor '{advisor_key}'.")
+                        session_events.record('advisor', advisor=advisor_key)
+                    except websockets.exceptions.ConnectionClosed:
+                        log.info(f"[{sid}] OpenAI WS dropped before advisor update; the resumed session will carry it.")
+
             async def receive_from_openai():
                 nonlocal output_sample_rate, loaded_advisor_name
                 # Only accumulate assistant response
                 current_assistant_response = ""
+                confirmation_scan = MEETING_CONFIRMATION.scanner() # Trigger state over current_assistant_response, fed per delta
                 current_turn_id = None
                 speech_count_since_advisor_load = 0
                 agenda_triggered = False
+                # Barge-in state: the response being generated and the assistant audio item being played
+                response_active = False
+                audio_item = None  # (item_id, content_index)
+                interrupted_item_id = None
+                barge_in_started = None
+                first_audio_pending = True
+                tool_outputs_pending = False # Function results sent; ask for the spoken answer once the calling response is done
+                # Upstream event type -> handler (counts and handler time per type at /api/metrics under events.openai)
+                dispatcher = EventDispatcher("openai")
+
+                @dispatcher.on("session.created")
+                async def on_session_created(server_event):
+                    log.info(f"[{sid}] OpenAI Session Created...")
+
+                @dispatcher.on("session.updated")
+                async def on_session_updated(server_event):
+                    log.info(f"[{sid}] OpenAI Session Updated.")
+
+                @dispatcher.on(RESUMED_EVENT_TYPE)
+                async def on_resumed(server_event):
+                    nonlocal current_assistant_response, response_active, audio_item, interrupted_item_id, tool_outputs_pending
+                    # New socket: nothing is being generated and the old item ids are no longer ours to truncate
+                    response_active = False
+                    audio_item = None
+                    interrupted_item_id = None
+                    tool_outputs_pending = False # Function calls are not replayed, their outputs would be orphans
+                    current_assistant_response = ""
+                    confirmation_scan.reset()
+                    safe_emit('status_update', {'message': 'Connected to Voice Mode'}, room=sid)
+
+                @dispatcher.on("conversation.item.created")
+                async def on_conversation_item_created(server_event):
+                    conversation.add_item(server_event.get('item', {}))
+
+                @dispatcher.on("conversation.item.input_audio_transcription.completed")
+                async def on_input_transcription_completed(server_event):
+                    conversation.set_text(server_event.get('item_id'), server_event.get('transcript'))
+                    session_events.record('user_transcript', item_id=server_event.get('item_id'), text=server_event.get('transcript'))
+
+                @dispatcher.on("response.created")
+                async def on_response_created(server_event):
+                    nonlocal response_active
+                    response_active = True
+
+                @dispatcher.on("input_audio_buffer.speech_started")
+                async def on_speech_started(server_event):
+                    nonlocal current_assistant_response, audio_item, interrupted_item_id, barge_in_started, tool_outputs_pending
+                    log.debug(f"[{sid}] OpenAI speech start. Emit interrupt.")
+                    barge_in_started = time.monotonic()
+                    tool_outputs_pending = False # The advisor's new turn gets its own response, which sees the tool output
+                    client_async_input_queue.put_nowait(SPEECH_BOUNDARY) # Cut the pending upstream batch here
+                    played_ms, unplayed_ms = output_pacer.barge_in()
+                    text_updates.discard() # The page clears the interrupted reply
+                    safe_emit('interrupt_playback', {}, room=sid)
+                    # Stop generation and cut the assistant item to what the advisor actually heard
+                    if response_active:
+                        await openai_ws.send(json.dumps({"type": "response.cancel"}))
+                    if audio_item and unplayed_ms > 0:
+                        item_id, content_index = audio_item
+                        await openai_ws.send(json.dumps({"type": "conversation.item.truncate", "item_id": item_id,
+                                                         "content_index": content_index, "audio_end_ms": int(played_ms)}))
+                        interrupted_item_id = item_id
+                        session_metrics.incr('barge_in_truncated_ms', int(unplayed_ms))
+                        log.debug(f"[{sid}] Barge-in: truncated {item_id} at {int(played_ms)} ms, dropped {int(unplayed_ms)} ms unplayed.")
+                        session_events.record('barge_in', item_id=item_id, played_ms=int(played_ms), unplayed_ms=int(unplayed_ms))
+                    audio_item = None
+                    session_metrics.incr('barge_ins')
+                    session_metrics.observe("openai.barge_in_handling_ms", (time.monotonic() - barge_in_started) * 1000.0)
+                    # Reset response accumulation for new turn
+                    current_assistant_response = ""
+                    confirmation_scan.reset()
+                    log.debug(f"[{sid}] Reset assistant response for new turn")
+
+                @dispatcher.on("input_audio_buffer.speech_stopped")
+                async def on_speech_stopped(server_event):
+                    log.debug(f"[{sid}] OpenAI speech stop.")
+                    client_async_input_queue.put_nowait(SPEECH_BOUNDARY)
+                    # Sales specialist mode - no auto-agenda creation needed
+                    log.debug(f"[{sid}] Sales call speech interaction")
+
+                @dispatcher.on("response.text.delta")
+                async def on_text_delta(server_event):
+                    nonlocal current_assistant_response
+                    text = server_event.get('delta')
+                    if text:
+                        log.debug(f"[{sid}] response.text.delta: '{text}'")
+                        current_assistant_response += text # Accumulate assistant text
+
+                        # *** IMMEDIATE EMAIL TRIGGER - Check for meeting confirmation as assistant speaks ***
+                        # Only the new delta is scanned; the scanner remembers what earlier deltas matched
+                        confirmation_scan.feed(text)
+                        trigger_found = confirmation_scan.matched(CONFIRMATION)
+                        day_found = confirmation_scan.matched(DAY)
+                        log.debug(f"[{sid}] 🔍 TRIGGER CHECK: trigger_found={trigger_found}, day_found={day_found}")
+
+                        if trigger_found:
+                            if day_found:
+                                # Check if email already sent for this session
+                                if not clients.get(sid, {}).get('email_sent', False):
+                                    log.info(f"[{sid}] IMMEDIATE TRIGGER: Meeting confirmed - sending email NOW!")
+                                    clients[sid]['email_sent'] = True  # Prevent duplicate emails
+
+                                    # Parse meeting details and send email immediately
+                                    meeting_info = parse_meeting_details(current_assistant_response)
+                                    log.info(f"[{sid}] 🟢 Immediate email - parsed meeting info: {meeting_info}")
+                                    log.debug(f"[{sid}] 🟢 Conversation text being parsed: {current_assistant_response}")
+                                    session_events.record('meeting_confirmed', trigger='immediate', meeting=meeting_info, text=current_assistant_response)
+
+                                    # Send email and create Salesforce event in background thread for fastest response
+                                    def send_immediate_confirmation():
+                                        try:
+                                            results = send_meeting_confirmation(meeting_info, current_assistant_response)
+                                            session_events.record('meeting_confirmation_sent', trigger='immediate', **results)
+                                            if results['email_sent']:
+                                                log.info(f"[{sid}] IMMEDIATE EMAIL SENT SUCCESSFULLY!")
+                                            else:
+                                                log.error(f"[{sid}] Failed to send immediate email")
+                                            if results['salesforce_created']:
+                                                log.info(f"[{sid}] SALESFORCE EVENT CREATED SUCCESSFULLY!")
+                                            else:
+                                                log.warning(f"[{sid}] Salesforce event not created")
+                                        except Exception as e:
+                                            log.error(f"[{sid}] Error sending immediate confirmation: {e}")
+
+                                    # Use daemon=False to ensure thread completes even if main session ends
+                                    confirmation_thread = threading.Thread(target=send_immediate_confirmation, daemon=False)
+                                    confirmation_thread.start()
+
+                        text_updates.push(text)
+                    else:
+                        log.debug(f"[{sid}] response.text.delta: Empty text received")
+
+                @dispatcher.on("response.audio_transcript.delta")
+                async def on_audio_transcript_delta(server_event):
+                    nonlocal current_assistant_response
+                    # This is the assistant's speech transcript
+                    text = server_event.get('delta')
+                    if text:
+                        log.debug(f"[{sid}] Assistant speaking: '{text}'")
+                        conversation.append_text(server_event.get('item_id'), text)
+                        current_assistant_response += text
+                        confirmation_scan.feed(text) # Same accumulator the text-delta trigger check covers
+                        text_updates.push(text)
+
+                @dispatcher.on("response.audio.delta")
+                async def on_audio_delta(server_event):
+                    nonlocal audio_item, first_audio_pending
+                    audio_delta = server_event.get('delta')
+                    item_id = server_event.get('item_id')
+                    if item_id is not None and item_id == interrupted_item_id:
+                        session_metrics.incr('barge_in_dropped_deltas')  # Still in flight when we cancelled
+                    elif audio_delta:
+                        if first_audio_pending:
+                            first_audio_pending = False
+                            ttfa_ms = (time.monotonic() - task_started) * 1000.0
+                            session_metrics.observe(f"openai.time_to_first_audio_{'pooled' if pooled else 'cold'}_ms", ttfa_ms)
+                            log.info(f"[{sid}] First audio after {ttfa_ms:.0f} ms ({'pooled' if pooled else 'cold'} session).")
+                            session_events.record('first_audio', ms=round(ttfa_ms), pooled=pooled)
+                        if audio_item is None or audio_item[0] != item_id:
+                            audio_item = (item_id, server_event.get('content_index', 0))
+                            output_pacer.reset_response()
+                        log.debug(f"[{sid}] Buffering audio delta, length: {len(audio_delta)}")
+                        output_pacer.push(upstream_b64_to_pcm(audio_delta))
+                    else:
+                        log.warning(f"[{sid}] Received audio.delta with no data")
+
+                @dispatcher.on("response.function_call_arguments.done")
+                async def on_function_call_done(server_event):
+                    nonlocal tool_outputs_pending
+                    output = run_session_tool(sid, server_event.get('name'), server_event.get('arguments'), session_metrics)
+                    session_events.record('tool_call', name=server_event.get('name'), arguments=server_event.get('arguments'))
+                    await openai_ws.send(json.dumps({"type": "conversation.item.create", "item": {
+                        "type": "function_call_output", "call_id": server_event.get('call_id'), "output": output}}))
+                    tool_outputs_pending = True
+
+                @dispatcher.on("response.done")
+                async def on_response_done(server_event):
+                    nonlocal current_assistant_response, response_active, barge_in_started, tool_outputs_pending
+                    response_active = False
+                    output_pacer.flush()
+                    text_updates.flush() # The rest of the reply's text goes out now, ahead of the is_final emit
+                    if tool_outputs_pending:
+                        tool_outputs_pending = False
+                        await openai_ws.send(RESPONSE_CREATE_PAYLOAD) # Speak the answer from the tool output
+                    if barge_in_started is not None:
+                        # Time from the advisor starting to talk until upstream stopped generating
+                        session_metrics.observe("openai.barge_in_yield_ms", (time.monotonic() - barge_in_started) * 1000.0)
+                        barge_in_started = None
+                    log.debug(f"[{sid}] Response Done. Assistant Acc: '{current_assistant_response}'")
+                    log.debug(f"[{sid}] Full response.done event: {server_event}")
+
+                    # --- Try to get final USER transcript for THIS turn directly from event data --- 
+                    turn_user_transcript = server_event.get('transcript') or server_event.get('input_transcript')
+                    if turn_user_transcript:
+                        log.debug(f"[{sid}] Found user transcript in response.done: '{turn_user_transcript}'")
+                    else:
+                        log.debug(f"[{sid}] Could not find user transcript in response.done event.")
+                        turn_user_transcript = "" # Ensure string
+
+                    # --- Sales Call Flow --- 
+                    # Get user transcript for logging and analysis
+                    turn_user_transcript = server_event.get('transcript') or server_event.get('input_transcript')
+                    if turn_user_transcript:
+                        log.debug(f"[{sid}] User said: '{turn_user_transcript}'")
+                        safe_emit('transcript_update', {'text': turn_user_transcript, 'is_final': True}, room=sid)
+                    else:
+                        log.debug(f"[{sid}] No user transcript found in response.done")
+
+                    # Check if user wants follow-up materials or meeting
+                    follow_up_keywords = ["send", "email", "materials", "meeting", "follow up", "call back", "schedule"]
+                    if turn_user_transcript and any(keyword in turn_user_transcript.lower() for keyword in follow_up_keywords):
+                        log.debug(f"[{sid}] User expressed interest in follow-up")
+
+                    # Check if meeting was confirmed by user OR assistant and send email immediately
+                    user_confirmed_keywords = ["yes", "sure", "sounds good", "perfect", "great", "okay", "ok", "works", "fine", "good"]
+                    assistant_confirmed_keywords = ["perfect", "great", "we're set", "confirmed", "scheduled"]
+
+                    log.debug(f"[{sid}] 🔍 SECONDARY TRIGGER CHECK:")
+                    log.debug(f"[{sid}] 🔍 User transcript: '{turn_user_transcript}'")
+                    log.debug(f"[{sid}] 🔍 Assistant response: '{current_assistant_response}'")
+
+                    user_confirmed_meeting = turn_user_transcript and any(keyword in turn_user_transcript.lower() for keyword in user_confirmed_keywords)
+                    assistant_confirmed_meeting = any(keyword in current_assistant_response.lower() for keyword in assistant_confirmed_keywords)
+                    meeting_has_day = any(day in (current_assistant_response + " " + (turn_user_transcript or "")).lower() for day in ["monday", "tuesday", "wednesday", "thursday", "friday"])
+
+                    log.debug(f"[{sid}] 🔍 SECONDARY CHECK: user_confirmed={user_confirmed_meeting}, assistant_confirmed={assistant_confirmed_meeting}, has_day={meeting_has_day}")
+
+                    if (user_confirmed_meeting or assistant_confirmed_meeting) and meeting_has_day:
+                        log.info(f"[{sid}] Meeting appears to be confirmed - parsing details and sending calendar invite")
+
+                        # Check if email already sent for this session to prevent duplicates
+                        if not clients.get(sid, {}).get('email_sent', False):
+                            log.debug(f"[{sid}] No email sent yet - proceeding with confirmation")
+                            clients[sid]['email_sent'] = True  # Prevent duplicate emails
+
+                            # Parse meeting details from the conversation
+                            full_conversation = current_assistant_response + " " + (turn_user_transcript or "")
+                            meeting_info = parse_meeting_details(full_conversation)
+
+                            log.info(f"[{sid}] Parsed meeting info: {meeting_info}")
+                            session_events.record('meeting_confirmed', trigger='secondary', meeting=meeting_info, text=full_conversation)
+
+                            # Send follow-up email and create Salesforce event immediately
+                            def send_confirmation_async():
+                                try:
+                                    # Send email and create Salesforce event
+                                    results = send_meeting_confirmation(meeting_info, full_conversation)
+                                    session_events.record('meeting_confirmation_sent', trigger='secondary', **results)
+                                    if results['email_sent']:
+                                        log.info(f"[{sid}] Follow-up email sent successfully")
+                                    else:
+                                        log.error(f"[{sid}] Failed to send follow-up email")
+                                    if results['salesforce_created']:
+                                        log.info(f"[{sid}] Salesforce event created successfully")
+                                    else:
+                                        log.warning(f"[{sid}] Salesforce event not created")
+
+                                except Exception as e:
+                                    log.error(f"[{sid}] Error sending confirmation: {e}")
+
+                            # Send email and create Salesforce event in background thread for faster response
+                            # Use daemon=False to ensure thread completes even if main session ends
+                            confirmation_thread = threading.Thread(target=send_confirmation_async, daemon=False)
+                            confirmation_thread.start()
+                        else:
+                            log.info(f"[{sid}] Email already sent for this session - skipping duplicate")
+
+                    session_events.record('assistant_turn', text=current_assistant_response, user_transcript=turn_user_transcript,
+                                          status=server_event.get('response', {}).get('status'))
+
+                    # Signal end of ASSISTANT text stream for this turn
+                    safe_emit('response_text_update', {'text': '', 'is_final': True}, room=sid)
+
+                    # --- Reset assistant accumulator for next turn --- 
+                    current_assistant_response = ""
+                    confirmation_scan.reset()
+
+                @dispatcher.on("error")
+                async def on_error(server_event):
+                    if server_event.get('error', {}).get('code') == "response_cancel_not_active":
+                        log.debug(f"[{sid}] Barge-in cancel raced the server's own cancel: {server_event}")
+                        return
+                    log.error(f"[{sid}] OpenAI Error Event: {server_event}")
+                    err_msg = f"OpenAI Error: {server_event.get('error',{}).get('message', 'Unknown')}"
+                    safe_emit('error_message', {'message': err_msg}, room=sid)
+
+                async def on_other_event(server_event):
+                    if "error" in str(server_event.get("type")): await on_error(server_event) # e.g. *.failed variants carrying an error
+                    else: log.debug(f"[{sid}] Event: {server_event.get('type')}")
+
+                dispatcher.fallback = on_other_event
+
                 try:
-                    async for message in openai_ws:
+                    async for message in upstream_messages():
                         if not clients.get(sid, {}).get('client_connected', False): break
                         try:
-                            server_event = json.loads(message); event_type = server_event.get("type")
-                            # Log all events to debug what we're receiving
-                            if event_type in ["response.text.delta", "response.done", "response.created"]:
-                                log.info(f"[{sid}] Event: {event_type}")
-                            else:
-                                log.debug(f"[{sid}] Event: {event_type}")
-
-                            if event_type == "session.created": log.info(f"[{sid}] OpenAI Session Created...")
-                            elif event_type == "session.updated": log.info(f"[{sid}] OpenAI Session Updated.")
-                            elif event_type == "input_audio_buffer.speech_started": 
-                                log.info(f"[{sid}] OpenAI speech start. Emit interrupt.")
-                                safe_emit('interrupt_playback', {}, room=sid)
-                                # Reset response accumulation for new turn
-                                current_assistant_response = ""
-                                log.info(f"[{sid}] Reset assistant response for new turn")
-                            elif event_type == "input_audio_buffer.speech_stopped": 
-                                log.info(f"[{sid}] OpenAI speech stop.")
-                                # Sales specialist mode - no auto-agenda creation needed
-                                log.info(f"[{sid}] Sales call speech interaction")
-                            elif event_type == "response.text.delta":
-                                text = server_event.get('delta')
-                                log.info(f"[{sid}] response.text.delta event received. Text: '{text}' (length: {len(text) if text else 0})")
-                                if text:
-                                    # <<< IMPROVED LOGGING FOR ACCUMULATION >>>
-                                    log.info(f"[{sid}] response.text.delta: Received text chunk: '{text}'")
-                                    current_assistant_response += text # Accumulate assistant text
-                                    log.info(f"[{sid}] response.text.delta: Total accumulated so far: '{current_assistant_response}'")
-                                    # <<< END LOGGING >>>
-                                    
-                                    # *** IMMEDIATE EMAIL TRIGGER - Check for meeting confirmation as assistant speaks ***
-                                    confirmation_triggers = ["perfect", "great", "we're set", "confirmed", "scheduled for"]
-                                    meeting_days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
-                                    
-                                    log.info(f"[{sid}] 🔍 CHECKING TRIGGERS: current_response='{current_assistant_response.lower()}'")
-                                    trigger_found = any(trigger in current_assistant_response.lower() for trigger in confirmation_triggers)
-                                    day_found = any(day in current_assistant_response.lower() for day in meeting_days)
-                                    log.info(f"[{sid}] 🔍 TRIGGER CHECK: trigger_found={trigger_found}, day_found={day_found}")
-                                    
-                                    if trigger_found:
-                                        if day_found:
-                                            # Check if email already sent for this session
-                                            if not clients.get(sid, {}).get('email_sent', False):
-                                                log.info(f"[{sid}] IMMEDIATE TRIGGER: Meeting confirmed - sending email NOW!")
-                                                clients[sid]['email_sent'] = True  # Prevent duplicate emails
-                                                
-                                                # Parse meeting details and send email immediately
-                                                meeting_info = parse_meeting_details(current_assistant_response)
-                                                log.info(f"[{sid}] 🟢 Immediate email - parsed meeting info: {meeting_info}")
-                                                log.info(f"[{sid}] 🟢 Conversation text being parsed: {current_assistant_response}")
-                                                
-                                                # Send email and create Salesforce event in background thread for fastest response
-                                                def send_immediate_confirmation():
-                                                    try:
-                                                        results = send_meeting_confirmation(meeting_info, current_assistant_response)
-                                                        if results['email_sent']:
-                                                            log.info(f"[{sid}] IMMEDIATE EMAIL SENT SUCCESSFULLY!")
-                                                        else:
-                                                            log.error(f"[{sid}] Failed to send immediate email")
-                                                        if results['salesforce_created']:
-                                                            log.info(f"[{sid}] SALESFORCE EVENT CREATED SUCCESSFULLY!")
-                                                        else:
-                                                            log.warning(f"[{sid}] Salesforce event not created")
-                                                    except Exception as e:
-                                                        log.error(f"[{sid}] Error sending immediate confirmation: {e}")
-                                                
-                                                import threading
-                                                # Use daemon=False to ensure thread completes even if main session ends
-                                                confirmation_thread = threading.Thread(target=send_immediate_confirmation, daemon=False)
-                                                confirmation_thread.start()
-                                    
-                                    safe_emit('response_text_update', {'text': text, 'is_final': False}, room=sid)
-                                else:
-                                    log.info(f"[{sid}] response.text.delta: Empty text received")
-
-                                    # Sales specialist mode - no need for advisor detection
-                                    # Just log the conversation for analytics
-                                    log.info(f"[{sid}] Sales conversation in progress")
-                            elif event_type == "response.audio_transcript.delta":
-                                # This is the assistant's speech transcript
-                                text = server_event.get('delta')
-                                if text:
-                                    log.info(f"[{sid}] Assistant speaking: '{text}'")
-                                    current_assistant_response += text
-                                    safe_emit('response_text_update', {'text': text, 'is_final': False}, room=sid)
-                            elif event_type == "response.audio.delta":
-                                audio_delta = server_event.get('delta')
-                                if audio_delta:
-                                    log.info(f"[{sid}] Sending audio chunk, length: {len(audio_delta)}")
-                                    safe_emit('audio_response', {'audio': audio_delta, 'sample_rate': output_sample_rate}, room=sid)
-                                else:
-                                    log.warning(f"[{sid}] Received audio.delta with no data")
-                            elif event_type == "response.done":
-                                log.info(f"[{sid}] Response Done. Assistant Acc: '{current_assistant_response}'")
-                                log.debug(f"[{sid}] Full response.done event: {server_event}")
-
-                                # --- Try to get final USER transcript for THIS turn directly from event data --- 
-                                turn_user_transcript = server_event.get('transcript') or server_event.get('input_transcript')
-                                if turn_user_transcript:
-                                    log.info(f"[{sid}] Found user transcript in response.done: '{turn_user_transcript}'")
-                                else:
-                                    log.warning(f"[{sid}] Could not find user transcript in response.done event.")
-                                    turn_user_transcript = "" # Ensure string
-
-                                # --- Sales Call Flow --- 
-                                # Get user transcript for logging and analysis
-                                turn_user_transcript = server_event.get('transcript') or server_event.get('input_transcript')
-                                if turn_user_transcript:
-                                    log.info(f"[{sid}] User said: '{turn_user_transcript}'")
-                                    safe_emit('transcript_update', {'text': turn_user_transcript, 'is_final': True}, room=sid)
-                                else:
-                                    log.info(f"[{sid}] No user transcript found in response.done")
-                                
-                                # Check if user wants follow-up materials or meeting
-                                follow_up_keywords = ["send", "email", "materials", "meeting", "follow up", "call back", "schedule"]
-                                if turn_user_transcript and any(keyword in turn_user_transcript.lower() for keyword in follow_up_keywords):
-                                    log.info(f"[{sid}] User expressed interest in follow-up")
-                                
-                                # Check if meeting was confirmed by user OR assistant and send email immediately
-                                user_confirmed_keywords = ["yes", "sure", "sounds good", "perfect", "great", "okay", "ok", "works", "fine", "good"]
-                                assistant_confirmed_keywords = ["perfect", "great", "we're set", "confirmed", "scheduled"]
-                                
-                                log.info(f"[{sid}] 🔍 SECONDARY TRIGGER CHECK:")
-                                log.info(f"[{sid}] 🔍 User transcript: '{turn_user_transcript}'")
-                                log.info(f"[{sid}] 🔍 Assistant response: '{current_assistant_response}'")
-                                
-                                user_confirmed_meeting = turn_user_transcript and any(keyword in turn_user_transcript.lower() for keyword in user_confirmed_keywords)
-                                assistant_confirmed_meeting = any(keyword in current_assistant_response.lower() for keyword in assistant_confirmed_keywords)
-                                meeting_has_day = any(day in (current_assistant_response + " " + (turn_user_transcript or "")).lower() for day in ["monday", "tuesday", "wednesday", "thursday", "friday"])
-                                
-                                log.info(f"[{sid}] 🔍 SECONDARY CHECK: user_confirmed={user_confirmed_meeting}, assistant_confirmed={assistant_confirmed_meeting}, has_day={meeting_has_day}")
-                                
-                                if (user_confirmed_meeting or assistant_confirmed_meeting) and meeting_has_day:
-                                    log.info(f"[{sid}] Meeting appears to be confirmed - parsing details and sending calendar invite")
-                                    
-                                    # Check if email already sent for this session to prevent duplicates
-                                    if not clients.get(sid, {}).get('email_sent', False):
-                                        log.info(f"[{sid}] No email sent yet - proceeding with confirmation")
-                                        clients[sid]['email_sent'] = True  # Prevent duplicate emails
-                                        
-                                        # Parse meeting details from the conversation
-                                        full_conversation = current_assistant_response + " " + (turn_user_transcript or "")
-                                        meeting_info = parse_meeting_details(full_conversation)
-                                        
-                                        log.info(f"[{sid}] Parsed meeting info: {meeting_info}")
-                                        
-                                        # Send follow-up email and create Salesforce event immediately
-                                        def send_confirmation_async():
-                                            try:
-                                                # Send email and create Salesforce event
-                                                results = send_meeting_confirmation(meeting_info, full_conversation)
-                                                if results['email_sent']:
-                                                    log.info(f"[{sid}] Follow-up email sent successfully")
-                                                else:
-                                                    log.error(f"[{sid}] Failed to send follow-up email")
-                                                if results['salesforce_created']:
-                                                    log.info(f"[{sid}] Salesforce event created successfully")
-                                                else:
-                                                    log.warning(f"[{sid}] Salesforce event not created")
-                                                    
-                                            except Exception as e:
-                                                log.error(f"[{sid}] Error sending confirmation: {e}")
-                                        
-                                        # Send email and create Salesforce event in background thread for faster response
-                                        import threading
-                                        # Use daemon=False to ensure thread completes even if main session ends
-                                        confirmation_thread = threading.Thread(target=send_confirmation_async, daemon=False)
-                                        confirmation_thread.start()
-                                    else:
-                                        log.info(f"[{sid}] Email already sent for this session - skipping duplicate")
-                                
-                                # Signal end of ASSISTANT text stream for this turn
-                                safe_emit('response_text_update', {'text': '', 'is_final': True}, room=sid)
-
-                                # --- Reset assistant accumulator for next turn --- 
-                                current_assistant_response = ""
-
-                            elif event_type == "error" or "error" in event_type:
-                                log.error(f"[{sid}] OpenAI Error Event: {server_event}")
-                                err_msg = f"OpenAI Error: {server_event.get('error',{}).get('message', 'Unknown')}"
-                                safe_emit('error_message', {'message': err_msg}, room=sid)
+                            await dispatcher.dispatch(json_codec.loads(message))
                         except json.JSONDecodeError:
                             log.warning(f"[{sid}] OpenAI non-JSON: {message[:200]}")
                         except Exception as e:
@@ -1469,25 +1802,30 @@ REMEMBER: You are Sarah calling Nat. NEVER say "Hi there" or "Alex".
                     log.info(f"[{sid}] OpenAI receive loop finished.")
 
             async def send_to_openai():
+                # Merge queued backlog into one append per batch (never waits for more audio)
+                coalescer = AudioCoalescer(client_async_input_queue, capture_sample_rate, provider="openai", session_metrics=session_metrics)
                 try:
                     while True:
                         if not clients.get(sid, {}).get('client_connected', False): break
-                        base64_audio = await client_async_input_queue.get()
-                        if base64_audio is None: client_async_input_queue.task_done(); break
+                        pcm_audio, frames = await coalescer.next_batch()
+                        if pcm_audio is None: break
                         try:
+                            if not upstream_ready.is_set(): await upstream_ready.wait() # Reconnecting: hold this batch for the resumed session
                             if not is_connected_to_openai: log.warning(f"[{sid}] OpenAI WS disconnected, cannot send."); break
-                            event = { "type": "input_audio_buffer.append", "audio": base64_audio }
-                            if openai_ws and openai_ws.open: await openai_ws.send(json.dumps(event))
-                            else: log.warning(f"[{sid}] OpenAI WS closed state? Cannot send."); break
+                            # Resample to 24kHz, then base64 straight into the append frame template; the queue carries raw PCM16 bytes
+                            await openai_ws.send(OPENAI_AUDIO_APPEND.encode(input_resampler.process(pcm_audio)))
+                        except websockets.exceptions.ConnectionClosed: log.info(f"[{sid}] OpenAI WS dropped while sending; batch discarded, receive loop resumes the session.")
                         except Exception as send_err: log.error(f"[{sid}] Error sending to OpenAI: {send_err}"); break
-                        finally: client_async_input_queue.task_done()
                 except asyncio.CancelledError: log.info(f"[{sid}] OpenAI send task cancelled.")
                 except Exception as e: log.error(f"[{sid}] Error in OpenAI send loop: {e}\n{traceback.format_exc()}")
                 finally: log.info(f"[{sid}] OpenAI send loop finished.")
 
             recv_task = asyncio.create_task(receive_from_openai())
             send_task = asyncio.create_task(send_to_openai())
+            pacer_task = asyncio.create_task(output_pacer.run())
+            updates_task = asyncio.create_task(apply_session_updates())
             done, pending = await asyncio.wait([recv_task, send_task], return_when=asyncio.FIRST_COMPLETED)
+            pending.update((pacer_task, updates_task))
             for task in pending: task.cancel()
             if pending: await asyncio.gather(*pending, return_exceptions=True)
 
@@ -1495,11 +1833,64 @@ REMEMBER: You are Sarah calling Nat. NEVER say "Hi there" or "Alex".
     except Exception as e: log.error(f"[{sid}] Unexpected error in OpenAI task: {e}\n{traceback.format_exc()}"); safe_emit('error_message', {'message': 'Server error connecting to OpenAI'}, room=sid)
     finally:
         log.info(f"[{sid}] OpenAI session task {id(asyncio.current_task())} finishing.")
+        session_events.record('session_end', duration_s=round(time.monotonic() - task_started, 1))
         is_connected_to_openai = False
         if openai_ws and openai_ws.open:
              await openai_ws.close()
              log.info(f"[{sid}] Closed OpenAI WS.")
         if sid in clients: clients[sid]['client_connected'] = False
+        metrics.drop_session(sid)
+
+
+# --- Session Runtime (sharded asyncio loop threads or worker processes) ---
+# Socket.IO handlers hand start/stop to the owning shard's control channel and
+# audio straight to the session's asyncio.Queue (call_soon_threadsafe). Shard
+# count and mode come from SESSION_RUNTIME_SHARDS / SESSION_RUNTIME_MODE.
+def make_session_shard(index, forward_emit=None, runtime_class=SessionRuntime):
+    global emit_to_client
+    if forward_emit is not None:
+        emit_to_client = forward_emit # Worker process: emits go back to the parent's Socket.IO server
+        knowledge.start() # The parent's watcher thread does not survive the fork; each worker reloads its own prompts
+        recorder.start("openai", shard=index) # Likewise the writer thread; one file per worker process
+    # Each shard keeps its own warm sessions; a websocket belongs to the loop that opened it
+    upstream_pool = UpstreamPool(connect_configured_openai_ws, OPENAI_API_KEY and OPENAI_POOL_SIZE or 0, OPENAI_POOL_MAX_AGE_S, name="openai")
+    return runtime_class(
+        lambda sid, input_queue, **options: openai_session_task(sid, input_queue, upstream_pool, **options),
+        is_client_connected=lambda sid: clients.get(sid, {}).get('client_connected', False),
+        name=f"AsyncioThread-{index}",
+        background_tasks=[upstream_pool.run], # Keeps OPENAI_POOL_SIZE configured sessions warm on the shard's loop
+        # Bounded by buffered duration; policy via INPUT_QUEUE_POLICY (block | drop_oldest | drop_to_latest)
+        queue_factory=lambda sid: BoundedAudioQueue(
+            client_input_rate(sid), session_metrics=metrics.session(sid),
+            gate=VoiceActivityGate(client_input_rate(sid), session_metrics=metrics.session(sid)) if VOICE_GATE_ENABLED else None),
+    )
+
+
+def apply_worker_client_state(sid, state):
+    """Mirror a client's state into a worker process (None once the session is stopped)."""
+    if state is None: clients.pop(sid, None)
+    else: clients[sid] = state
+
+
+def notify_queue_position(sid, data):
+    emit_to_client('queue_position', data, room=sid)
+
+
+# Caps concurrent sessions (MAX_CONCURRENT_SESSIONS / OPENAI_MAX_SESSIONS); the rest wait in a FIFO queue
+admission = AdmissionController(
+    lambda sid, provider: session_runtime.start_session(sid, advisor=clients.get(sid, {}).get('advisor')), notify_queue_position)
+
+session_runtime = build_session_runtime(
+    make_session_shard,
+    on_emit=lambda event, data, room: socketio.emit(event, data, room=room),
+    client_state=lambda sid: dict(clients.get(sid, {})),
+    apply_client_state=apply_worker_client_state,
+    on_session_done=admission.session_done, # Frees the admission slot once the session task has ended
+    name="AsyncioThread",
+)
+
+# Releases clients and sessions that outlive SESSION_IDLE_TIMEOUT_S / SESSION_MAX_LIFETIME_S without a clean disconnect
+session_reaper = client_session_reaper(clients, session_runtime, lambda sid: socketio.server.disconnect(sid), name="openai.sessions")
 
 
 # --- Flask Routes & SocketIO Handlers ---
@@ -1547,7 +1938,12 @@ def test_salesforce():
 
 @app.route('/api/advisor-data')
 def get_advisor_data():
-    return PARSED_ADVISOR_DATA
+    return knowledge.current.advisor_data
+
+@app.route('/api/metrics')
+def get_metrics():
+    return {**metrics.snapshot(), 'admission': admission.snapshot(), 'prompts': session_prompts.snapshot(),
+            'knowledge': knowledge.snapshot(), 'events': events_snapshot(), 'recorder': recorder.snapshot()}
 
 @app.route('/static/images/<filename>')
 def serve_images(filename):
@@ -1557,6 +1953,7 @@ def serve_images(filename):
 def handle_connect():
     sid = request.sid; log.info(f"Client connected: {sid}")
     clients[sid] = { 'client_connected': True }
+    session_reaper.touch(sid)
     emit('status_update', {'message': 'Connected to Server'})
 
 @socketio.on('disconnect')
@@ -1565,8 +1962,9 @@ def handle_disconnect(*args): # Accept potential args
     # Correct Indentation
     if sid in clients:
         clients[sid]['client_connected'] = False # Mark as disconnected
-        log.info(f"[{sid}] Putting 'stop' action on task queue for disconnect.")
-        task_queue.put({'action': 'stop', 'sid': sid}) # Signal processor to stop task for this SID
+        log.info(f"[{sid}] Sending 'stop' to session runtime for disconnect.")
+        session_runtime.stop_session(sid) # Signal runtime to stop task for this SID
+        admission.release(sid)
         del clients[sid] # Remove client state immediately
         log.info(f"[{sid}] Client state removed.")
     else:
@@ -1579,8 +1977,16 @@ def handle_start_stream(data):
     # Correct Indentation
     if sid in clients:
         clients[sid]['client_connected'] = True
-        log.info(f"[{sid}] Putting 'start' action on task queue.")
-        task_queue.put({'action': 'start', 'sid': sid})
+        session_reaper.touch(sid)
+        # Clients opt into raw PCM16 binary frames; older pages keep sending base64 strings
+        clients[sid]['binary_audio'] = bool((data or {}).get('binary_audio', False))
+        # Pages capture at the browser's native rate; the server resamples to the provider rate
+        clients[sid]['input_sample_rate'] = parse_client_sample_rate((data or {}).get('sample_rate'), INPUT_SAMPLE_RATE)
+        # Optional advisor key: the session's instructions then carry only that advisor's profile
+        clients[sid]['advisor'] = resolve_advisor_key((data or {}).get('advisor'))
+        log.info(f"[{sid}] Requesting admission for session.")
+        if admission.request(sid, "openai") == REJECTED:
+            emit('error_message', {'message': 'Server is busy, please try again in a moment.'})
     else:
         log.warning(f"[{sid}] 'start_stream' for unknown client.")
     # End Correct Indentation
@@ -1591,20 +1997,39 @@ def handle_stop_stream():
     # Correct Indentation
     if sid in clients:
         clients[sid]['client_connected'] = False
-        log.info(f"[{sid}] Putting 'stop' action on task queue due to user stop.")
-        task_queue.put({'action': 'stop', 'sid': sid})
+        session_reaper.touch(sid)
+        log.info(f"[{sid}] Sending 'stop' to session runtime due to user stop.")
+        admission.cancel(sid) # Still queued: just leave the queue
+        session_runtime.stop_session(sid)
     else:
         log.warning(f"[{sid}] 'stop_stream' for unknown client.")
     # End Correct Indentation
 
+@socketio.on('set_advisor')
+def handle_set_advisor(data):
+    """Advisor identified mid-call: narrow the live session's instructions to their profile."""
+    sid = request.sid
+    advisor_key = resolve_advisor_key((data or {}).get('advisor'))
+    if sid not in clients:
+        log.warning(f"[{sid}] 'set_advisor' for unknown client.")
+    elif advisor_key is None:
+        emit('error_message', {'message': f"Unknown advisor: {(data or {}).get('advisor')}"})
+    else:
+        log.info(f"[{sid}] Advisor set to '{advisor_key}'.")
+        clients[sid]['advisor'] = advisor_key
+        session_reaper.touch(sid)
+        if sid in session_runtime.sessions: # Not started yet (or still queued): start_stream picks it up
+            session_runtime.update_session(sid, advisor=advisor_key)
+
 @socketio.on('audio_chunk')
 def handle_audio_chunk(data):
     sid = request.sid
     # Correct Indentation
     if sid in clients and clients[sid].get('client_connected', False):
-        audio_b64 = data.get('audio')
-        if audio_b64:
-            task_queue.put({'action': 'audio', 'sid': sid, 'data': audio_b64}) # Put command on queue
+        session_reaper.touch(sid)
+        pcm_audio = client_audio_to_bytes(data.get('audio'))
+        if pcm_audio:
+            session_runtime.push_audio(sid, pcm_audio) # Straight into the session's asyncio.Queue
     # End Correct Indentation
     # else: pass # Ignore chunks from disconnected clients
 
@@ -1613,16 +2038,18 @@ if __name__ == '__main__':
     log.info("Starting Flask-SocketIO server...")
     if not OPENAI_API_KEY: log.critical("CRITICAL: OPENAI_API_KEY missing!")
     else:
-        start_asyncio_thread()
+        session_runtime.start()
+        session_reaper.start()
+        knowledge.start()
+        recorder.start("openai")
         log.info(f"Starting server with async_mode='{async_mode}'...")
         # Make sure to install required packages: pip install Flask Flask-SocketIO python-dotenv websockets==11.0.3 numpy pyaudio
-        socketio.run(app, host='0.0.0.0', port=5050, debug=False, use_reloader=False, log_output=True)
+        socketio.run(app, host='0.0.0.0', port=PORT, debug=False, use_reloader=False, log_output=True)
         # --- Cleanup ---
         log.info("Flask server shutting down...")
-        task_queue.put(None) # Signal processor thread to stop
-        if asyncio_thread and asyncio_thread.is_alive():
-             log.info("Waiting for asyncio thread...")
-             if asyncio_loop and asyncio_loop.is_running(): asyncio_loop.call_soon_threadsafe(asyncio_loop.stop)
-             asyncio_thread.join(timeout=5)
-             if asyncio_thread.is_alive(): log.warning("Asyncio thread did not stop.")
+        session_reaper.stop()
+        knowledge.stop()
+        log.info("Waiting for session runtime...")
+        session_runtime.shutdown(timeout=5) # Signal runtime to stop and join its thread
+        recorder.stop() # After the sessions, so their last events are written
         log.info("Shutdown complete.")
\ No newline at end of file
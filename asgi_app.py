@@ -0,0 +1,145 @@
+"""
+Native asyncio (ASGI) entry point for the OpenAI voice server.
+
+app.py runs Flask-SocketIO in threading mode and bridges every audio chunk
+into a separate asyncio thread. Here one event loop does everything: a
+python-socketio AsyncServer handles the same Socket.IO events (start_stream,
+audio_chunk, stop_stream), and the session coroutines from app.py run on that
+same loop, so an audio chunk goes from the socket handler into the session's
+queue without crossing a thread. The HTTP routes (/, /api/advisor-data,
+/api/metrics, ...) are the Flask app itself, mounted through asgiref's
+WSGI adapter, so both modes serve identical pages and JSON.
+
+    pip install uvicorn asgiref python-socketio
+    uvicorn asgi_app:asgi --host 0.0.0.0 --port 5050
+
+The ASGI server runs in one process; use several uvicorn workers only behind a
+sticky load balancer (see the multi-worker notes in the README).
+"""
+import asyncio
+import logging
+
+import socketio
+from asgiref.wsgi import WsgiToAsgi
+
+import app as voice_app
+from app import INPUT_SAMPLE_RATE, clients, make_session_shard, resolve_advisor_key
+from audio_transport import client_audio_to_bytes, parse_client_sample_rate
+from admission import REJECTED, AdmissionController
+from session_reaper import client_session_reaper
+from session_runtime import InLoopSessionRuntime
+
+log = logging.getLogger(__name__)
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*")
+server_loop = None
+
+
+def emit_from_session(event, data, room):
+    """emit_to_client for ASGI mode: schedule the async emit on the server loop."""
+    coro = sio.emit(event, data, room=room)
+    try:
+        asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:  # Called from a helper thread (email/Salesforce confirmations)
+        asyncio.run_coroutine_threadsafe(coro, server_loop)
+
+
+voice_app.emit_to_client = emit_from_session
+session_runtime = make_session_shard(0, runtime_class=InLoopSessionRuntime)
+admission = AdmissionController(lambda sid, provider: session_runtime.start_session(sid, advisor=clients.get(sid, {}).get('advisor')),
+                                voice_app.notify_queue_position)
+session_runtime.on_session_done = admission.session_done
+voice_app.admission = admission # /api/metrics reports this server's admission state
+session_reaper = client_session_reaper(clients, session_runtime, lambda sid: asyncio.get_running_loop().create_task(sio.disconnect(sid)),
+                                       name="openai.sessions")
+reaper_task = None
+
+
+async def on_startup():
+    global server_loop, reaper_task
+    server_loop = asyncio.get_running_loop()
+    if not voice_app.OPENAI_API_KEY: log.critical("CRITICAL: OPENAI_API_KEY missing!")
+    session_runtime.start()
+    reaper_task = server_loop.create_task(session_reaper.run()) # Sweeps on the server loop, next to the sessions it stops
+    voice_app.knowledge.start() # Corpus/advisor file watcher (a thread; snapshot swaps are single assignments)
+    voice_app.recorder.start("openai-asgi") # Session event writer (a thread; sessions only append to its queue)
+    log.info("ASGI server ready; sessions share the server event loop.")
+
+
+async def on_shutdown():
+    log.info("ASGI server shutting down, closing sessions...")
+    if reaper_task is not None: reaper_task.cancel()
+    voice_app.knowledge.stop()
+    await session_runtime.aclose(timeout=5)
+    voice_app.recorder.stop()
+    log.info("Shutdown complete.")
+
+
+# --- Socket.IO Handlers (same events as app.py) ---
+@sio.event
+async def connect(sid, environ, auth=None):
+    log.info(f"Client connected: {sid}")
+    clients[sid] = { 'client_connected': True }
+    session_reaper.touch(sid)
+    await sio.emit('status_update', {'message': 'Connected to Server'}, room=sid)
+
+@sio.event
+async def disconnect(sid, *args):
+    log.info(f"Client disconnected: {sid}")
+    if sid in clients:
+        clients[sid]['client_connected'] = False
+        session_runtime.stop_session(sid)
+        admission.release(sid)
+        del clients[sid]
+        log.info(f"[{sid}] Client state removed.")
+    else:
+        log.warning(f"Disconnect for unknown sid: {sid}")
+
+@sio.event
+async def start_stream(sid, data=None):
+    log.info(f"[{sid}] Received start_stream event.")
+    if sid in clients:
+        clients[sid]['client_connected'] = True
+        session_reaper.touch(sid)
+        clients[sid]['binary_audio'] = bool((data or {}).get('binary_audio', False))
+        clients[sid]['input_sample_rate'] = parse_client_sample_rate((data or {}).get('sample_rate'), INPUT_SAMPLE_RATE)
+        clients[sid]['advisor'] = resolve_advisor_key((data or {}).get('advisor'))
+        if admission.request(sid, "openai") == REJECTED:
+            await sio.emit('error_message', {'message': 'Server is busy, please try again in a moment.'}, room=sid)
+    else:
+        log.warning(f"[{sid}] 'start_stream' for unknown client.")
+
+@sio.event
+async def stop_stream(sid, data=None):
+    log.info(f"[{sid}] Received stop_stream event (user ended session).")
+    if sid in clients:
+        clients[sid]['client_connected'] = False
+        session_reaper.touch(sid)
+        admission.cancel(sid)
+        session_runtime.stop_session(sid)
+    else:
+        log.warning(f"[{sid}] 'stop_stream' for unknown client.")
+
+@sio.event
+async def set_advisor(sid, data=None):
+    advisor_key = resolve_advisor_key((data or {}).get('advisor'))
+    if sid not in clients:
+        log.warning(f"[{sid}] 'set_advisor' for unknown client.")
+    elif advisor_key is None:
+        await sio.emit('error_message', {'message': f"Unknown advisor: {(data or {}).get('advisor')}"}, room=sid)
+    else:
+        clients[sid]['advisor'] = advisor_key
+        session_reaper.touch(sid)
+        if sid in session_runtime.sessions: # Not started yet (or still queued): start_stream picks it up
+            session_runtime.update_session(sid, advisor=advisor_key)
+
+@sio.event
+async def audio_chunk(sid, data):
+    if sid in clients and clients[sid].get('client_connected', False):
+        session_reaper.touch(sid)
+        pcm_audio = client_audio_to_bytes(data.get('audio'))
+        if pcm_audio:
+            session_runtime.push_audio(sid, pcm_audio) # Same loop: straight into the session's queue
+
+
+asgi = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(voice_app.app), on_startup=on_startup, on_shutdown=on_shutdown)
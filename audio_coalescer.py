@@ -0,0 +1,96 @@
+"""
+Upstream audio coalescing.
+
+The browser sends one chunk per ScriptProcessor callback and, when the upstream
+socket or the event loop hiccups, several chunks pile up in the session's input
+queue. Instead of one websocket message (and one json.dumps) per chunk, the
+send loop asks the coalescer for the next batch: it waits for the first chunk,
+then drains whatever is *already* queued up to a frame budget in milliseconds.
+It never waits for more audio, so it adds no latency; it only merges backlog.
+
+SPEECH_BOUNDARY markers placed in the queue cut the current batch, so audio on
+either side of a speech start/stop is never merged into one append.
+"""
+import asyncio
+import logging
+import os
+
+from audio_transport import BYTES_PER_SAMPLE, pcm_duration_ms
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Max milliseconds of audio merged into one upstream append (0 disables coalescing)
+UPSTREAM_COALESCE_MS = int(os.environ.get("UPSTREAM_COALESCE_MS", "200"))
+
+# Histogram buckets for batch sizes (frames per append)
+BATCH_FRAME_BOUNDS = (1, 2, 3, 4, 6, 8, 12, 16, 32)
+
+
+class _SpeechBoundary:
+    def __repr__(self):
+        return "SPEECH_BOUNDARY"
+
+
+SPEECH_BOUNDARY = _SpeechBoundary()
+
+
+class AudioCoalescer:
+    """Pulls batches of PCM16 chunks from a session input queue.
+
+    next_batch() returns (pcm_bytes, frames), or (None, 0) once the stop
+    sentinel (None) is reached. A batch cut short by the stop sentinel is
+    returned first and the stop is reported on the following call. A single
+    chunk larger than the budget is still sent on its own.
+    """
+
+    def __init__(self, input_queue, sample_rate, budget_ms=UPSTREAM_COALESCE_MS, provider="openai", session_metrics=None):
+        self.input_queue = input_queue
+        self.sample_rate = sample_rate
+        self.budget_bytes = int(sample_rate * budget_ms / 1000) * BYTES_PER_SAMPLE
+        self.provider = provider
+        self.session_metrics = session_metrics
+        self._stopped = False
+        self._carry = None  # Chunk that would have overflowed the previous batch
+
+    async def next_batch(self):
+        first, self._carry = self._carry, None
+        while first is None:
+            if self._stopped:
+                return None, 0
+            item = await self.input_queue.get()
+            self.input_queue.task_done()
+            if item is None:
+                self._stopped = True
+                return None, 0
+            if item is not SPEECH_BOUNDARY:
+                first = item
+        chunks = [first]
+        size = len(first)
+        while not self._stopped and size < self.budget_bytes:
+            try:
+                item = self.input_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            self.input_queue.task_done()
+            if item is None:
+                self._stopped = True
+                break
+            if item is SPEECH_BOUNDARY:
+                break  # Flush now; the next batch starts on the other side of the boundary
+            if size + len(item) > self.budget_bytes:
+                self._carry = item  # Keep batches within the budget; this starts the next one
+                break
+            chunks.append(item)
+            size += len(item)
+        self._record(len(chunks), size)
+        return (chunks[0] if len(chunks) == 1 else b"".join(chunks)), len(chunks)
+
+    def _record(self, frames, size):
+        metrics.observe(f"{self.provider}.upstream_batch_frames", frames, BATCH_FRAME_BOUNDS)
+        metrics.observe(f"{self.provider}.upstream_batch_ms", pcm_duration_ms(size, self.sample_rate))
+        if self.session_metrics is not None:
+            self.session_metrics.incr('upstream_messages')
+            self.session_metrics.incr('upstream_frames', frames)
+            if frames > 1:
+                self.session_metrics.incr('upstream_frames_coalesced', frames - 1)
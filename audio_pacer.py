@@ -0,0 +1,174 @@
+"""
+Outbound audio framing and pacing for 'audio_response' emits.
+
+Providers stream agent audio as deltas of arbitrary size (OpenAI often sends
+dozens of tiny ones per second, faster than real time), and every delta used to
+become its own Socket.IO packet. OutboundAudioPacer re-frames the deltas into
+fixed OUTPUT_FRAME_MS packets and paces them so the client holds at most
+OUTPUT_LEAD_MS of unplayed audio beyond what is already playing:
+
+* push(pcm)   - append provider audio (bytes); full frames become packets;
+* flush()     - end of response: the partial tail frame is released and all
+                pending packets are sent at once;
+* purge()     - barge-in: pending audio is discarded (the client clears its own
+                playback queue on 'interrupt_playback');
+* barge_in()  - purge() plus an estimate of how much of the current response
+                the listener actually heard, for truncating the upstream item.
+
+If the provider goes quiet with a partial frame pending (ElevenLabs has no
+response.done), the tail is flushed after OUTPUT_IDLE_FLUSH_MS.
+"""
+import asyncio
+import collections
+import logging
+import os
+import time
+
+from audio_transport import BYTES_PER_SAMPLE, pcm_duration_ms
+
+log = logging.getLogger(__name__)
+
+OUTPUT_FRAME_MS = int(os.environ.get("OUTPUT_FRAME_MS", "60"))
+OUTPUT_LEAD_MS = int(os.environ.get("OUTPUT_LEAD_MS", "300"))
+OUTPUT_IDLE_FLUSH_MS = int(os.environ.get("OUTPUT_IDLE_FLUSH_MS", "120"))
+
+# Histogram buckets for provider deltas per emitted packet
+DELTAS_PER_PACKET_BOUNDS = (0.5, 1, 2, 3, 4, 6, 8, 12, 16)
+
+
+class OutboundAudioPacer:
+    """Per-session outbound audio buffer; run() is the sender task on the session loop.
+
+    emit(pcm, sample_rate) is called with each packet (raw PCM16 bytes).
+    """
+
+    def __init__(self, emit, sample_rate, frame_ms=OUTPUT_FRAME_MS, lead_ms=OUTPUT_LEAD_MS,
+                 idle_flush_ms=OUTPUT_IDLE_FLUSH_MS, provider="openai", session_metrics=None):
+        self.emit = emit
+        self.frame_ms = frame_ms
+        self.lead_s = lead_ms / 1000.0
+        self.idle_flush_s = idle_flush_ms / 1000.0
+        self.provider = provider
+        self.session_metrics = session_metrics
+        self.sample_rate = sample_rate
+        self._partial = bytearray()
+        self._packets = collections.deque()
+        self._deltas_since_packet = 0
+        self._flushing = False
+        self._play_until = 0.0  # Monotonic time at which the client finishes what it was sent
+        self._wakeup = asyncio.Event()
+        self.sent_ms = 0.0  # Audio emitted since the last reset_response()
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, rate):
+        # Rate changes (ElevenLabs confirms its output format after connect) apply to the next frame
+        self._sample_rate = rate
+        self.frame_bytes = max(1, int(rate * self.frame_ms / 1000)) * BYTES_PER_SAMPLE
+
+    # --- Producer side (receive loop) ---
+    def push(self, pcm):
+        if not pcm:
+            return
+        self._partial += pcm
+        self._deltas_since_packet += 1
+        self._count('output_deltas', 1)
+        while len(self._partial) >= self.frame_bytes:
+            self._packets.append(bytes(self._partial[:self.frame_bytes]))
+            del self._partial[:self.frame_bytes]
+        self._wakeup.set()
+
+    def flush(self):
+        """Release the partial tail and send everything pending without pacing."""
+        self._take_partial()
+        self._flushing = True
+        self._wakeup.set()
+
+    def purge(self):
+        """Drop all pending audio; returns the discarded duration in ms."""
+        dropped = len(self._partial) + sum(len(p) for p in self._packets)
+        self._partial.clear()
+        self._packets.clear()
+        self._deltas_since_packet = 0
+        self._flushing = False
+        self._play_until = 0.0
+        dropped_ms = pcm_duration_ms(dropped, self.sample_rate)
+        self._count('output_purged_ms', int(dropped_ms))
+        return dropped_ms
+
+    def reset_response(self):
+        """Start counting played audio for a new response item."""
+        self.sent_ms = 0.0
+
+    def client_buffered_ms(self):
+        """Audio already emitted that the client has not finished playing (estimated)."""
+        return max(0.0, self._play_until - time.monotonic()) * 1000.0
+
+    def barge_in(self):
+        """Purge pending audio; returns (played_ms, unplayed_ms) for the current response.
+
+        played_ms is what was emitted minus what the client still had queued,
+        i.e. where its playback was when the listener started talking.
+        """
+        client_buffered = min(self.client_buffered_ms(), self.sent_ms)
+        played = self.sent_ms - client_buffered
+        unplayed = client_buffered + self.purge()
+        self.sent_ms = played
+        return played, unplayed
+
+    def pending_ms(self):
+        return pcm_duration_ms(len(self._partial) + sum(len(p) for p in self._packets), self.sample_rate)
+
+    def _take_partial(self):
+        if self._partial:
+            self._packets.append(bytes(self._partial))
+            self._partial.clear()
+
+    # --- Sender task ---
+    async def run(self):
+        try:
+            while True:
+                if not self._packets:
+                    self._flushing = False
+                    await self._wait_for_audio()
+                    continue
+                if not self._flushing:
+                    ahead = self._play_until - time.monotonic()
+                    if ahead > self.lead_s:
+                        self._wakeup.clear()
+                        try:
+                            await asyncio.wait_for(self._wakeup.wait(), ahead - self.lead_s)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue  # Re-check: a purge or flush may have happened while waiting
+                self._send(self._packets.popleft())
+        except asyncio.CancelledError:
+            log.debug(f"OutboundAudioPacer ({self.provider}) cancelled with {self.pending_ms():.0f} ms pending.")
+            raise
+
+    async def _wait_for_audio(self):
+        self._wakeup.clear()
+        timeout = self.idle_flush_s if self._partial else None
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._take_partial()  # Provider went quiet mid-frame
+
+    def _send(self, packet):
+        duration_s = pcm_duration_ms(len(packet), self.sample_rate) / 1000.0
+        now = time.monotonic()
+        self._play_until = max(self._play_until, now) + duration_s
+        self.sent_ms += duration_s * 1000.0
+        if self.session_metrics is not None:
+            self.session_metrics.incr('output_packets', 1)
+            self.session_metrics.observe(f"{self.provider}.output_deltas_per_packet",
+                                         self._deltas_since_packet, DELTAS_PER_PACKET_BOUNDS)
+        self._deltas_since_packet = 0
+        self.emit(packet, self.sample_rate)
+
+    def _count(self, name, value):
+        if self.session_metrics is not None and value:
+            self.session_metrics.incr(name, value)
@@ -0,0 +1,159 @@
+"""
+Bounded per-session input queue for upstream audio.
+
+The session input queues used to be unbounded asyncio.Queues: when the upstream
+socket stalled, audio piled up without limit and was later replayed as stale
+speech. BoundedAudioQueue caps the buffered audio by duration and applies one
+of three policies when the cap is reached:
+
+* block          - the producing Socket.IO handler thread waits for space
+                   (up to INPUT_QUEUE_BLOCK_TIMEOUT_S, then the chunk is dropped);
+* drop_oldest    - the oldest audio is discarded to make room for the new chunk;
+* drop_to_latest - the backlog is trimmed to the most recent
+                   INPUT_QUEUE_LATEST_MS of audio, so a recovered upstream hears
+                   what the advisor is saying now rather than seconds ago.
+
+The underlying asyncio.Queue is unbounded; the byte bound is enforced only
+where audio is enqueued (offer() and the block policy's wait for space), so
+control markers (the None stop sentinel, SPEECH_BOUNDARY) go through the plain
+put_nowait() and are never refused or dropped. Depth and drop counters are
+reported per session, as audio is added and as it is consumed. An optional voice
+gate (voice_gate.VoiceActivityGate) runs on the loop thread before a chunk is
+queued, so silence never occupies the queue or reaches the upstream socket.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+
+from audio_transport import BYTES_PER_SAMPLE, pcm_duration_ms
+
+log = logging.getLogger(__name__)
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_TO_LATEST = "drop_to_latest"
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_TO_LATEST)
+
+INPUT_QUEUE_POLICY = os.environ.get("INPUT_QUEUE_POLICY", POLICY_DROP_TO_LATEST)
+INPUT_QUEUE_MAX_MS = int(os.environ.get("INPUT_QUEUE_MAX_MS", "2000"))
+INPUT_QUEUE_LATEST_MS = int(os.environ.get("INPUT_QUEUE_LATEST_MS", "500"))
+INPUT_QUEUE_BLOCK_TIMEOUT_S = float(os.environ.get("INPUT_QUEUE_BLOCK_TIMEOUT_S", "1.0"))
+
+if INPUT_QUEUE_POLICY not in POLICIES:
+    log.warning(f"Unknown INPUT_QUEUE_POLICY '{INPUT_QUEUE_POLICY}', using '{POLICY_DROP_TO_LATEST}'")
+    INPUT_QUEUE_POLICY = POLICY_DROP_TO_LATEST
+
+
+def _is_audio(item):
+    return isinstance(item, (bytes, bytearray))
+
+
+class BoundedAudioQueue(asyncio.Queue):
+    """asyncio.Queue of PCM16 chunks bounded by buffered duration rather than item count."""
+
+    def __init__(self, sample_rate, policy=INPUT_QUEUE_POLICY, max_ms=INPUT_QUEUE_MAX_MS,
+                 latest_ms=INPUT_QUEUE_LATEST_MS, block_timeout=INPUT_QUEUE_BLOCK_TIMEOUT_S,
+                 session_metrics=None, gate=None):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.policy = policy
+        self.max_bytes = self._ms_to_bytes(max_ms)
+        self.latest_bytes = min(self._ms_to_bytes(latest_ms), self.max_bytes)
+        self.block_timeout = block_timeout
+        self.session_metrics = session_metrics
+        self.gate = gate
+        self.buffered_bytes = 0
+        self.high_water_bytes = 0
+        self._space = asyncio.Event()  # Set by the consumer whenever audio leaves the queue
+
+    def _ms_to_bytes(self, ms):
+        return int(self.sample_rate * ms / 1000) * BYTES_PER_SAMPLE
+
+    # --- asyncio.Queue hooks: track buffered bytes instead of item count ---
+    def _put(self, item):
+        super()._put(item)
+        if _is_audio(item):
+            self.buffered_bytes += len(item)
+            if self.buffered_bytes > self.high_water_bytes:
+                self.high_water_bytes = self.buffered_bytes
+
+    def _get(self):
+        item = super()._get()
+        if _is_audio(item):
+            self.buffered_bytes -= len(item)
+            self._space.set()
+            self._report_depth()  # Gauges fall as the send loop drains, not only when the producer adds
+        return item
+
+    def bytes_full(self):
+        return self.buffered_bytes >= self.max_bytes
+
+    # --- Producer side ---
+    def push_from_thread(self, loop, item):
+        """Enqueue item from a non-loop thread according to the policy. Returns False if it was dropped."""
+        if self.policy == POLICY_BLOCK:
+            future = asyncio.run_coroutine_threadsafe(self._put_gated(item), loop)
+            try:
+                future.result(timeout=self.block_timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                loop.call_soon_threadsafe(self._count_drop, 1, len(item))
+                return False
+            loop.call_soon_threadsafe(self._report_depth)
+            return True
+        loop.call_soon_threadsafe(self.offer, item)
+        return True
+
+    async def _put_gated(self, item):
+        for gated_item in self._gate(item):
+            while _is_audio(gated_item) and self.bytes_full():
+                self._space.clear()
+                await self._space.wait()
+            self.put_nowait(gated_item)
+
+    def _gate(self, item):
+        if self.gate is None or not _is_audio(item):
+            return (item,)
+        return self.gate.process(item)
+
+    def offer(self, item):
+        """Non-blocking enqueue on the loop thread; gates, then applies the drop policy when full."""
+        for gated_item in self._gate(item):
+            self._offer_one(gated_item)
+        self._report_depth()
+
+    def _offer_one(self, item):
+        if _is_audio(item) and self.buffered_bytes + len(item) > self.max_bytes:
+            if self.policy == POLICY_DROP_TO_LATEST:
+                self._drop_oldest_until(max(self.latest_bytes - len(item), 0))
+            else:  # drop_oldest (and block callers that ended up here) make just enough room
+                self._drop_oldest_until(max(self.max_bytes - len(item), 0))
+        self.put_nowait(item)
+
+    def _drop_oldest_until(self, target_bytes):
+        dropped = dropped_bytes = 0
+        markers = []
+        while self.buffered_bytes > target_bytes and self._queue:
+            item = self._queue.popleft()
+            if _is_audio(item):
+                self.buffered_bytes -= len(item)
+                dropped += 1
+                dropped_bytes += len(item)
+                self.task_done()
+            else:
+                markers.append(item)
+        self._queue.extendleft(reversed(markers))
+        if dropped:
+            self._count_drop(dropped, dropped_bytes)
+
+    def _count_drop(self, frames, num_bytes):
+        if self.session_metrics is not None:
+            self.session_metrics.incr('input_dropped_frames', frames)
+            self.session_metrics.incr('input_dropped_ms', int(pcm_duration_ms(num_bytes, self.sample_rate)))
+
+    def _report_depth(self):
+        if self.session_metrics is not None:
+            self.session_metrics.set_gauge('input_queue_depth', self.qsize())
+            self.session_metrics.set_gauge('input_queue_ms', int(pcm_duration_ms(self.buffered_bytes, self.sample_rate)))
+            self.session_metrics.set_gauge('input_queue_high_water_ms', int(pcm_duration_ms(self.high_water_bytes, self.sample_rate)))
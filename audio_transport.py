@@ -0,0 +1,75 @@
+"""
+Helpers for moving PCM16 audio between the browser, the server and the
+realtime providers.
+
+Audio is carried as raw ``bytes`` everywhere inside the server. Clients that
+opt into binary mode (``start_stream`` with ``{'binary_audio': True}``) send and
+receive Socket.IO binary attachments; older clients keep sending base64 strings.
+Base64 is only produced at the upstream boundary, because the OpenAI and
+ElevenLabs websocket APIs require it inside their JSON events; the outbound
+audio frames are built by json_codec's AppendEncoder templates.
+"""
+import base64
+import binascii
+import logging
+
+log = logging.getLogger(__name__)
+
+BYTES_PER_SAMPLE = 2  # PCM16 mono
+MIN_CLIENT_SAMPLE_RATE = 8000
+MAX_CLIENT_SAMPLE_RATE = 192000
+
+
+def client_audio_to_bytes(payload):
+    """Normalize an inbound 'audio' field (binary or base64 str) to PCM16 bytes.
+
+    Returns None for empty or undecodable payloads.
+    """
+    if not payload:
+        return None
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        pcm = bytes(payload)
+    elif isinstance(payload, str):
+        try:
+            pcm = base64.b64decode(payload, validate=True)
+        except (binascii.Error, ValueError) as e:
+            log.warning(f"Dropping undecodable base64 audio chunk: {e}")
+            return None
+    else:
+        log.warning(f"Dropping audio chunk of unsupported type {type(payload).__name__}")
+        return None
+    if len(pcm) % BYTES_PER_SAMPLE:
+        pcm = pcm[:-1]  # Never forward half a sample
+    return pcm or None
+
+
+def upstream_b64_to_pcm(b64_audio):
+    """Decode a provider audio delta to PCM16 bytes."""
+    return base64.b64decode(b64_audio)
+
+
+def client_audio_payload(pcm, sample_rate, binary):
+    """Build the 'audio_response' payload for a client from PCM16 bytes.
+
+    Binary clients get raw bytes (~33% less on the wire and no per-byte atob
+    loop in the browser); legacy clients get a base64 string.
+    """
+    audio = pcm if binary else base64.b64encode(pcm).decode('ascii')
+    return {'audio': audio, 'sample_rate': sample_rate}
+
+
+def pcm_duration_ms(num_bytes, sample_rate):
+    """Duration in milliseconds of num_bytes of PCM16 mono audio."""
+    return (num_bytes // BYTES_PER_SAMPLE) * 1000.0 / sample_rate
+
+
+def parse_client_sample_rate(value, default):
+    """Validate the capture rate a client reports in start_stream; falls back to default."""
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        return default
+    if not MIN_CLIENT_SAMPLE_RATE <= rate <= MAX_CLIENT_SAMPLE_RATE:
+        log.warning(f"Ignoring out-of-range client sample rate {rate}, using {default}")
+        return default
+    return rate
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON encode/decode of upstream audio frames per frame size.
+
+Encode: an input_audio_buffer.append built from raw PCM16 (base64 included)
+with stdlib json.dumps, with orjson (if installed) and with the
+AppendEncoder template splice. Decode: a response.audio.delta frame of the
+same audio length with stdlib json.loads and with orjson. Reports
+microseconds per frame and MB/s of frame text.
+
+    python bench_json_codec.py [--ms 20 100 200 1000] [--rate 24000] [--iterations 2000]
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+from json_codec import OPENAI_AUDIO_APPEND, orjson
+
+
+def per_frame_us(fn, arg, iterations):
+    fn(arg)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def encoders():
+    def stdlib(pcm):
+        return json.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(pcm).decode('ascii')})
+    yield "stdlib", stdlib
+    if orjson is not None:
+        def fast(pcm):
+            return orjson.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(pcm).decode('ascii')}).decode('utf-8')
+        yield "orjson", fast
+    yield "template", OPENAI_AUDIO_APPEND.encode
+
+
+def decoders():
+    yield "stdlib", json.loads
+    if orjson is not None:
+        yield "orjson", orjson.loads
+
+
+def audio_delta_frame(pcm):
+    return json.dumps({"type": "response.audio.delta", "event_id": "event_B9x2", "response_id": "resp_B9x1",
+                       "item_id": "item_B9x0", "output_index": 0, "content_index": 0,
+                       "delta": base64.b64encode(pcm).decode('ascii')})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ms', type=int, nargs='+', default=[20, 100, 200, 1000], help="audio per frame in milliseconds")
+    parser.add_argument('--rate', type=int, default=24000, help="PCM16 sample rate")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+    if orjson is None:
+        print("orjson is not installed; showing the stdlib codec and the template only.")
+
+    print(f"{'ms':>5} | {'frame KB':>8} | {'op':>6} | {'codec':>8} | {'us/frame':>9} | {'MB/s':>8}")
+    print("-" * 58)
+    for ms in args.ms:
+        pcm = os.urandom(args.rate * ms // 1000 * 2)
+        frame = audio_delta_frame(pcm)
+        size_mb = len(OPENAI_AUDIO_APPEND.encode(pcm)) / 1e6
+        for name, fn in encoders():
+            us = per_frame_us(fn, pcm, args.iterations)
+            print(f"{ms:>5} | {size_mb * 1000:>8.1f} | {'encode':>6} | {name:>8} | {us:>9.2f} | {size_mb / us * 1e6:>8.0f}")
+        for name, fn in decoders():
+            us = per_frame_us(fn, frame, args.iterations)
+            print(f"{ms:>5} | {len(frame) / 1000:>8.1f} | {'decode':>6} | {name:>8} | {us:>9.2f} | {len(frame) / us:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark the NumPy polyphase resampler against a per-sample Python loop.
+
+Uses one ScriptProcessor-sized chunk (4096 samples) per call, which is what the
+browser sends, and reports the cost per chunk and the real-time factor.
+
+    python bench_resampler.py [--chunk 4096] [--iterations 200]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from resampler import PolyphaseResampler
+
+RATE_PAIRS = [(48000, 24000), (48000, 16000), (44100, 24000), (24000, 16000)]
+
+
+def python_resample(resampler, samples):
+    """Same algorithm as PolyphaseResampler.process_array, one output sample at a time."""
+    taps, up, down, bank = resampler.taps, resampler.up, resampler.down, resampler.bank.tolist()
+    ext = [0.0] * (taps - 1) + samples
+    out = []
+    pos = 0
+    end = len(samples) * up
+    while pos < end:
+        phase, base = pos % up, pos // up
+        row = bank[phase]
+        acc = 0.0
+        for j in range(taps):
+            acc += ext[base + j] * row[j]
+        out.append(max(-32768, min(32767, round(acc))))
+        pos += down
+    return out
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=4096, help="samples per chunk")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'rates':>14} | {'numpy/chunk':>12} | {'python/chunk':>13} | {'speedup':>8} | {'x realtime':>10}")
+    print("-" * 70)
+    for in_rate, out_rate in RATE_PAIRS:
+        t = np.arange(args.chunk) / in_rate
+        chunk = (8000 * np.sin(2 * np.pi * 440 * t)).astype('<i2').tobytes()
+        samples = np.frombuffer(chunk, dtype='<i2').astype(np.float64).tolist()
+
+        resampler = PolyphaseResampler(in_rate, out_rate)
+        numpy_s = time_per_call(lambda: resampler.process(chunk), args.iterations)
+        python_s = time_per_call(lambda: python_resample(resampler, samples), max(3, args.iterations // 50))
+
+        chunk_s = args.chunk / in_rate
+        print(f"{in_rate:>6}->{out_rate:<6} | {numpy_s * 1e6:>9.1f} us | {python_s * 1e3:>10.2f} ms | "
+              f"{python_s / numpy_s:>7.0f}x | {chunk_s / numpy_s:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
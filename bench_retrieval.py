@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark ETF corpus retrieval: query latency and prompt size versus corpus size.
+
+Indexes corpus.txt, then copies of it (each copy's tickers renamed so the
+passages stay distinct) to show how search latency and the prompt cost of
+embedding the corpus grow, while the retrieval prompt and tool output stay flat.
+
+    python bench_retrieval.py [--scales 1 4 16 64] [--iterations 2000]
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+
+from corpus_index import CorpusIndex, split_corpus
+
+QUERIES = [
+    "What is the expense ratio of CGDV?",
+    "short duration municipal bond yield",
+    "CGUS one year return",
+    "which fund focuses on emerging markets",
+    "who are the portfolio managers",
+    "high yield bond fund dividends",
+]
+
+
+def scaled_corpus(text, copies):
+    parts = [text]
+    body = text[text.find("\n#"):]  # Headings onward, so each copy's passages start at a heading
+    for n in range(1, copies):
+        # CGUS -> ABUS etc.: same shape of text, different fund
+        prefix = chr(65 + n // 26 % 26) + chr(65 + n % 26)
+        parts.append(re.sub(r"\bCG([A-Z]{2})\b", lambda m: prefix + m.group(1), body))
+    return "\n".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', default='corpus.txt')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 4, 16, 64], help="corpus copies to index")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        base = f.read()
+
+    print(f"{'copies':>6} | {'passages':>8} | {'terms':>6} | {'build ms':>8} | {'p50 us':>7} | {'p99 us':>7} | "
+          f"{'embedded prompt':>15} | {'tool output':>11}")
+    print("-" * 92)
+    for copies in args.scales:
+        text = scaled_corpus(base, copies)
+        started = time.perf_counter()
+        index = CorpusIndex(split_corpus(text))
+        build_ms = (time.perf_counter() - started) * 1000.0
+
+        samples = []
+        for i in range(args.iterations):
+            query = QUERIES[i % len(QUERIES)]
+            started = time.perf_counter()
+            index.search(query)
+            samples.append((time.perf_counter() - started) * 1e6)
+        p50, p99 = np.percentile(samples, [50, 99])
+        output_bytes = max(len(index.tool_result({'query': q}).encode('utf-8')) for q in QUERIES)
+        print(f"{copies:>6} | {len(index.passages):>8} | {len(index.vocab):>6} | {build_ms:>8.1f} | {p50:>7.1f} | "
+              f"{p99:>7.1f} | {len(text.encode('utf-8')):>9} bytes | {output_bytes:>5} bytes")
+
+
+if __name__ == '__main__':
+    main()
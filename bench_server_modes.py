@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark the threading server (app.py) against the ASGI server (asgi_app.py).
+
+Starts a local fake OpenAI realtime endpoint, launches each server against it
+(OPENAI_REALTIME_URL), connects N Socket.IO clients that stream 85 ms PCM16
+chunks in real time, and reports:
+
+* per-chunk latency - client emit to the matching input_audio_buffer.append
+  arriving at the fake upstream (each chunk carries its send time, so the
+  numbers are client -> server -> upstream, p50/p95/p99);
+* connections per core - clients / (server CPU seconds per wall second),
+  read from /proc for the server process.
+
+    pip install "python-socketio[asyncio_client]" websockets==11.0.3 uvicorn asgiref
+    python bench_server_modes.py [--clients 50] [--seconds 20]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+import socketio
+import websockets
+
+SAMPLE_RATE = 24000  # Same as the provider rate, so the server's resampler is a passthrough
+CHUNK_SAMPLES = 2048  # ~85 ms
+CHUNK_BYTES = CHUNK_SAMPLES * 2
+UPSTREAM_PORT = 8765
+SERVER_PORT = 5050
+STAMP = struct.Struct('<dI')  # send time (time.monotonic, system-wide on Linux), chunk length
+
+MODES = {
+    'threading': [sys.executable, 'app.py'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi_app:asgi', '--port', str(SERVER_PORT), '--log-level', 'warning'],
+}
+
+
+class FakeUpstream:
+    """Accepts realtime sessions, confirms session.update and timestamps every appended chunk."""
+
+    def __init__(self):
+        self.latencies_ms = []
+
+    async def handle(self, ws, path=None):
+        await ws.send(json.dumps({"type": "session.created"}))
+        async for message in ws:
+            event = json.loads(message)
+            if event.get("type") == "session.update":
+                await ws.send(json.dumps({"type": "session.updated"}))
+            elif event.get("type") == "input_audio_buffer.append":
+                now = time.monotonic()
+                pcm = base64.b64decode(event["audio"])
+                for offset in range(0, len(pcm) - STAMP.size + 1, CHUNK_BYTES):  # Coalesced appends hold several chunks
+                    sent_at, length = STAMP.unpack_from(pcm, offset)
+                    if length == CHUNK_BYTES:
+                        self.latencies_ms.append((now - sent_at) * 1000.0)
+
+
+def process_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')  # utime + stime
+
+
+async def run_client(url, seconds, started):
+    client = socketio.AsyncClient()
+    await client.connect(url, transports=['websocket'])
+    await client.emit('start_stream', {'binary_audio': True, 'sample_rate': SAMPLE_RATE})
+    await started.wait()
+    chunk = bytearray(CHUNK_BYTES)
+    interval = CHUNK_SAMPLES / SAMPLE_RATE
+    next_at = time.monotonic()
+    deadline = next_at + seconds
+    while time.monotonic() < deadline:
+        STAMP.pack_into(chunk, 0, time.monotonic(), CHUNK_BYTES)
+        await client.emit('audio_chunk', {'audio': bytes(chunk)})
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+    await client.emit('stop_stream')
+    await client.disconnect()
+
+
+async def bench_mode(mode, clients, seconds):
+    upstream = FakeUpstream()
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "bench"),
+               OPENAI_REALTIME_URL=f"ws://127.0.0.1:{UPSTREAM_PORT}", OPENAI_POOL_SIZE="0",
+               UPSTREAM_COALESCE_MS="0")
+    async with websockets.serve(upstream.handle, "127.0.0.1", UPSTREAM_PORT):
+        server = subprocess.Popen(MODES[mode], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            await asyncio.sleep(3)  # Server startup
+            started = asyncio.Event()
+            tasks = [asyncio.create_task(run_client(f"http://127.0.0.1:{SERVER_PORT}", seconds, started)) for _ in range(clients)]
+            await asyncio.sleep(1.5)  # Let every session connect upstream and send its greeting
+            cpu_before, wall_before = process_cpu_seconds(server.pid), time.monotonic()
+            started.set()
+            await asyncio.gather(*tasks)
+            cpu_used = process_cpu_seconds(server.pid) - cpu_before
+            wall = time.monotonic() - wall_before
+            await asyncio.sleep(0.5)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+    lat = sorted(upstream.latencies_ms)
+    cores = cpu_used / wall if wall else 0.0
+    return {
+        'mode': mode,
+        'chunks': len(lat),
+        'p50_ms': statistics.median(lat) if lat else None,
+        'p95_ms': lat[int(len(lat) * 0.95)] if lat else None,
+        'p99_ms': lat[int(len(lat) * 0.99)] if lat else None,
+        'cpu_cores': cores,
+        'connections_per_core': clients / cores if cores else None,
+    }
+
+
+def fmt(value, spec):
+    return format(value, spec) if value is not None else "-"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} | {'chunks':>7} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'cpu cores':>9} | {'conns/core':>10}")
+    print("-" * 80)
+    for mode in args.modes:
+        r = await bench_mode(mode, args.clients, args.seconds)
+        print(f"{r['mode']:>10} | {r['chunks']:>7} | {fmt(r['p50_ms'], '7.2f')} | {fmt(r['p95_ms'], '7.2f')} | "
+              f"{fmt(r['p99_ms'], '7.2f')} | {r['cpu_cores']:>9.3f} | {fmt(r['connections_per_core'], '10.0f')}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark meeting-confirmation detection on a streamed agent reply.
+
+Compares the old per-delta check (append, lower() the whole reply, `in` for
+every trigger and weekday) with the streaming TriggerScanner, on replies
+that never match (the worst case: nothing short-circuits). Reports the cost
+of the last delta and of the whole reply as the reply grows.
+
+    python bench_triggers.py [--lengths 1000 10000 50000] [--delta 6]
+"""
+import argparse
+import time
+
+from trigger_matcher import CONFIRMATION, CONFIRMATION_TRIGGERS, DAY, MEETING_CONFIRMATION, MEETING_DAYS
+
+FILLER = ("Thanks for taking the time today, I think our core equity strategy could be a good fit for the clients "
+          "you mentioned, especially with the income focus and the tax efficiency you care about. ")
+
+
+def deltas(length, size):
+    text = (FILLER * (length // len(FILLER) + 1))[:length]
+    return [text[i:i + size] for i in range(0, length, size)]
+
+
+def rescan(chunks):
+    """The old check: rescan the whole accumulated reply after every delta. Returns (per-delta seconds, per-delta results)."""
+    reply, timings, results = "", [], []
+    for chunk in chunks:
+        started = time.perf_counter()
+        reply += chunk
+        trigger_found = any(trigger in reply.lower() for trigger in CONFIRMATION_TRIGGERS)
+        day_found = any(day in reply.lower() for day in MEETING_DAYS)
+        timings.append(time.perf_counter() - started)
+        results.append((trigger_found, day_found))
+    return timings, results
+
+
+def streaming(chunks):
+    reply, scan, timings, results = "", MEETING_CONFIRMATION.scanner(), [], []
+    for chunk in chunks:
+        started = time.perf_counter()
+        reply += chunk
+        scan.feed(chunk)
+        trigger_found, day_found = scan.matched(CONFIRMATION), scan.matched(DAY)
+        timings.append(time.perf_counter() - started)
+        results.append((trigger_found, day_found))
+    return timings, results
+
+
+def tail_us(timings):
+    tail = timings[-max(1, len(timings) // 20):]  # Last 5% of deltas
+    return sum(tail) / len(tail) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lengths', type=int, nargs='+', default=[1000, 10000, 50000], help="reply length in characters")
+    parser.add_argument('--delta', type=int, default=6, help="characters per delta")
+    args = parser.parse_args()
+
+    print(f"{'chars':>7} | {'deltas':>6} | {'rescan last us':>14} | {'stream last us':>14} | "
+          f"{'rescan total ms':>15} | {'stream total ms':>15}")
+    print("-" * 88)
+    for length in args.lengths:
+        chunks = deltas(length, args.delta)
+        (old, old_results), (new, new_results) = rescan(chunks), streaming(chunks)
+        if old_results != new_results:
+            raise SystemExit(f"{length} chars: streaming results differ from the rescan")
+        print(f"{length:>7} | {len(chunks):>6} | {tail_us(old):>14.2f} | {tail_us(new):>14.2f} | "
+              f"{sum(old) * 1000:>15.2f} | {sum(new) * 1000:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
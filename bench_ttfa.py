@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Measure time-to-first-audio (TTFA) of the OpenAI greeting: cold path vs pooled.
+
+cold   - what a session without a warm pool does: connect, send session.update,
+         sleep 0.5 s, request the greeting, wait for the first response.audio.delta;
+pooled - the session was connected and configured beforehand (as UpstreamPool
+         does); only the greeting request and the first audio delta are timed.
+
+Talks to the real realtime API (OPENAI_API_KEY, or OPENAI_REALTIME_URL for
+another endpoint), so each run costs a few greeting responses.
+
+    python bench_ttfa.py [--rounds 3]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+from app import (GREETING_MESSAGE_PAYLOAD, OPENAI_HEADERS, RESPONSE_CREATE_PAYLOAD, WEBSOCKET_URL,
+                 connect_configured_openai_ws, session_prompts)
+
+
+async def first_audio(ws):
+    await ws.send(GREETING_MESSAGE_PAYLOAD)
+    await ws.send(RESPONSE_CREATE_PAYLOAD)
+    async for message in ws:
+        event = json.loads(message)
+        if event.get("type") == "response.audio.delta":
+            return
+        if event.get("type") == "error":
+            raise RuntimeError(event.get("error"))
+
+
+async def cold_ttfa():
+    started = time.perf_counter()
+    async with websockets.connect(WEBSOCKET_URL, extra_headers=OPENAI_HEADERS, ping_interval=5, ping_timeout=20) as ws:
+        await ws.send(session_prompts.get().payload)
+        await asyncio.sleep(0.5)
+        await first_audio(ws)
+        return (time.perf_counter() - started) * 1000.0
+
+
+async def pooled_ttfa():
+    ws = await connect_configured_openai_ws()  # Done by the pool before the client arrives
+    try:
+        started = time.perf_counter()
+        await first_audio(ws)
+        return (time.perf_counter() - started) * 1000.0
+    finally:
+        await ws.close()
+
+
+async def main(rounds):
+    results = {'cold': [], 'pooled': []}
+    for i in range(rounds):
+        results['cold'].append(await cold_ttfa())
+        results['pooled'].append(await pooled_ttfa())
+        print(f"round {i + 1}: cold {results['cold'][-1]:.0f} ms, pooled {results['pooled'][-1]:.0f} ms")
+    cold, pooled = statistics.median(results['cold']), statistics.median(results['pooled'])
+    print(f"median TTFA: cold {cold:.0f} ms, pooled {pooled:.0f} ms, saved {cold - pooled:.0f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=3)
+    asyncio.run(main(parser.parse_args().rounds))
@@ -0,0 +1,81 @@
+"""
+Compact record of a realtime conversation, used to resume it on a new socket.
+
+A realtime session's conversation lives upstream; when the socket drops, it is
+gone with it. ConversationLog keeps just enough to rebuild it - the role and
+text of each spoken turn, in conversation order, under the item ids the
+provider assigned - and turns it back into conversation.item.create events
+for the replacement session. Audio is not kept: replayed turns are text, which
+is all the model needs to carry on where the call left off.
+
+Items are fed from the provider's events:
+
+* conversation.item.created                         - add_item (fixes the order);
+* conversation.item.input_audio_transcription.completed - set_text (user turns);
+* response.audio_transcript.delta                   - append_text (assistant turns).
+
+Items created by the server itself as text prompts (the scripted greeting
+request) are not part of the spoken conversation and are skipped, so a resume
+never asks for the greeting again. Only the newest RESUME_MAX_ITEMS turns are
+kept.
+"""
+import collections
+import os
+
+RESUME_MAX_ITEMS = int(os.environ.get("RESUME_MAX_ITEMS", "40"))
+
+_REPLAY_CONTENT_TYPE = {'user': 'input_text', 'assistant': 'text'}
+
+
+class ConversationLog:
+    def __init__(self, max_items=RESUME_MAX_ITEMS):
+        self.max_items = max_items
+        # _items[item_id] = [role, text]; insertion order is conversation order
+        self._items = collections.OrderedDict()
+        self._seen = set()  # Every id ever added or skipped, so replayed items are not recorded twice
+
+    def __len__(self):
+        return len(self._items)
+
+    def add_item(self, item):
+        """Register a conversation.item.created item (ignores control prompts and items already seen)."""
+        item_id = item.get('id')
+        if not item_id or item_id in self._seen:
+            return
+        self._seen.add(item_id)
+        role = item.get('role')
+        if item.get('type') != 'message' or role not in _REPLAY_CONTENT_TYPE:
+            return
+        content = item.get('content') or []
+        if role == 'user' and any(part.get('type') == 'input_text' for part in content):
+            return  # A prompt the server sent (e.g. the greeting request), not something the advisor said
+        self._items[item_id] = [role, ""]
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def set_text(self, item_id, text):
+        entry = self._items.get(item_id)
+        if entry is not None and text:
+            entry[1] = text.strip()
+
+    def append_text(self, item_id, text):
+        entry = self._items.get(item_id)
+        if entry is not None and text:
+            entry[1] += text
+
+    def replay_events(self):
+        """conversation.item.create events that rebuild the conversation (same ids, text content)."""
+        events = []
+        for item_id, (role, text) in self._items.items():
+            if not text.strip():
+                continue
+            events.append({
+                "type": "conversation.item.create",
+                "item": {
+                    "id": item_id,
+                    "type": "message",
+                    "role": role,
+                    "content": [{"type": _REPLAY_CONTENT_TYPE[role], "text": text.strip()}],
+                },
+            })
+        return events
@@ -0,0 +1,161 @@
+"""
+Retrieval over the ETF knowledge corpus (corpus.txt).
+
+The session instructions used to embed all of corpus.txt, so every call paid
+for the whole document in its prompt and the prompt grew with the corpus.
+Here the corpus is split into passages - the CGUS deep dive, one passage per
+fund entry, and one per FAQ/reference bullet - and indexed with BM25 in NumPy.
+The realtime session gets a `search_etf_knowledge` function tool instead of
+the text, and each call returns only the top passages for the question.
+
+The index is a dense (terms x passages) matrix of precomputed BM25 weights,
+so a query is a row gather and a column sum: well under a millisecond for a
+corpus this size (see bench_retrieval.py).
+"""
+import collections
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "3"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+TICKER_BOOST = 5.0  # Added to passages about a fund the query names by ticker
+
+# section: the heading path the passage sits under; ticker: fund symbol when the passage is about one fund
+Passage = collections.namedtuple('Passage', ['id', 'title', 'section', 'ticker', 'text'])
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me of on or our that the their them "
+    "they this to was what when where which who why will with you your".split())
+_CITATION_RE = re.compile(r"\s*\(\[[^\]]+\]\[\d+\]\)")  # "([CapitalGroup NACG][1])" source markers
+_HEADING_RE = re.compile(r"^(#{1,3})\s+(.+)$")
+_FUND_ENTRY_RE = re.compile(r"^\*\*([A-Z]{3,5})\s+[—-]\s+(.+?)\*\*\s*$")
+_BULLET_RE = re.compile(r"^\*\s+(.+)$")
+_TICKER_IN_TITLE_RE = re.compile(r"\(([A-Z]{3,5})\)")
+
+SEARCH_TOOL = {
+    "type": "function",
+    "name": "search_etf_knowledge",
+    "description": "Search the Capital Group ETF knowledge base (objectives, expense ratios, yields, returns, "
+                   "launch dates, positioning FAQs). Call it before quoting any fund fact or number.",
+    "parameters": {
+        "type": "object",
+        "properties": {"query": {"type": "string", "description": "The question or fund (ticker or name) to look up."}},
+        "required": ["query"],
+    },
+}
+
+
+def _stem(token):
+    # Plural folding only ("returns" -> "return", "etfs" -> "etf"); enough for a fund fact sheet
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss') and not token[-2].isdigit():
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def passage_tokens(passage):
+    return tokenize(f"{passage.title} {passage.text}")
+
+
+def split_corpus(text):
+    """Split corpus.txt into passages: one per heading section, fund entry and top-level bullet."""
+    passages = []
+    headings = []  # (level, title)
+    current = None  # [title, ticker, lines]
+
+    def close():
+        if current is not None:
+            body = "\n".join(line for line in current[2] if line).strip()
+            if body:
+                section = " / ".join(title for _, title in headings)
+                passages.append(Passage(len(passages), current[0], section, current[1], body))
+
+    for raw in text.splitlines():
+        line = _CITATION_RE.sub("", raw).rstrip()
+        if not line.strip() or line.strip() == "---":
+            continue
+        heading = _HEADING_RE.match(line)
+        fund = _FUND_ENTRY_RE.match(line)
+        bullet = _BULLET_RE.match(line)
+        if heading:
+            close()
+            level, title = len(heading.group(1)), heading.group(2).strip()
+            headings = [h for h in headings if h[0] < level] + [(level, title)]
+            ticker = _TICKER_IN_TITLE_RE.search(title)
+            current = [title, ticker.group(1) if ticker else None, []]
+        elif fund:
+            close()
+            current = [f"{fund.group(1)} — {fund.group(2).strip()}", fund.group(1), [line]]
+        elif bullet:
+            close()
+            current = [bullet.group(1).replace("*", "").strip(), None, [line]]
+        else:
+            if current is None:
+                current = ["Overview", None, []]
+            current[2].append(line.strip())
+    close()
+    return passages
+
+
+class CorpusIndex:
+    """BM25 index over corpus passages (tokens: passage_tokens() of each passage, when already computed)."""
+
+    def __init__(self, passages, tokens=None, k1=BM25_K1, b=BM25_B):
+        self.passages = list(passages)
+        self.vocab = {}
+        self._by_ticker = {}
+        for i, p in enumerate(self.passages):
+            if p.ticker:
+                self._by_ticker.setdefault(_stem(p.ticker.lower()), []).append(i)
+        tokenized = tokens if tokens is not None else [passage_tokens(p) for p in self.passages]
+        for tokens in tokenized:
+            for token in tokens:
+                self.vocab.setdefault(token, len(self.vocab))
+        tf = np.zeros((len(self.vocab), len(self.passages)), dtype=np.float32)
+        for j, tokens in enumerate(tokenized):
+            for token in tokens:
+                tf[self.vocab[token], j] += 1.0
+        n = max(len(self.passages), 1)
+        doc_len = tf.sum(axis=0)
+        avg_len = float(doc_len.mean()) if len(self.passages) else 1.0
+        df = (tf > 0).sum(axis=1)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1.0 - b + b * doc_len / (avg_len or 1.0))
+        # Row t holds term t's BM25 contribution to every passage
+        self.weights = idf[:, None] * tf * (k1 + 1.0) / (tf + norm[None, :])
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(split_corpus(text))
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Top-k (passage, score) for a free-text query; empty when no query term is in the corpus."""
+        tokens = set(tokenize(query))
+        rows = sorted(self.vocab[t] for t in tokens if t in self.vocab)
+        if not rows or not self.passages:
+            return []
+        scores = self.weights[rows].sum(axis=0)
+        for token in tokens & self._by_ticker.keys():
+            scores[self._by_ticker[token]] += TICKER_BOOST
+        k = min(k, len(self.passages))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.passages[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def tool_result(self, arguments):
+        """JSON output for a search_etf_knowledge call (arguments: the decoded call arguments)."""
+        started = time.perf_counter()
+        hits = self.search(str(arguments.get("query", "")))
+        return json.dumps({
+            "passages": [{"title": p.title, "section": p.section, "text": p.text} for p, _ in hits],
+            "search_ms": round((time.perf_counter() - started) * 1000.0, 3),
+        })
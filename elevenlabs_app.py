@@ -6,8 +6,8 @@ import os
 import base64
 import traceback
 import logging
+import time
 import threading
-from queue import Queue
 import re
 import boto3
 from botocore.exceptions import ClientError
@@ -17,6 +17,24 @@ import uuid
 from flask import Flask, render_template, request, send_from_directory
 from flask_socketio import SocketIO, emit
 
+from audio_transport import client_audio_to_bytes, upstream_b64_to_pcm, client_audio_payload, parse_client_sample_rate
+from session_runtime import SessionRuntime, build_session_runtime
+from session_reaper import client_session_reaper
+from trigger_matcher import CONFIRMATION, DAY, MEETING_CONFIRMATION
+from admission import REJECTED, AdmissionController
+from audio_queue import BoundedAudioQueue
+from voice_gate import VoiceActivityGate, VOICE_GATE_ENABLED
+from resampler import PolyphaseResampler
+from audio_coalescer import AudioCoalescer
+from audio_pacer import OutboundAudioPacer
+from message_bus import socketio_queue_options
+from sticky_router import tag_worker_sids
+from realtime_metrics import metrics
+from event_dispatcher import EventDispatcher, events_snapshot
+import json_codec
+from json_codec import ELEVENLABS_AUDIO_CHUNK
+from session_recorder import recorder
+
 # --- Configure Logging ---
 logging.basicConfig(
     level=logging.INFO,
@@ -48,6 +66,14 @@ VOICE_SETTINGS = {
 
 # WebSocket endpoint
 ELEVENLABS_WS_URL = "wss://api.elevenlabs.io/v1/convai/conversation"
+# Agent audio formats; the server confirms/overrides them in conversation_initiation_metadata
+INPUT_SAMPLE_RATE = 16000  # Agent is configured for pcm_16000 user audio
+OUTPUT_SAMPLE_RATE = 16000  # ...and pcm_16000 agent audio
+
+def pcm_format_rate(audio_format):
+    """Sample rate from an ElevenLabs audio format string like 'pcm_16000' (None if not PCM)."""
+    match = re.fullmatch(r'pcm_(\d+)', audio_format or '')
+    return int(match.group(1)) if match else None
 
 # --- AWS SES Configuration (Same as existing demo) ---
 AWS_ACCESS_KEY = "YOUR_AWS_ACCESS_KEY"
@@ -246,94 +272,47 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 async_mode = "threading"
 log.info(f"Using {async_mode} async_mode for Flask-SocketIO")
-socketio = SocketIO(app, async_mode=async_mode, cors_allowed_origins="*")
+# SOCKETIO_MESSAGE_QUEUE selects the cross-worker bus when running behind sticky_router.py
+socketio = SocketIO(app, async_mode=async_mode, cors_allowed_origins="*", **socketio_queue_options())
+WORKER_INDEX = os.environ.get("WORKER_INDEX")
+if WORKER_INDEX is not None:
+    tag_worker_sids(socketio.server, WORKER_INDEX)  # Lets the sticky router route this worker's sessions back to it
+PORT = int(os.environ.get("PORT", "5051"))
 
-# --- Dedicated Asyncio Loop Setup ---
-task_queue = Queue()
-asyncio_loop = None
-asyncio_thread = None
-clients = {}  # Structure: clients[sid] = {'client_connected': bool}
+# --- Client State ---
+clients = {}  # Structure: clients[sid] = {'client_connected': bool, 'binary_audio': bool, 'input_sample_rate': int}
 
-def run_asyncio_loop(loop):
-    log.info("ElevenLabs Asyncio thread started.")
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(process_tasks_from_queue())
-    except Exception as e:
-        log.error(f"Exception in asyncio loop's main task: {e}")
-        log.error(traceback.format_exc())
-    finally:
-        log.info("ElevenLabs Asyncio loop stopping...")
-        try:
-            tasks = asyncio.all_tasks(loop=loop)
-            for task in tasks:
-                if not task.done(): task.cancel()
-            if tasks: loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
-            loop.run_until_complete(loop.shutdown_asyncgens())
-        except Exception as e: log.error(f"Error during asyncio loop cleanup: {e}")
-        finally: loop.close(); log.info("ElevenLabs Asyncio loop closed.")
-
-def start_asyncio_thread():
-    global asyncio_loop, asyncio_thread
-    if asyncio_thread is None or not asyncio_thread.is_alive():
-        asyncio_loop = asyncio.new_event_loop()
-        asyncio_thread = threading.Thread(target=run_asyncio_loop, args=(asyncio_loop,), name="ElevenLabsAsyncioThread", daemon=True)
-        asyncio_thread.start()
-        log.info("ElevenLabs dedicated asyncio thread started.")
-
-# --- Background Task Runner (Runs in Asyncio Thread) ---
-async def process_tasks_from_queue():
-    log.info("ElevenLabs Asyncio task processor started.")
-    elevenlabs_sessions = {}  # Structure: elevenlabs_sessions[sid] = {'task': Future, 'input_queue': asyncio.Queue}
-
-    while True:
-        try:
-            item = await asyncio_loop.run_in_executor(None, task_queue.get)
-            if item is None: log.info("Task processor stop signal. Shutting down..."); break
-            action = item.get('action'); sid = item.get('sid')
-            if not sid: log.warning("Task without SID."); task_queue.task_done(); continue
-
-            if action == 'start':
-                if clients.get(sid, {}).get('client_connected') and (sid not in elevenlabs_sessions or elevenlabs_sessions[sid]['task'].done()):
-                    log.info(f"[{sid}] 'start', launching ElevenLabs task.")
-                    client_async_input_queue = asyncio.Queue()
-                    task_future = asyncio.create_task(elevenlabs_session_task(sid, client_async_input_queue))
-                    elevenlabs_sessions[sid] = {'task': task_future, 'input_queue': client_async_input_queue}
-                elif sid in elevenlabs_sessions and not elevenlabs_sessions[sid]['task'].done(): log.warning(f"[{sid}] 'start' received, task active.")
-                else: log.warning(f"[{sid}] 'start', client '{sid}' not connected.")
-            elif action == 'stop':
-                 if sid in elevenlabs_sessions:
-                     log.info(f"[{sid}] 'stop', signalling task.")
-                     session_data = elevenlabs_sessions[sid]
-                     session_data['input_queue'].put_nowait(None)
-                     del elevenlabs_sessions[sid]
-                 else: log.warning(f"[{sid}] 'stop' received, no active session.")
-            elif action == 'audio':
-                 if sid in elevenlabs_sessions:
-                     session_data = elevenlabs_sessions[sid]
-                     if not session_data['task'].done():
-                         audio_data = item.get('data')
-                         if audio_data: session_data['input_queue'].put_nowait(audio_data)
-            task_queue.task_done()
-        except Exception as e: log.error(f"Error in ElevenLabs task processor: {e}\n{traceback.format_exc()}")
-    log.info("ElevenLabs task processor finished. Cleaning up sessions...");
-    for sid, session_data in list(elevenlabs_sessions.items()):
-         log.warning(f"[{sid}] Cancelling remaining session task on processor exit.")
-         session_data['task'].cancel()
-         del elevenlabs_sessions[sid]
-    log.info("ElevenLabs processor cleanup complete.")
+def client_input_rate(sid):
+    """Capture sample rate reported by the client's page (defaults to the provider rate)."""
+    return clients.get(sid, {}).get('input_sample_rate', INPUT_SAMPLE_RATE)
+
+def emit_to_client(event, data, room):
+    """Socket.IO emit used by session coroutines; worker-process shards swap in a forward to the parent."""
+    socketio.emit(event, data, room=room)
 
 # --- ElevenLabs Session Task ---
 async def elevenlabs_session_task(sid, client_async_input_queue):
     log.info(f"[{sid}] ElevenLabs task {id(asyncio.current_task())} started.")
+    task_started = time.monotonic()
     elevenlabs_ws = None
     is_connected_to_elevenlabs = False
+    session_metrics = metrics.session(sid)
+    session_events = recorder.session(sid, "elevenlabs") # Transcripts, turns and triggers, written off the event loop
+    capture_sample_rate = client_input_rate(sid)
+    input_resampler = PolyphaseResampler(capture_sample_rate, INPUT_SAMPLE_RATE)
 
     def safe_emit(event, data, room):
         if clients.get(sid, {}).get('client_connected', False):
-            try: socketio.emit(event, data, room=room)
+            try: emit_to_client(event, data, room=room)
             except Exception as e: log.warning(f"[{sid}] Error emitting '{event}': {e}")
 
+    def emit_audio_packet(pcm, sample_rate):
+        binary_audio = clients.get(sid, {}).get('binary_audio', False)
+        safe_emit('audio_response', client_audio_payload(pcm, sample_rate, binary_audio), room=sid)
+
+    # Re-frames agent audio events into fixed-size, paced 'audio_response' packets
+    output_pacer = OutboundAudioPacer(emit_audio_packet, OUTPUT_SAMPLE_RATE, provider="elevenlabs", session_metrics=session_metrics)
+
     try:
         log.info(f"[{sid}] Connecting to ElevenLabs Conversational AI...")
         
@@ -366,101 +345,132 @@ async def elevenlabs_session_task(sid, client_async_input_queue):
             async def receive_from_elevenlabs():
                 nonlocal is_connected_to_elevenlabs
                 current_assistant_response = ""
+                confirmation_scan = MEETING_CONFIRMATION.scanner() # Trigger state over current_assistant_response, fed per message
                 email_sent = False
-                
+
+                # Upstream event type -> handler (counts and handler time per type at /api/metrics under events.elevenlabs)
+                dispatcher = EventDispatcher("elevenlabs")
+                @dispatcher.on("conversation_initiation_metadata")
+                async def on_conversation_initiation_metadata(server_event):
+                    nonlocal input_resampler
+                    log.info(f"[{sid}] ElevenLabs Conversation Initiated.")
+                    # Follow the agent's actual audio formats instead of assuming 16kHz
+                    metadata = server_event.get('conversation_initiation_metadata_event', {})
+                    agent_input_rate = pcm_format_rate(metadata.get('user_input_audio_format'))
+                    agent_output_rate = pcm_format_rate(metadata.get('agent_output_audio_format'))
+                    if agent_input_rate and agent_input_rate != input_resampler.out_rate:
+                        log.info(f"[{sid}] Agent expects {agent_input_rate} Hz input; resampling {capture_sample_rate} -> {agent_input_rate}")
+                        input_resampler = PolyphaseResampler(capture_sample_rate, agent_input_rate)
+                    if agent_output_rate:
+                        output_pacer.sample_rate = agent_output_rate
+                    session_events.record('session_start', conversation_id=metadata.get('conversation_id'),
+                                          input_rate=agent_input_rate, output_rate=agent_output_rate)
+                    safe_emit('status_update', {'message': 'ElevenLabs Conversation Started - Speak now!'}, room=sid)
+                @dispatcher.on("audio")
+                async def on_audio(server_event):
+                    # Agent audio response from ElevenLabs
+                    audio_event = server_event.get('audio_event', {})
+                    audio_data = audio_event.get('audio_base_64') or audio_event.get('audio')
+                    if audio_data:
+                        # Sample rate follows the agent's output format (pcm_16000 by default)
+                        log.debug(f"[{sid}] Buffering audio chunk, length: {len(audio_data)}, sample_rate: {output_pacer.sample_rate}")
+                        output_pacer.push(upstream_b64_to_pcm(audio_data))
+                    else:
+                        log.warning(f"[{sid}] Audio event without audio data: {audio_event.keys()}")
+                @dispatcher.on("agent_response")
+                async def on_agent_response(server_event):
+                    nonlocal current_assistant_response
+                    # Agent response with potential transcript
+                    agent_response_event = server_event.get('agent_response_event', {})
+                    agent_text = agent_response_event.get('agent_response', '')
+                    if agent_text:
+                        log.debug(f"[{sid}] Agent transcript: '{agent_text}'")
+                        session_events.record('agent_response', text=agent_text)
+                        current_assistant_response += " " + agent_text
+                        confirmation_scan.feed(" " + agent_text)
+                        safe_emit('response_text_update', {'text': agent_text, 'is_final': False}, room=sid)
+
+                    # Check for audio in agent_response
+                    audio_data = server_event.get('audio_event', {}).get('audio_base_64')
+                    if audio_data:
+                        log.debug(f"[{sid}] Buffering agent_response audio chunk, length: {len(audio_data)}")
+                        output_pacer.push(upstream_b64_to_pcm(audio_data))
+                @dispatcher.on("user_transcript")
+                async def on_user_transcript(server_event):
+                    # User speech transcript
+                    text = server_event.get('message')
+                    if text:
+                        log.debug(f"[{sid}] User said: '{text}'")
+                        session_events.record('user_transcript', text=text)
+                        safe_emit('transcript_update', {'text': text, 'is_final': True}, room=sid)
+                @dispatcher.on("agent_transcript")
+                async def on_agent_transcript(server_event):
+                    nonlocal current_assistant_response, email_sent
+                    # Agent speech transcript
+                    text = server_event.get('message')
+                    if text:
+                        log.debug(f"[{sid}] Assistant said: '{text}'")
+                        session_events.record('agent_transcript', text=text)
+                        current_assistant_response += " " + text
+                        safe_emit('response_text_update', {'text': text, 'is_final': False}, room=sid)
+
+                        # Check for meeting confirmation (only the new text is scanned)
+                        confirmation_scan.feed(" " + text)
+                        if not email_sent and confirmation_scan.matched(CONFIRMATION):
+                            if confirmation_scan.matched(DAY):
+                                log.info(f"[{sid}] Meeting confirmed - sending email!")
+                                email_sent = True
+
+                                # Parse meeting details and send email
+                                meeting_info = parse_meeting_details(current_assistant_response)
+                                log.info(f"[{sid}] Parsed meeting info: {meeting_info}")
+                                session_events.record('meeting_confirmed', trigger='immediate', meeting=meeting_info, text=current_assistant_response)
+
+                                # Send email in background thread
+                                def send_email_async():
+                                    try:
+                                        email_success = send_plain_email(meeting_info, current_assistant_response)
+                                        session_events.record('meeting_confirmation_sent', trigger='immediate', email_sent=email_success)
+                                        if email_success:
+                                            log.info(f"[{sid}] ElevenLabs email sent successfully!")
+                                        else:
+                                            log.error(f"[{sid}] Failed to send ElevenLabs email")
+                                    except Exception as e:
+                                        log.error(f"[{sid}] Error sending ElevenLabs email: {e}")
+
+                                email_thread = threading.Thread(target=send_email_async, daemon=True)
+                                email_thread.start()
+                @dispatcher.on("interruption")
+                async def on_interruption(server_event):
+                    nonlocal current_assistant_response
+                    log.debug(f"[{sid}] ElevenLabs speech interruption.")
+                    # The agent already stopped and truncated its turn server-side; just drop what we still hold
+                    played_ms, unplayed_ms = output_pacer.barge_in()
+                    session_events.record('barge_in', played_ms=int(played_ms), unplayed_ms=int(unplayed_ms))
+                    session_metrics.incr('barge_ins')
+                    session_metrics.incr('barge_in_truncated_ms', int(unplayed_ms))
+                    safe_emit('interrupt_playback', {}, room=sid)
+                    current_assistant_response = ""
+                    confirmation_scan.reset()
+                @dispatcher.on("ping")
+                async def on_ping(server_event):
+                    # Respond to ping
+                    log.debug(f"[{sid}] Responding to ElevenLabs ping")
+                    await elevenlabs_ws.send(json.dumps({"type": "pong"}))
+                @dispatcher.on("error")
+                async def on_error(server_event):
+                    log.error(f"[{sid}] ElevenLabs Error Event: {server_event}")
+                    err_msg = f"ElevenLabs Error: {server_event.get('message', 'Unknown')}"
+                    safe_emit('error_message', {'message': err_msg}, room=sid)
+                async def on_other_event(server_event):
+                    log.debug(f"[{sid}] ElevenLabs Event: {server_event.get('type')} - Data keys: {list(server_event.keys())}")
+                dispatcher.fallback = on_other_event
+
                 try:
                     async for message in elevenlabs_ws:
                         if not clients.get(sid, {}).get('client_connected', False): break
                         try:
-                            server_event = json.loads(message)
-                            event_type = server_event.get("type")
-                            
-                            log.info(f"[{sid}] ElevenLabs Event: {event_type} - Data keys: {list(server_event.keys())}")
-
-                            if event_type == "conversation_initiation_metadata":
-                                log.info(f"[{sid}] ElevenLabs Conversation Initiated.")
-                                safe_emit('status_update', {'message': 'ElevenLabs Conversation Started - Speak now!'}, room=sid)
-                            elif event_type == "audio":
-                                # Agent audio response from ElevenLabs
-                                audio_event = server_event.get('audio_event', {})
-                                audio_data = audio_event.get('audio_base_64') or audio_event.get('audio')
-                                # Log the audio_event structure to understand ElevenLabs format
-                                log.info(f"[{sid}] Audio event keys: {list(audio_event.keys())}")
-                                # ElevenLabs Conversational AI uses 16000 Hz for pcm_16000 format
-                                sample_rate = 16000  # ElevenLabs conversational AI default
-                                if audio_data:
-                                    log.info(f"[{sid}] Sending audio chunk, length: {len(audio_data)}, sample_rate: {sample_rate}")
-                                    safe_emit('audio_response', {'audio': audio_data, 'sample_rate': sample_rate}, room=sid)
-                                else:
-                                    log.warning(f"[{sid}] Audio event without audio data: {audio_event.keys()}")
-                            elif event_type == "agent_response":
-                                # Agent response with potential transcript
-                                log.info(f"[{sid}] Agent response event received")
-                                agent_response_event = server_event.get('agent_response_event', {})
-                                agent_text = agent_response_event.get('agent_response', '')
-                                if agent_text:
-                                    log.info(f"[{sid}] Agent transcript: '{agent_text}'")
-                                    current_assistant_response += " " + agent_text
-                                    safe_emit('response_text_update', {'text': agent_text, 'is_final': False}, room=sid)
-                                
-                                # Check for audio in agent_response
-                                audio_data = server_event.get('audio_event', {}).get('audio_base_64')
-                                if audio_data:
-                                    log.info(f"[{sid}] Sending agent_response audio chunk, length: {len(audio_data)}")
-                                    safe_emit('audio_response', {'audio': audio_data, 'sample_rate': 16000}, room=sid)
-                            elif event_type == "user_transcript":
-                                # User speech transcript
-                                text = server_event.get('message')
-                                if text:
-                                    log.info(f"[{sid}] User said: '{text}'")
-                                    safe_emit('transcript_update', {'text': text, 'is_final': True}, room=sid)
-                            elif event_type == "agent_transcript":
-                                # Agent speech transcript
-                                text = server_event.get('message')
-                                if text:
-                                    log.info(f"[{sid}] Assistant said: '{text}'")
-                                    current_assistant_response += " " + text
-                                    safe_emit('response_text_update', {'text': text, 'is_final': False}, room=sid)
-                                    
-                                    # Check for meeting confirmation
-                                    confirmation_triggers = ["perfect", "great", "we're set", "confirmed", "scheduled for"]
-                                    meeting_days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
-                                    
-                                    if not email_sent and any(trigger in current_assistant_response.lower() for trigger in confirmation_triggers):
-                                        if any(day in current_assistant_response.lower() for day in meeting_days):
-                                            log.info(f"[{sid}] Meeting confirmed - sending email!")
-                                            email_sent = True
-                                            
-                                            # Parse meeting details and send email
-                                            meeting_info = parse_meeting_details(current_assistant_response)
-                                            log.info(f"[{sid}] Parsed meeting info: {meeting_info}")
-                                            
-                                            # Send email in background thread
-                                            def send_email_async():
-                                                try:
-                                                    email_success = send_plain_email(meeting_info, current_assistant_response)
-                                                    if email_success:
-                                                        log.info(f"[{sid}] ElevenLabs email sent successfully!")
-                                                    else:
-                                                        log.error(f"[{sid}] Failed to send ElevenLabs email")
-                                                except Exception as e:
-                                                    log.error(f"[{sid}] Error sending ElevenLabs email: {e}")
-                                            
-                                            import threading
-                                            email_thread = threading.Thread(target=send_email_async, daemon=True)
-                                            email_thread.start()
-                            elif event_type == "interruption":
-                                log.info(f"[{sid}] ElevenLabs speech interruption.")
-                                safe_emit('interrupt_playback', {}, room=sid)
-                                current_assistant_response = ""
-                            elif event_type == "ping":
-                                # Respond to ping
-                                log.info(f"[{sid}] Responding to ElevenLabs ping")
-                                await elevenlabs_ws.send(json.dumps({"type": "pong"}))
-                            elif event_type == "error":
-                                log.error(f"[{sid}] ElevenLabs Error Event: {server_event}")
-                                err_msg = f"ElevenLabs Error: {server_event.get('message', 'Unknown')}"
-                                safe_emit('error_message', {'message': err_msg}, room=sid)
+                            await dispatcher.dispatch(json_codec.loads(message))
                         except json.JSONDecodeError:
                             log.warning(f"[{sid}] ElevenLabs non-JSON: {message[:200]}")
                         except Exception as e:
@@ -475,30 +485,30 @@ async def elevenlabs_session_task(sid, client_async_input_queue):
                     log.info(f"[{sid}] ElevenLabs receive loop finished.")
 
             async def send_to_elevenlabs():
+                # Merge queued backlog into one user_audio_chunk per batch (never waits for more audio)
+                coalescer = AudioCoalescer(client_async_input_queue, capture_sample_rate, provider="elevenlabs", session_metrics=session_metrics)
                 try:
                     while True:
                         if not clients.get(sid, {}).get('client_connected', False): break
-                        base64_audio = await client_async_input_queue.get()
-                        if base64_audio is None: client_async_input_queue.task_done(); break
+                        pcm_audio, frames = await coalescer.next_batch()
+                        if pcm_audio is None: break
                         try:
                             if not is_connected_to_elevenlabs: log.warning(f"[{sid}] ElevenLabs WS disconnected, cannot send."); break
-                            # Correct format for ElevenLabs user audio input
-                            event = {
-                                "type": "user_audio_chunk",
-                                "user_audio_chunk": base64_audio
-                            }
-                            log.info(f"[{sid}] Sending audio to ElevenLabs, length: {len(base64_audio)}")
-                            if elevenlabs_ws and elevenlabs_ws.open: await elevenlabs_ws.send(json.dumps(event))
+                            # user_audio_chunk frame: resampled to the agent rate, base64 spliced into the frame template
+                            frame = ELEVENLABS_AUDIO_CHUNK.encode(input_resampler.process(pcm_audio))
+                            log.debug(f"[{sid}] Sending audio to ElevenLabs, length: {len(pcm_audio)}, frames: {frames}")
+                            if elevenlabs_ws and elevenlabs_ws.open: await elevenlabs_ws.send(frame)
                             else: log.warning(f"[{sid}] ElevenLabs WS closed state? Cannot send."); break
                         except Exception as send_err: log.error(f"[{sid}] Error sending to ElevenLabs: {send_err}"); break
-                        finally: client_async_input_queue.task_done()
                 except asyncio.CancelledError: log.info(f"[{sid}] ElevenLabs send task cancelled.")
                 except Exception as e: log.error(f"[{sid}] Error in ElevenLabs send loop: {e}\n{traceback.format_exc()}")
                 finally: log.info(f"[{sid}] ElevenLabs send loop finished.")
 
             recv_task = asyncio.create_task(receive_from_elevenlabs())
             send_task = asyncio.create_task(send_to_elevenlabs())
+            pacer_task = asyncio.create_task(output_pacer.run())
             done, pending = await asyncio.wait([recv_task, send_task], return_when=asyncio.FIRST_COMPLETED)
+            pending.add(pacer_task)
             for task in pending: task.cancel()
             if pending: await asyncio.gather(*pending, return_exceptions=True)
 
@@ -511,21 +521,68 @@ async def elevenlabs_session_task(sid, client_async_input_queue):
         safe_emit('error_message', {'message': 'Server error connecting to ElevenLabs'}, room=sid)
     finally:
         log.info(f"[{sid}] ElevenLabs session task {id(asyncio.current_task())} finishing.")
+        session_events.record('session_end', duration_s=round(time.monotonic() - task_started, 1))
         is_connected_to_elevenlabs = False
         if elevenlabs_ws and elevenlabs_ws.open:
              await elevenlabs_ws.close()
              log.info(f"[{sid}] Closed ElevenLabs WS.")
         if sid in clients: clients[sid]['client_connected'] = False
+        metrics.drop_session(sid)
+
+# --- Session Runtime (sharded asyncio loop threads or worker processes) ---
+def make_session_shard(index, forward_emit=None):
+    global emit_to_client
+    if forward_emit is not None:
+        emit_to_client = forward_emit  # Worker process: emits go back to the parent's Socket.IO server
+        recorder.start("elevenlabs", shard=index)  # The parent's writer thread does not survive the fork
+    return SessionRuntime(
+        lambda sid, input_queue, **options: elevenlabs_session_task(sid, input_queue),
+        is_client_connected=lambda sid: clients.get(sid, {}).get('client_connected', False),
+        name=f"ElevenLabsAsyncioThread-{index}",
+        # Bounded by buffered duration; policy via INPUT_QUEUE_POLICY (block | drop_oldest | drop_to_latest)
+        queue_factory=lambda sid: BoundedAudioQueue(
+            client_input_rate(sid), session_metrics=metrics.session(sid),
+            gate=VoiceActivityGate(client_input_rate(sid), session_metrics=metrics.session(sid)) if VOICE_GATE_ENABLED else None),
+    )
+
+def apply_worker_client_state(sid, state):
+    """Mirror a client's state into a worker process (None once the session is stopped)."""
+    if state is None: clients.pop(sid, None)
+    else: clients[sid] = state
+
+def notify_queue_position(sid, data):
+    emit_to_client('queue_position', data, room=sid)
+
+# Caps concurrent sessions (MAX_CONCURRENT_SESSIONS / ELEVENLABS_MAX_SESSIONS); the rest wait in a FIFO queue
+admission = AdmissionController(lambda sid, provider: session_runtime.start_session(sid), notify_queue_position)
+
+session_runtime = build_session_runtime(
+    make_session_shard,
+    on_emit=lambda event, data, room: socketio.emit(event, data, room=room),
+    client_state=lambda sid: dict(clients.get(sid, {})),
+    apply_client_state=apply_worker_client_state,
+    on_session_done=admission.session_done,  # Frees the admission slot once the session task has ended
+    name="ElevenLabsAsyncioThread",
+)
+
+# Releases clients and sessions that outlive SESSION_IDLE_TIMEOUT_S / SESSION_MAX_LIFETIME_S without a clean disconnect
+session_reaper = client_session_reaper(clients, session_runtime, lambda sid: socketio.server.disconnect(sid), name="elevenlabs.sessions")
 
 # --- Flask Routes & SocketIO Handlers ---
 @app.route('/')
 def index(): 
     return render_template('elevenlabs_index.html')
 
+@app.route('/api/metrics')
+def get_metrics():
+    return {**metrics.snapshot(), 'admission': admission.snapshot(), 'events': events_snapshot(),
+            'recorder': recorder.snapshot()}
+
 @socketio.on('connect')
 def handle_connect():
     sid = request.sid; log.info(f"ElevenLabs Client connected: {sid}")
     clients[sid] = { 'client_connected': True }
+    session_reaper.touch(sid)
     emit('status_update', {'message': 'Connected to ElevenLabs Server'})
 
 @socketio.on('disconnect')
@@ -533,8 +590,9 @@ def handle_disconnect(*args):
     sid = request.sid; log.info(f"ElevenLabs Client disconnected: {sid}")
     if sid in clients:
         clients[sid]['client_connected'] = False
-        log.info(f"[{sid}] Putting 'stop' action on ElevenLabs task queue for disconnect.")
-        task_queue.put({'action': 'stop', 'sid': sid})
+        log.info(f"[{sid}] Sending 'stop' to ElevenLabs session runtime for disconnect.")
+        session_runtime.stop_session(sid)
+        admission.release(sid)
         del clients[sid]
         log.info(f"[{sid}] ElevenLabs client state removed.")
     else:
@@ -545,8 +603,14 @@ def handle_start_stream(data):
     sid = request.sid; log.info(f"[{sid}] Received ElevenLabs start_stream event.")
     if sid in clients:
         clients[sid]['client_connected'] = True
-        log.info(f"[{sid}] Putting 'start' action on ElevenLabs task queue.")
-        task_queue.put({'action': 'start', 'sid': sid})
+        session_reaper.touch(sid)
+        # Clients opt into raw PCM16 binary frames; older pages keep sending base64 strings
+        clients[sid]['binary_audio'] = bool((data or {}).get('binary_audio', False))
+        # Pages capture at the browser's native rate; the server resamples to the provider rate
+        clients[sid]['input_sample_rate'] = parse_client_sample_rate((data or {}).get('sample_rate'), INPUT_SAMPLE_RATE)
+        log.info(f"[{sid}] Requesting admission for ElevenLabs session.")
+        if admission.request(sid, "elevenlabs") == REJECTED:
+            emit('error_message', {'message': 'Server is busy, please try again in a moment.'})
     else:
         log.warning(f"[{sid}] 'start_stream' for unknown ElevenLabs client.")
 
@@ -555,8 +619,10 @@ def handle_stop_stream():
     sid = request.sid; log.info(f"[{sid}] Received ElevenLabs stop_stream event (user ended session).")
     if sid in clients:
         clients[sid]['client_connected'] = False
-        log.info(f"[{sid}] Putting 'stop' action on ElevenLabs task queue due to user stop.")
-        task_queue.put({'action': 'stop', 'sid': sid})
+        session_reaper.touch(sid)
+        log.info(f"[{sid}] Sending 'stop' to ElevenLabs session runtime due to user stop.")
+        admission.cancel(sid)  # Still queued: just leave the queue
+        session_runtime.stop_session(sid)
     else:
         log.warning(f"[{sid}] 'stop_stream' for unknown ElevenLabs client.")
 
@@ -564,26 +630,27 @@ def handle_stop_stream():
 def handle_audio_chunk(data):
     sid = request.sid
     if sid in clients and clients[sid].get('client_connected', False):
-        audio_b64 = data.get('audio')
-        if audio_b64:
-            log.info(f"[{sid}] Received audio chunk from client, length: {len(audio_b64)}")
-            task_queue.put({'action': 'audio', 'sid': sid, 'data': audio_b64})
+        session_reaper.touch(sid)
+        pcm_audio = client_audio_to_bytes(data.get('audio'))
+        if pcm_audio:
+            log.debug(f"[{sid}] Received audio chunk from client, length: {len(pcm_audio)}")
+            session_runtime.push_audio(sid, pcm_audio)
 
 # --- Main Execution ---
 if __name__ == '__main__':
     log.info("Starting ElevenLabs Flask-SocketIO server...")
     if not ELEVENLABS_API_KEY: log.critical("CRITICAL: ELEVENLABS_API_KEY missing!")
     else:
-        start_asyncio_thread()
+        session_runtime.start()
+        session_reaper.start()
+        recorder.start("elevenlabs")
         log.info(f"Starting ElevenLabs server with async_mode='{async_mode}'...")
         # Run on port 5051 to avoid conflict with existing demo
-        socketio.run(app, host='0.0.0.0', port=5051, debug=True, use_reloader=False, log_output=True)
+        socketio.run(app, host='0.0.0.0', port=PORT, debug=True, use_reloader=False, log_output=True)
         # --- Cleanup ---
         log.info("ElevenLabs Flask server shutting down...")
-        task_queue.put(None)
-        if asyncio_thread and asyncio_thread.is_alive():
-             log.info("Waiting for ElevenLabs asyncio thread...")
-             if asyncio_loop and asyncio_loop.is_running(): asyncio_loop.call_soon_threadsafe(asyncio_loop.stop)
-             asyncio_thread.join(timeout=5)
-             if asyncio_thread.is_alive(): log.warning("ElevenLabs asyncio thread did not stop.")
+        session_reaper.stop()
+        log.info("Waiting for ElevenLabs session runtime...")
+        session_runtime.shutdown(timeout=5)
+        recorder.stop()
         log.info("ElevenLabs shutdown complete.")
\ No newline at end of file
@@ -13,6 +13,7 @@ import threading
 import re
 import tempfile
 import base64
+import glob
 from datetime import datetime, timedelta
 from flask import Flask, jsonify, render_template, request, send_file
 from flask_socketio import SocketIO, emit
@@ -27,6 +28,8 @@ from app import (
     SALESFORCE_ENABLED,
     RECIPIENT_EMAIL
 )
+from session_reaper import SessionReaper
+from trigger_matcher import CONFIRMATION, CONFIRMATION_TRIGGERS, DAY, MEETING_DAYS, TriggerMatcher
 
 # --- Configure Logging ---
 logging.basicConfig(
@@ -35,6 +38,12 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+# Meeting confirmation: the shared phrases plus the sign-offs this server's agent uses
+MEETING_CONFIRMATION = TriggerMatcher({
+    CONFIRMATION: CONFIRMATION_TRIGGERS + ("scheduled", "looking forward", "see you", "talk soon", "i'll send"),
+    DAY: MEETING_DAYS,
+})
+
 # --- Flask App Setup ---
 app = Flask(__name__)
 CORS(app)
@@ -77,6 +86,23 @@ class ConversationSession:
     def get_full_conversation(self):
         return " ".join([msg['text'] for msg in self.conversation_history])
 
+def release_session(session_id):
+    """Reaper release: drop an expired session, its socket (if any) and its TTS files."""
+    session = active_sessions.pop(session_id, None)
+    try:
+        socketio.server.disconnect(session_id)  # No-op for HTTP-only (/greeting, /voice_message) sessions
+    except Exception as e:
+        log.warning(f"[{session_id}] Error disconnecting expired session: {e}")
+    for audio_path in glob.glob(os.path.join(tempfile.gettempdir(), f"response_{glob.escape(session_id)}_*.mp3")):
+        try:
+            os.unlink(audio_path)
+        except OSError:
+            pass
+    return session
+
+# HTTP sessions are never closed by the client, so idle/lifetime limits are the only way they go away
+session_reaper = SessionReaper(lambda: list(active_sessions), release_session, name="integrated.sessions")
+
 # --- Speech Processing Functions ---
 
 def convert_speech_to_text(audio_data):
@@ -242,7 +268,8 @@ def status():
         "api_key_configured": bool(ELEVENLABS_API_KEY),
         "openai_configured": bool(OPENAI_API_KEY),
         "salesforce_enabled": SALESFORCE_ENABLED,
-        "active_sessions": len(active_sessions)
+        "active_sessions": len(active_sessions),
+        "session_reaper": session_reaper.stats()
     })
 
 @app.route('/audio/<filename>')
@@ -268,6 +295,7 @@ def get_greeting():
         # Create session
         session = ConversationSession(session_id)
         active_sessions[session_id] = session
+        session_reaper.touch(session_id)
         
         # Generate greeting
         greeting_text = get_ai_response([], session.user_name)
@@ -313,6 +341,7 @@ def handle_voice_message():
             active_sessions[session_id] = ConversationSession(session_id)
         
         session = active_sessions[session_id]
+        session_reaper.touch(session_id)
         
         # Step 1: Convert speech to text using OpenAI Whisper
         transcript = convert_speech_to_text(audio_data)
@@ -331,15 +360,9 @@ def handle_voice_message():
         audio_url = convert_text_to_speech(ai_response, session_id)
         
         # Check for meeting confirmation and trigger email/Salesforce
-        confirmation_triggers = [
-            "perfect", "great", "we're set", "confirmed", "scheduled", 
-            "looking forward", "see you", "talk soon", "i'll send"
-        ]
-        
-        meeting_days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
-        
-        trigger_found = any(trigger in mock_response.lower() for trigger in confirmation_triggers)
-        day_found = any(day in mock_response.lower() for day in meeting_days)
+        found = MEETING_CONFIRMATION.search(ai_response)
+        trigger_found = CONFIRMATION in found
+        day_found = DAY in found
         
         if trigger_found and day_found and not session.email_sent:
             log.info(f"[{session_id}] 🟢 Meeting confirmation detected in voice!")
@@ -383,6 +406,7 @@ def handle_voice_message():
 def handle_connect():
     session_id = request.sid
     active_sessions[session_id] = ConversationSession(session_id)
+    session_reaper.touch(session_id)
     log.info(f"[{session_id}] New session connected")
     emit('status', {'message': 'Connected to integrated server'})
 
@@ -401,6 +425,7 @@ def handle_agent_response(data):
     
     if not session:
         return
+    session_reaper.touch(session_id)
     
     agent_text = data.get('text', '')
     log.info(f"[{session_id}] Agent: {agent_text}")
@@ -408,17 +433,10 @@ def handle_agent_response(data):
     # Add to conversation history
     session.add_message(agent_text, is_user=False)
     
-    # Check for meeting confirmation triggers (same logic as main app)
-    confirmation_triggers = [
-        "perfect", "great", "we're set", "confirmed", "scheduled", 
-        "looking forward", "see you", "talk soon", "i'll send"
-    ]
-    
-    meeting_days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
-    
-    # Check for confirmation
-    trigger_found = any(trigger in agent_text.lower() for trigger in confirmation_triggers)
-    day_found = any(day in agent_text.lower() for day in meeting_days)
+    # Check for meeting confirmation triggers (same matcher as main app, with this server's wider phrase list)
+    found = MEETING_CONFIRMATION.search(agent_text)
+    trigger_found = CONFIRMATION in found
+    day_found = DAY in found
     
     if trigger_found and day_found and not session.email_sent:
         log.info(f"[{session_id}] 🟢 Meeting confirmation detected!")
@@ -475,6 +493,7 @@ def handle_user_transcript(data):
     
     if not session:
         return
+    session_reaper.touch(session_id)
     
     user_text = data.get('text', '')
     log.info(f"[{session_id}] User: {user_text}")
@@ -494,4 +513,5 @@ if __name__ == '__main__':
     log.info(f"📧 Email integration: {'✅ Enabled' if RECIPIENT_EMAIL else '❌ Disabled'}")
     log.info(f"💼 Salesforce integration: {'✅ Enabled' if SALESFORCE_ENABLED else '❌ Disabled'}")
     
+    session_reaper.start()
     socketio.run(app, host='127.0.0.1', port=5052, debug=True)
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Structured fund facts parsed from the ETF corpus (corpus.txt).
+
+corpus.txt is written for people: a markdown deep dive for CGUS and one
+paragraph per fund in the quick reference, with the numbers in bold inside
+prose. The model had to read the whole document to quote a number, and the
+instructions hardcoded a few figures (CGUS 29.43%) that drift from the corpus
+whenever it is refreshed.
+
+parse_fund_records() turns every fund passage into a FundRecord. FundFacts
+indexes the records by ticker and by normalized fund name (with and without
+the "Capital Group" / "ETF" parts), so a `lookup_fund` tool call resolves in
+one dict lookup and answers from precomputed fields. Fields the page does not
+give (funds from the 2024 launch cohort often have no expense ratio or
+returns yet) are None and are left out of the tool output.
+"""
+import collections
+import json
+import re
+
+from corpus_index import split_corpus
+
+# Percentages are numbers (0.33 means 0.33%); dates are the corpus's MM/DD/YYYY strings.
+# returns: {period: {'nav': pct, 'market': pct}} for '1-yr' and 'lifetime'
+FundRecord = collections.namedtuple('FundRecord', [
+    'ticker', 'name', 'category', 'objective', 'expense_ratio', 'inception', 'dividends',
+    'sec_yield', 'yield_as_of', 'returns', 'returns_as_of', 'exchange', 'cusip'])
+
+LOOKUP_TOOL = {
+    "type": "function",
+    "name": "lookup_fund",
+    "description": "Exact facts for one Capital Group ETF by ticker or name: objective, expense ratio, inception, "
+                   "dividend schedule, 30-day SEC yield and 1-year/lifetime returns (NAV/market) with as-of dates.",
+    "parameters": {
+        "type": "object",
+        "properties": {"fund": {"type": "string", "description": "Ticker (e.g. CGUS) or fund name."}},
+        "required": ["fund"],
+    },
+}
+
+_DATE = r"(\d{2}/\d{2}/\d{4})"
+_PCT = r"(-?\d+(?:\.\d+)?)%?"
+_OBJECTIVE_RE = re.compile(r"Objective:?\s*")
+_OBJECTIVE_END_RE = re.compile(r"\.\s*\(|\.\s+(?:Dividends|Expense|Inception|30-day|Returns|See)\b")
+_DIVIDENDS_RE = re.compile(r"Dividends:\s*([^.(]+)")
+_EXPENSE_RE = re.compile(r"Expense(?: ratio)?:\s*" + _PCT)
+_INCEPTION_RE = re.compile(r"Inception:\s*" + _DATE)
+_EXCHANGE_RE = re.compile(r"Exchange:\s*([^.]+)\.")
+_CUSIP_RE = re.compile(r"CUSIP:\s*(\w+)")
+_SEC_YIELD_RE = re.compile(r"30-day SEC yield:\s*" + _PCT + r"(?:\s*\(" + _DATE + r"\))?", re.I)
+_YIELD_AS_OF_RE = re.compile(r"Yield \(as of " + _DATE + r"\)")
+_RETURNS_AS_OF_RE = re.compile(r"(?:Returns|Performance) \((?:as of )?" + _DATE + r"\)")
+_RETURN_RE = re.compile(r"(1-yr|lifetime)(?: \(NAV/Market\):)?\s+" + _PCT + r"\s*/\s*" + _PCT + "%", re.I)
+_NAME_FROM_HEADING_RE = re.compile(r"^(.+?)\s*\([A-Z]{3,5}\)")
+
+
+def _clean(text):
+    return text.replace("**", "").replace("\\", "").replace("•", "")
+
+
+def _number(match, group=1):
+    return float(match.group(group)) if match else None
+
+
+def _objective(text):
+    start = _OBJECTIVE_RE.search(text)
+    if start is None:
+        return None
+    body = text[start.end():]
+    end = _OBJECTIVE_END_RE.search(body)
+    return " ".join((body[:end.start()] if end else body).split()).strip(" .") or None
+
+
+def parse_fund_record(passage):
+    """FundRecord for a fund passage (corpus_index.Passage with a ticker)."""
+    text = _clean(passage.text)
+    title = _clean(passage.title)
+    heading_name = _NAME_FROM_HEADING_RE.match(title)
+    name = heading_name.group(1) if heading_name else title.split("—", 1)[-1].strip()
+    # Quick-reference funds sit under "<corpus heading> / <category>"; the deep dive has no category heading
+    sections = passage.section.split(" / ")
+    category = sections[-1] if len(sections) > 1 else None
+
+    sec_yield = _SEC_YIELD_RE.search(text)
+    yield_heading = _YIELD_AS_OF_RE.search(text)  # Deep dive: "Yield (as of ...)" above the figure
+    returns = {m.group(1).lower(): {'nav': float(m.group(2)), 'market': float(m.group(3))} for m in _RETURN_RE.finditer(text)}
+    returns_as_of = _RETURNS_AS_OF_RE.search(text)
+    dividends = _DIVIDENDS_RE.search(text)
+    inception = _INCEPTION_RE.search(text)
+    exchange = _EXCHANGE_RE.search(text)
+    cusip = _CUSIP_RE.search(text)
+    return FundRecord(
+        ticker=passage.ticker,
+        name=name,
+        category=category,
+        objective=_objective(text),
+        expense_ratio=_number(_EXPENSE_RE.search(text)),
+        inception=inception.group(1) if inception else None,
+        dividends=dividends.group(1).strip() if dividends else None,
+        sec_yield=_number(sec_yield),
+        yield_as_of=(sec_yield.group(2) if sec_yield and sec_yield.group(2) else None) or
+                    (yield_heading.group(1) if yield_heading else None),
+        returns=returns,
+        returns_as_of=returns_as_of.group(1) if returns_as_of and returns else None,
+        exchange=exchange.group(1).strip() if exchange else None,
+        cusip=cusip.group(1) if cusip else None,
+    )
+
+
+def fund_passages(passages):
+    """The passage for each fund, in corpus order (the first one wins when a ticker repeats)."""
+    funds = collections.OrderedDict()
+    for passage in passages:
+        if passage.ticker and passage.ticker not in funds:
+            funds[passage.ticker] = passage
+    return list(funds.values())
+
+
+def parse_fund_records(text):
+    """One FundRecord per fund in corpus.txt."""
+    return [parse_fund_record(p) for p in fund_passages(split_corpus(text))]
+
+
+def _normalize(name):
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower().replace("u.s.", "us")))
+
+
+def _name_keys(name):
+    full = _normalize(name)
+    short = re.sub(r"^capital group ", "", full)
+    return {full, short, re.sub(r" etf$", "", short), re.sub(r" etf$", "", full)}
+
+
+class FundFacts:
+    """Fund records indexed by ticker and normalized name."""
+
+    def __init__(self, records):
+        self.records = {r.ticker: r for r in records}
+        self._by_name = {}
+        for record in records:
+            for key in _name_keys(record.name):
+                self._by_name.setdefault(key, record.ticker)
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(parse_fund_records(text))
+
+    def lookup(self, fund):
+        """FundRecord for a ticker or fund name, or None."""
+        query = str(fund or "").strip()
+        record = self.records.get(query.upper())
+        if record is not None:
+            return record
+        key = _normalize(query)
+        ticker = self._by_name.get(key) or self._by_name.get(re.sub(r"^capital group ", "", key))
+        if ticker is None:
+            # Ticker mentioned inside a longer phrase ("the CGDV fund")
+            ticker = next((t for t in re.findall(r"\b[A-Za-z]{3,5}\b", query) if t.upper() in self.records), None)
+            ticker = ticker.upper() if ticker else None
+        return self.records.get(ticker)
+
+    def return_pct(self, ticker, period='1-yr', default=None):
+        """A fund's NAV return for a period as text ("29.43%"), for prompt copy that quotes it."""
+        record = self.records.get(ticker)
+        value = record.returns.get(period, {}).get('nav') if record else None
+        return f"{value:.2f}%" if value is not None else default
+
+    def tool_result(self, arguments):
+        """JSON output for a lookup_fund call (arguments: the decoded call arguments)."""
+        record = self.lookup(arguments.get("fund"))
+        if record is None:
+            return json.dumps({"error": f"no fund matches '{arguments.get('fund')}'", "tickers": sorted(self.records)})
+        return json.dumps({k: v for k, v in record._asdict().items() if v not in (None, {})})
@@ -0,0 +1,78 @@
+"""
+JSON encoding and decoding for the upstream websocket hot paths.
+
+Every upstream frame is JSON: a decode per received event (audio deltas are
+mostly one large base64 string) and an encode per outbound audio append.
+loads()/dumps() use orjson when it is installed and JSON_CODEC allows it, and
+fall back to the stdlib json module otherwise, so the servers run the same
+either way. dumps() always returns str: websockets sends bytes as a binary
+frame, and the realtime APIs expect text frames.
+
+The audio appends don't need a general encoder at all. Their shape is fixed
+and base64 never needs JSON escaping, so AppendEncoder builds the frame once
+as a byte template and splices each batch's base64 between its prefix and
+suffix, skipping the intermediate dict and the encoder's string scan.
+
+    python bench_json_codec.py    # encode/decode cost per frame size
+"""
+import base64
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# auto (orjson if installed), orjson, or stdlib
+JSON_CODEC = os.environ.get("JSON_CODEC", "auto").lower()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_CODEC not in ("auto", "orjson", "stdlib"):
+    log.warning(f"Unknown JSON_CODEC '{JSON_CODEC}', using auto")
+    JSON_CODEC = "auto"
+if JSON_CODEC == "orjson" and orjson is None:
+    log.warning("JSON_CODEC=orjson but orjson is not installed; using the stdlib json module")
+
+CODEC = "orjson" if orjson is not None and JSON_CODEC != "stdlib" else "stdlib"
+
+_stdlib_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+if CODEC == "orjson":
+    def loads(data):
+        """Decode a frame (str or bytes)."""
+        return orjson.loads(data)
+
+    def dumps(obj):
+        """Encode to a compact JSON str (a websocket text frame)."""
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    loads = json.loads
+    dumps = _stdlib_encoder.encode
+
+
+class AppendEncoder:
+    """Encodes {"type": event_type, field: base64(pcm)} by splicing into a prebuilt template.
+
+    encode(pcm) returns the same text as dumps() of the event dict with the
+    base64 of pcm, in one bytes join and one ASCII decode.
+    """
+
+    __slots__ = ('event_type', 'field', '_prefix', '_suffix')
+
+    def __init__(self, event_type, field):
+        self.event_type = event_type
+        self.field = field
+        head = json.dumps({"type": event_type}, separators=(',', ':'))[:-1]  # Drop the closing brace
+        self._prefix = (head + ',' + json.dumps(field) + ':"').encode('utf-8')
+        self._suffix = b'"}'
+
+    def encode(self, pcm):
+        return b"".join((self._prefix, base64.b64encode(pcm), self._suffix)).decode('utf-8')
+
+
+# Outbound audio frames of the two providers
+OPENAI_AUDIO_APPEND = AppendEncoder("input_audio_buffer.append", "audio")
+ELEVENLABS_AUDIO_CHUNK = AppendEncoder("user_audio_chunk", "user_audio_chunk")
@@ -0,0 +1,172 @@
+"""
+Hot reload of the agent's knowledge files (the ETF corpus and the advisor data).
+
+Both used to be read once at import, so refreshing fund figures meant
+restarting the server and dropping every live call. KnowledgeReloader polls
+the source files (mtime and size, every KNOWLEDGE_RELOAD_INTERVAL_S; 0
+disables the watcher) and when one changes rebuilds the whole knowledge
+snapshot with build(texts, version), then publishes it with a single
+attribute assignment. Readers take `reloader.current` once and use that
+snapshot throughout, so they never mix old and new data. After a swap the
+on_swap callbacks run (the realtime server invalidates its prebuilt prompts),
+so new sessions get the new data, and sessions already running keep the
+prompt they were configured with.
+
+Rebuilding is incremental where it matters: builders keep a SectionCache per
+kind of section (corpus passage, fund record, advisor block) and only
+re-parse and re-tokenize sections whose content changed. Global statistics,
+such as BM25's idf, are still recomputed over the whole corpus.
+
+A build that raises keeps the previous snapshot; the next change to the file
+retries it.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+KNOWLEDGE_RELOAD_INTERVAL_S = float(os.environ.get("KNOWLEDGE_RELOAD_INTERVAL_S", "2"))
+
+
+class SectionCache:
+    """Memoizes build(section) by section key across reloads.
+
+    map() returns the results for the sections of the new build; entries for
+    sections that are gone are dropped, so the cache never outgrows one
+    snapshot.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self._entries = {}
+
+    def map(self, keyed_sections):
+        """[(key, section)] -> ([result], number of sections actually rebuilt)."""
+        entries, results, rebuilt = {}, [], 0
+        for key, section in keyed_sections:
+            if key in entries:
+                value = entries[key]
+            elif key in self._entries:
+                value = self._entries[key]
+            else:
+                value = self.build(section)
+                rebuilt += 1
+            entries[key] = value
+            results.append(value)
+        self._entries = entries
+        return results, rebuilt
+
+
+class KnowledgeReloader:
+    """Watches source files and swaps in a freshly built knowledge snapshot when they change.
+
+    sources maps a name to a file path (an empty path means "no file, use the
+    default"); defaults[name] is the text used while that file is missing.
+    build(texts, version) returns the snapshot for {name: text}.
+    """
+
+    def __init__(self, sources, build, defaults=None, on_swap=(), interval_s=KNOWLEDGE_RELOAD_INTERVAL_S,
+                 name="knowledge"):
+        self.sources = dict(sources)
+        self.build = build
+        self.defaults = dict(defaults or {})
+        self.on_swap = list(on_swap)
+        self.interval_s = interval_s
+        self.name = name
+        self.version = 0
+        self.current = None
+        self._digests = {}
+        self._signatures = {}
+        self._lock = threading.Lock()  # One rebuild at a time (watcher thread vs. an explicit reload())
+        self._stop = threading.Event()
+        self._thread = None
+        self.reload(force=True)
+
+    def reload(self, force=False):
+        """Rebuild and swap if any source's content changed. Returns True when a new snapshot was published."""
+        with self._lock:
+            started = time.perf_counter()
+            self._signatures = {name: self._signature(path) for name, path in self.sources.items()}
+            texts = {name: self._read(name, path) for name, path in self.sources.items()}
+            digests = {name: hashlib.sha256(text.encode('utf-8')).hexdigest()[:12] for name, text in texts.items()}
+            changed = [name for name in texts if digests[name] != self._digests.get(name)]
+            if not changed and not force:
+                return False  # Touched but identical
+            try:
+                snapshot = self.build(texts, self.version + 1)
+            except Exception as e:
+                metrics.incr(f"{self.name}.reload_failures")
+                log.error(f"{self.name}: rebuild after change to {', '.join(changed)} failed, keeping v{self.version}: {e}")
+                return False
+            previous = self.version
+            self.current = snapshot  # The swap: readers see either the old or the new snapshot, never a mix
+            self.version += 1
+            self._digests = digests
+            reload_ms = (time.perf_counter() - started) * 1000.0
+        metrics.observe(f"{self.name}.reload_ms", reload_ms)
+        metrics.set_gauge(f"{self.name}.version", self.version)
+        sources = ", ".join(f"{name} {digests[name]}" for name in changed)
+        log.info(f"{self.name}: v{previous} -> v{self.version} in {reload_ms:.1f} ms ({sources}).")
+        if previous:
+            for callback in self.on_swap:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    log.error(f"{self.name}: on_swap callback failed: {e}")
+        return True
+
+    def poll(self):
+        """Reload if a source file's mtime or size changed since the last look."""
+        if any(self._signature(path) != self._signatures.get(name) for name, path in self.sources.items()):
+            return self.reload()
+        return False
+
+    def snapshot(self):
+        return {'version': self.version, 'sources': {name: self.sources[name] or '(built-in)' for name in self.sources},
+                'sha256': dict(self._digests)}
+
+    def _read(self, name, path):
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            except FileNotFoundError:
+                log.warning(f"{self.name}: {path} not found, using the default {name} content")
+        return self.defaults.get(name, "")
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size) if stat else None
+
+    # --- Watcher thread ---
+    def start(self):
+        if self.interval_s <= 0:
+            log.info(f"{self.name}: file watcher disabled.")
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_thread, name=f"Reload-{self.name}", daemon=True)
+        self._thread.start()
+        log.info(f"{self.name}: watching {', '.join(p for p in self.sources.values() if p)} every {self.interval_s:g}s.")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_s)
+            self._thread = None
+
+    def _run_thread(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.poll()
+            except Exception as e:
+                log.error(f"{self.name}: poll failed: {e}")
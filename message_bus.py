@@ -0,0 +1,212 @@
+"""
+Inter-process message bus for Socket.IO emits across server workers.
+
+With several worker processes behind the sticky router (sticky_router.py),
+a client is connected to exactly one worker, but an emit may originate in
+another one (a broadcast, or a session running elsewhere). python-socketio
+solves this with a client manager that publishes every emit on a bus and lets
+each worker deliver it to its own clients. SOCKETIO_MESSAGE_QUEUE selects the
+bus:
+
+* unset               - single process, no bus;
+* redis://, amqp://   - Flask-SocketIO's built-in Redis/Kombu managers;
+* unix:///path.sock   - UnixSocketManager, a dependency-free bus for one host
+                        (and for tests), served by BusHub.
+
+BusHub is a tiny broadcast server on a Unix socket: every frame published by
+one worker is delivered to all connected workers, the publisher included,
+which is what python-socketio's PubSubManager expects. The sticky router
+starts one in-process; `python message_bus.py [/path/to/bus.sock]` runs it
+standalone.
+
+Frames are pickles that the workers unpickle, so only this user may connect:
+the socket is chmod 0600 right after bind(), and the default path
+(private_socket_path) is inside a fresh 0700 directory from mkdtemp instead
+of a guessable name in /tmp.
+"""
+import logging
+import os
+import pickle
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import socketio  # python-socketio ships with Flask-SocketIO; the hub itself does not need it
+except ImportError:
+    socketio = None
+
+log = logging.getLogger(__name__)
+
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+UNIX_SCHEME = "unix://"
+
+_FRAME_HEADER = struct.Struct('>I')
+RECONNECT_DELAY_S = 1.0
+
+
+def private_socket_path(name="bus.sock"):
+    """A socket path inside a new directory only this user can enter (mkdtemp creates it 0700)."""
+    return os.path.join(tempfile.mkdtemp(prefix="socketio-"), name)
+
+
+def _send_frame(sock, payload):
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("bus connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_frame(sock):
+    (size,) = _FRAME_HEADER.unpack(_recv_exact(sock, _FRAME_HEADER.size))
+    return _recv_exact(sock, size)
+
+
+class BusHub:
+    """Broadcasts length-prefixed frames between every client of a Unix socket."""
+
+    def __init__(self, path):
+        self.path = path
+        self._server = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # One broadcast at a time, so frames never interleave
+        self._thread = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Stale socket from a previous run
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        os.chmod(self.path, 0o600)  # Workers unpickle what comes through; keep other local users off it
+        self._server.listen()
+        self._thread = threading.Thread(target=self._accept_loop, name="BusHub", daemon=True)
+        self._thread.start()
+        log.info(f"Message bus hub listening on {self.path}")
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        with self._lock:
+            for conn in self._clients:
+                conn.close()
+            self._clients.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept_loop(self):
+        while self._server is not None:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            with self._lock:
+                self._clients.add(conn)
+            threading.Thread(target=self._client_loop, args=(conn,), name="BusHubClient", daemon=True).start()
+
+    def _client_loop(self, conn):
+        try:
+            while True:
+                frame = _recv_frame(conn)
+                with self._lock:
+                    targets = list(self._clients)
+                failed = []
+                with self._send_lock:
+                    for target in targets:
+                        try:
+                            _send_frame(target, frame)
+                        except OSError:
+                            failed.append(target)
+                for target in failed:
+                    self._drop(target)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        with self._lock:
+            self._clients.discard(conn)
+        conn.close()
+
+
+class UnixSocketManager(socketio.PubSubManager if socketio is not None else object):
+    """python-socketio client manager that uses a BusHub as its message queue."""
+
+    name = 'unix'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        self.path = url[len(UNIX_SCHEME):] if url.startswith(UNIX_SCHEME) else url
+        self._send_lock = threading.Lock()
+        self._publish_sock = None
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _publish(self, data):
+        payload = pickle.dumps((self.channel, data))
+        with self._send_lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_sock is None:
+                        self._publish_sock = self._connect()
+                    _send_frame(self._publish_sock, payload)
+                    return
+                except OSError as e:
+                    log.warning(f"Message bus publish failed ({e}), reconnecting")
+                    if self._publish_sock is not None:
+                        self._publish_sock.close()
+                    self._publish_sock = None
+            log.error("Message bus publish dropped after reconnect attempt")
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                log.warning(f"Message bus {self.path} unavailable ({e}), retrying")
+                time.sleep(RECONNECT_DELAY_S)
+                continue
+            try:
+                while True:
+                    channel, data = pickle.loads(_recv_frame(sock))
+                    if channel == self.channel:
+                        yield data
+            except (ConnectionError, OSError) as e:
+                log.warning(f"Message bus connection lost ({e}), reconnecting")
+            finally:
+                sock.close()
+
+
+def socketio_queue_options(url=SOCKETIO_MESSAGE_QUEUE):
+    """Keyword arguments for SocketIO(...) that select the bus configured by url."""
+    if not url:
+        return {}
+    if url.startswith(UNIX_SCHEME):
+        return {'client_manager': UnixSocketManager(url)}
+    return {'message_queue': url}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    hub = BusHub(sys.argv[1] if len(sys.argv) > 1 else private_socket_path()).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        hub.close()
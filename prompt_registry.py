@@ -0,0 +1,79 @@
+"""
+Prebuilt session configuration payloads for the realtime sessions.
+
+The OpenAI session.update carries multi-kilobyte instructions (persona,
+advisor context, ETF knowledge). Building that f-string and JSON-encoding it
+on every connect costs time on the path to the first word of the call, for a
+result that is identical across sessions. PromptRegistry builds each payload
+once, keeps the serialized JSON with its SHA-256 and byte size, and hands the
+same string to every session until its inputs change.
+
+Payloads are keyed (key None is the default prompt), so variants can share
+the cache. When an input changes (a new corpus or new advisor data),
+invalidate() bumps the registry version and every key is rebuilt on next use.
+Sessions that already sent a payload are not affected.
+
+Payloads are kept as str, not bytes: websockets sends str as a text frame,
+which is what the realtime API expects.
+"""
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# event: the session.update dict; payload: its JSON text; sha256: short digest of payload; size: UTF-8 bytes
+PreparedPrompt = collections.namedtuple('PreparedPrompt', ['key', 'event', 'payload', 'sha256', 'size', 'version'])
+
+
+class PromptRegistry:
+    """Caches build(key) -> session.update dict as prebuilt JSON, per key and registry version."""
+
+    def __init__(self, build, name="prompts"):
+        self.build = build
+        self.name = name
+        self.version = 1
+        self._lock = threading.Lock()
+        self._prompts = {}
+
+    def get(self, key=None):
+        prompt = self._prompts.get(key)
+        if prompt is None or prompt.version != self.version:
+            prompt = self._prepare(key)
+        return prompt
+
+    def invalidate(self):
+        """The prompt inputs changed: rebuild every payload on its next use."""
+        with self._lock:
+            self.version += 1
+            self._prompts.clear()
+        log.info(f"{self.name}: inputs changed, prompts now at version {self.version}.")
+
+    def snapshot(self):
+        return {
+            'version': self.version,
+            'prompts': {str(p.key): {'sha256': p.sha256, 'bytes': p.size, 'version': p.version}
+                        for p in list(self._prompts.values())},
+        }
+
+    def _prepare(self, key):
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None and prompt.version == self.version:
+                return prompt  # Built by another thread while we waited
+            started = time.perf_counter()
+            event = self.build(key)
+            payload = json.dumps(event)
+            encoded = payload.encode('utf-8')
+            prompt = PreparedPrompt(key, event, payload, hashlib.sha256(encoded).hexdigest()[:16], len(encoded), self.version)
+            self._prompts[key] = prompt
+            build_ms = (time.perf_counter() - started) * 1000.0
+        metrics.observe(f"{self.name}.build_ms", build_ms)
+        log.info(f"{self.name}: built prompt '{key or 'default'}' v{prompt.version}: {prompt.size} bytes, "
+                 f"sha256 {prompt.sha256}, {build_ms:.1f} ms.")
+        return prompt
@@ -0,0 +1,126 @@
+"""
+Lightweight in-process metrics for the realtime voice servers.
+
+Counters, gauges and fixed-bucket histograms, plus per-session counters that
+also roll up into the global totals. Everything is guarded by one lock because
+the values are written from the asyncio loop thread(s) and read from Flask
+request threads (see the /api/metrics route).
+"""
+import bisect
+import threading
+import time
+
+# Default histogram bucket upper bounds (inclusive); the last bucket is +Inf.
+DEFAULT_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self):
+        buckets = {f"le_{b}": c for b, c in zip(self.bounds, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'buckets': buckets,
+        }
+
+
+class SessionMetrics:
+    """Per-session counters/gauges; counters also add into the registry totals."""
+
+    def __init__(self, registry, sid):
+        self.registry = registry
+        self.sid = sid
+        self.started_at = time.time()
+        self.counters = {}
+        self.gauges = {}
+
+    def incr(self, name, value=1):
+        with self.registry._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.registry._counters[name] = self.registry._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.registry._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value, bounds=DEFAULT_BOUNDS):
+        self.registry.observe(name, value, bounds)
+
+    def snapshot(self):
+        with self.registry._lock:
+            return {
+                'age_s': round(time.time() - self.started_at, 1),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._sessions = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value, bounds=DEFAULT_BOUNDS):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram(bounds)
+            hist.observe(value)
+
+    def session(self, sid):
+        """Get (or create) the per-session metrics for sid."""
+        with self._lock:
+            stats = self._sessions.get(sid)
+            if stats is None:
+                stats = self._sessions[sid] = SessionMetrics(self, sid)
+            return stats
+
+    def drop_session(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def snapshot(self, include_sessions=True):
+        with self._lock:
+            data = {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+            sessions = list(self._sessions.values()) if include_sessions else []
+        if include_sessions:
+            data['sessions'] = {s.sid: s.snapshot() for s in sessions}
+        return data
+
+
+# Process-wide registry shared by the servers' modules
+metrics = MetricsRegistry()
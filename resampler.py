@@ -0,0 +1,103 @@
+"""
+Streaming polyphase resampler for PCM16 mono audio.
+
+Browsers capture at their native rate (usually 48 kHz) while the providers want
+fixed rates (OpenAI realtime: 24 kHz, ElevenLabs agent: 16 kHz). Resampling on
+the server lets the page keep its native AudioContext and lets one capture
+stream feed either provider.
+
+The filter is a Kaiser-windowed sinc split into `up` polyphase branches, so
+each output sample costs `taps_per_phase` multiply-adds and nothing is computed
+for the zeros of the conceptual upsampled signal. All output samples of a chunk
+are computed at once with NumPy (a strided matvec for pure decimation, a cached
+window/branch gather otherwise), and the
+last taps_per_phase-1 input samples plus the fractional output position are
+carried over, so chunk boundaries are seamless.
+"""
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_TAPS_PER_PHASE = 24
+DEFAULT_KAISER_BETA = 8.0
+DEFAULT_ROLLOFF = 0.92  # Cutoff as a fraction of the lower Nyquist frequency
+
+
+def design_polyphase_bank(up, down, taps_per_phase=DEFAULT_TAPS_PER_PHASE, beta=DEFAULT_KAISER_BETA, rolloff=DEFAULT_ROLLOFF):
+    """Return the (up, taps_per_phase) filter bank, each row reversed for dot products with a forward window."""
+    num_taps = taps_per_phase * up
+    cutoff = rolloff / max(up, down)  # Normalized to the upsampled Nyquist
+    t = np.arange(num_taps) - (num_taps - 1) / 2.0
+    prototype = cutoff * np.sinc(cutoff * t) * np.kaiser(num_taps, beta)
+    prototype *= up / prototype.sum()  # Unity DC gain after zero-stuffing by `up`
+    # bank[p, k] = prototype[k * up + p]; reverse k so that window[j] pairs with x[base - (taps-1) + j]
+    bank = prototype.reshape(taps_per_phase, up).T
+    return np.ascontiguousarray(bank[:, ::-1], dtype=np.float32)
+
+
+class PolyphaseResampler:
+    """Stateful PCM16 resampler; call process() with consecutive chunks of one stream."""
+
+    def __init__(self, in_rate, out_rate, taps_per_phase=DEFAULT_TAPS_PER_PHASE):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        g = gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+        self.passthrough = self.up == self.down
+        self.taps = taps_per_phase
+        if not self.passthrough:
+            self.bank = design_polyphase_bank(self.up, self.down, taps_per_phase)
+        self._plans = {}
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._next_pos = 0  # Upsampled-domain index of the next output, relative to the next chunk's first sample
+
+    def process(self, pcm):
+        """Resample a chunk of little-endian PCM16 bytes; returns PCM16 bytes."""
+        if self.passthrough or not pcm:
+            return pcm
+        x = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+        return self.process_array(x).astype('<i2').tobytes()
+
+    def process_array(self, x):
+        """Resample float32 samples (PCM16 scale); returns clipped, rounded float32 samples."""
+        n_in = len(x)
+        ext = np.concatenate((self._history, x))
+        end = n_in * self.up
+        n_out = max(0, -(-(end - self._next_pos) // self.down))  # ceil((end - next_pos) / down)
+        if n_out:
+            # Output n uses x[base - taps + 1 .. base] == ext[base .. base + taps - 1]
+            windows = sliding_window_view(ext, self.taps)
+            if self.up == 1:
+                # Pure decimation (48k->24k, 48k->16k): one branch, bases are a strided view - no gather
+                y = windows[self._next_pos::self.down][:n_out] @ self.bank[0]
+            else:
+                bases, rows = self._plan(self._next_pos, n_out)
+                y = np.einsum('ij,ij->i', windows[bases], rows)
+            self._next_pos += n_out * self.down - end
+        else:
+            y = np.zeros(0, dtype=np.float32)
+            self._next_pos -= end
+        self._history = ext[-(self.taps - 1):].copy()
+        return np.clip(np.rint(y), -32768, 32767)
+
+    def _plan(self, start_pos, n_out):
+        """Base indices and branch rows for n_out outputs from start_pos, cached per (start_pos, n_out).
+
+        With a fixed chunk size the start position cycles through a handful of
+        values, so after the first few chunks this is a dict lookup.
+        """
+        key = (start_pos, n_out)
+        plan = self._plans.get(key)
+        if plan is None:
+            positions = start_pos + np.arange(n_out) * self.down
+            plan = (positions // self.up, self.bank[positions % self.up])
+            if len(self._plans) >= 64:
+                self._plans.clear()
+            self._plans[key] = plan
+        return plan
+
@@ -0,0 +1,189 @@
+"""
+Background reaper for per-session server state.
+
+Session state is normally removed by a clean Socket.IO disconnect, but some
+entries never get one: a tab left open for hours, a disconnect lost to a
+network drop, or the integrated server's /greeting and /voice_message routes,
+which create a ConversationSession for every request without a session_id.
+SessionReaper walks a server's session dict periodically and releases every
+entry that has been idle for longer than SESSION_IDLE_TIMEOUT_S or alive for
+longer than SESSION_MAX_LIFETIME_S (0 disables either limit).
+
+Servers call touch(sid) on activity (control events, audio chunks, messages);
+an entry the reaper has never seen is treated as active from the first sweep
+that finds it, so a creation path that forgets to touch still gets reaped.
+release(sid) is the server's own cleanup - stop the upstream session, pop the
+client state, free the conversation history - and returns what it removed so
+the reaper can estimate the memory reclaimed.
+
+Threaded servers run the reaper on a daemon thread with start(); servers whose
+handlers run on an event loop (asgi_app.py) schedule run() on that loop instead.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+SESSION_IDLE_TIMEOUT_S = float(os.environ.get("SESSION_IDLE_TIMEOUT_S", "900"))
+SESSION_MAX_LIFETIME_S = float(os.environ.get("SESSION_MAX_LIFETIME_S", "14400"))
+SESSION_REAP_INTERVAL_S = max(1.0, float(os.environ.get("SESSION_REAP_INTERVAL_S", "60")))
+
+REASON_IDLE = "idle"
+REASON_LIFETIME = "lifetime"
+
+
+def estimate_size(obj, _seen=None):
+    """Approximate deep size in bytes of plain containers, strings and simple objects."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+class SessionReaper:
+    """Releases sessions that exceed the idle or lifetime limit.
+
+    sessions() returns the sids currently held by the server; release(sid)
+    drops one of them and returns the removed state (or None).
+    """
+
+    def __init__(self, sessions, release, idle_timeout_s=SESSION_IDLE_TIMEOUT_S,
+                 max_lifetime_s=SESSION_MAX_LIFETIME_S, interval_s=SESSION_REAP_INTERVAL_S, name="sessions"):
+        self.sessions = sessions
+        self.release = release
+        self.idle_timeout_s = idle_timeout_s
+        self.max_lifetime_s = max_lifetime_s
+        self.interval_s = interval_s
+        self.name = name
+        self.reclaimed = 0
+        self.bytes_freed = 0
+        # _seen[sid] = [first_seen, last_active] (time.monotonic)
+        self._seen = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, sid):
+        now = time.monotonic()
+        entry = self._seen.get(sid)
+        if entry is None:
+            self._seen[sid] = [now, now]
+        else:
+            entry[1] = now
+
+    def sweep(self, now=None):
+        """Release expired sessions once. Returns (sessions reclaimed, estimated bytes freed)."""
+        now = time.monotonic() if now is None else now
+        live = set(self.sessions())
+        for sid in list(self._seen):
+            if sid not in live:
+                self._seen.pop(sid, None)  # Removed cleanly by the server
+        reclaimed, freed = 0, 0
+        for sid in live:
+            entry = self._seen.setdefault(sid, [now, now])
+            reason = self._expired(entry, now)
+            if reason is None:
+                continue
+            try:
+                released = self.release(sid)
+            except Exception as e:
+                log.error(f"[{sid}] {self.name} reaper: release failed: {e}")
+                continue
+            self._seen.pop(sid, None)
+            size = estimate_size(released) if released is not None else 0
+            reclaimed += 1
+            freed += size
+            metrics.incr(f"{self.name}.reaped_{reason}")
+            log.info(f"[{sid}] {self.name} reaper: released {reason} session "
+                     f"(age {now - entry[0]:.0f}s, idle {now - entry[1]:.0f}s, ~{size} bytes)")
+        if reclaimed:
+            self.reclaimed += reclaimed
+            self.bytes_freed += freed
+            metrics.incr(f"{self.name}.reaped_bytes", freed)
+            log.info(f"{self.name} reaper: reclaimed {reclaimed} session(s), ~{freed / 1024:.1f} KiB freed "
+                     f"({self.reclaimed} / ~{self.bytes_freed / 1024:.1f} KiB since start)")
+        metrics.set_gauge(f"{self.name}.tracked", len(live) - reclaimed)
+        return reclaimed, freed
+
+    def _expired(self, entry, now):
+        first_seen, last_active = entry
+        if self.max_lifetime_s > 0 and now - first_seen > self.max_lifetime_s:
+            return REASON_LIFETIME
+        if self.idle_timeout_s > 0 and now - last_active > self.idle_timeout_s:
+            return REASON_IDLE
+        return None
+
+    def stats(self):
+        return {'reclaimed': self.reclaimed, 'bytes_freed': self.bytes_freed, 'tracked': len(self._seen)}
+
+    # --- Thread mode (Flask-SocketIO threading servers) ---
+    def start(self):
+        if self.idle_timeout_s <= 0 and self.max_lifetime_s <= 0:
+            log.info(f"{self.name} reaper: disabled (no idle or lifetime limit).")
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_thread, name=f"Reaper-{self.name}", daemon=True)
+        self._thread.start()
+        log.info(f"{self.name} reaper: idle {self.idle_timeout_s:.0f}s, lifetime {self.max_lifetime_s:.0f}s, "
+                 f"every {self.interval_s:.0f}s.")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_s)
+            self._thread = None
+
+    def _run_thread(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error(f"{self.name} reaper: sweep failed: {e}")
+
+    # --- Loop mode (ASGI server) ---
+    async def run(self):
+        if self.idle_timeout_s <= 0 and self.max_lifetime_s <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error(f"{self.name} reaper: sweep failed: {e}")
+
+
+def client_session_reaper(clients, runtime, disconnect, name, **limits):
+    """SessionReaper over a realtime server's clients dict and its session runtime.
+
+    Releasing a sid stops its runtime session (the session task closes the
+    upstream websocket on the way out), disconnects the Socket.IO client with
+    disconnect(sid) and drops whatever client state the disconnect handler left.
+    Runtime sessions whose client entry is already gone are reaped as well.
+    """
+    def release(sid):
+        state = clients.get(sid)
+        if sid in runtime.sessions:
+            runtime.stop_session(sid)
+        try:
+            disconnect(sid)
+        except Exception as e:
+            log.warning(f"[{sid}] {name} reaper: disconnect failed: {e}")
+        clients.pop(sid, None)
+        metrics.drop_session(sid)
+        return state
+
+    return SessionReaper(lambda: set(clients) | set(runtime.sessions), release, name=name, **limits)
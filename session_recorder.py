@@ -0,0 +1,209 @@
+"""
+Asynchronous, batched recorder of structured session events.
+
+The receive loops used to log the conversation at INFO: every transcript
+delta, every audio chunk length, and the whole accumulated reply at the end of
+each turn. Those logging calls format and write synchronously on the session's
+event loop thread, so a slow disk or a busy console stalls audio for every
+session on that loop. The logs were also hard to audit afterwards.
+
+Sessions now record what happened as structured events (transcripts, turns,
+triggers, barge-ins, timings). record() only appends a dict to a queue. A
+background writer thread wakes every SESSION_RECORD_FLUSH_MS (sooner once
+SESSION_RECORD_BATCH events are waiting), JSON-encodes the batch and writes it
+with one write() to a JSONL file. The file rotates at SESSION_RECORD_MAX_BYTES,
+keeping SESSION_RECORD_BACKUPS old files (.1, .2, ...).
+
+Rotation assumes one writer per file, so every process records to its own:
+start(server, shard) derives the name from SESSION_RECORD_FILE, the server,
+the sticky-router WORKER_INDEX and the forked shard index, e.g.
+session_records/events.openai.w1.shard0.jsonl.
+
+Each line is {"ts", "sid", "provider", "event", ...fields}. The queue is
+bounded by SESSION_RECORD_QUEUE_MAX: if the writer falls behind, new events
+are dropped and counted under recorder.dropped, so the call never blocks.
+An empty SESSION_RECORD_FILE disables recording.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import json_codec
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+SESSION_RECORD_FILE = os.environ.get("SESSION_RECORD_FILE", "session_records/events.jsonl")
+SESSION_RECORD_MAX_BYTES = int(os.environ.get("SESSION_RECORD_MAX_BYTES", str(20 * 1024 * 1024)))
+SESSION_RECORD_BACKUPS = int(os.environ.get("SESSION_RECORD_BACKUPS", "5"))
+SESSION_RECORD_FLUSH_MS = int(os.environ.get("SESSION_RECORD_FLUSH_MS", "250"))
+SESSION_RECORD_BATCH = int(os.environ.get("SESSION_RECORD_BATCH", "256"))
+SESSION_RECORD_QUEUE_MAX = int(os.environ.get("SESSION_RECORD_QUEUE_MAX", "20000"))
+# Set by sticky_router.py for each worker process it starts
+WORKER_INDEX = os.environ.get("WORKER_INDEX")
+
+
+def process_record_path(path, server, shard=None, worker=WORKER_INDEX):
+    """This process's file: events.jsonl -> events.<server>[.w<worker>][.shard<shard>].jsonl."""
+    root, ext = os.path.splitext(path)
+    parts = [server]
+    if worker is not None:
+        parts.append(f"w{worker}")
+    if shard is not None:
+        parts.append(f"shard{shard}")
+    return f"{root}.{'.'.join(parts)}{ext}"
+
+
+def _jsonable(value):
+    """Fallback for values the stdlib encoder rejects (e.g. the datetime in a parsed meeting), as orjson writes them."""
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+class SessionEvents:
+    """Recorder handle bound to one session (like metrics.session(sid))."""
+
+    __slots__ = ('recorder', 'sid', 'provider')
+
+    def __init__(self, recorder, sid, provider):
+        self.recorder = recorder
+        self.sid = sid
+        self.provider = provider
+
+    def record(self, event, **fields):
+        self.recorder.record(self.sid, self.provider, event, **fields)
+
+
+class SessionRecorder:
+    """Queues session events and writes them to a rotating JSONL file from a writer thread."""
+
+    def __init__(self, path=SESSION_RECORD_FILE, max_bytes=SESSION_RECORD_MAX_BYTES, backups=SESSION_RECORD_BACKUPS,
+                 flush_ms=SESSION_RECORD_FLUSH_MS, batch=SESSION_RECORD_BATCH, queue_max=SESSION_RECORD_QUEUE_MAX):
+        self.base_path = path
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_s = flush_ms / 1000.0
+        self.batch = batch
+        self.queue_max = queue_max
+        self._pending = collections.deque()  # append/popleft are atomic: no lock on the recording side
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self.written = 0
+        self.dropped = 0
+
+    def session(self, sid, provider):
+        return SessionEvents(self, sid, provider)
+
+    def record(self, sid, provider, event, **fields):
+        """Queue one event. Never blocks and never does I/O."""
+        if not self.path:
+            return
+        if len(self._pending) >= self.queue_max:
+            self.dropped += 1
+            metrics.incr('recorder.dropped')
+            return
+        self._pending.append({'ts': round(time.time(), 3), 'sid': sid, 'provider': provider, 'event': event, **fields})
+        if len(self._pending) >= self.batch:
+            self._wake.set()
+
+    def snapshot(self):
+        return {'path': self.path or None, 'queued': len(self._pending), 'written': self.written, 'dropped': self.dropped}
+
+    # --- Writer thread ---
+    def start(self, server, shard=None):
+        """Start the writer on this process's own file (see process_record_path); shard is set in forked shard workers."""
+        if not self.path:
+            log.info("Session recorder disabled (SESSION_RECORD_FILE is empty).")
+            return self
+        self.path = process_record_path(self.base_path, server, shard)
+        if shard is not None:
+            self._pending.clear()  # Inherited from the parent across the fork; the parent writes its own
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_thread, name="SessionRecorder", daemon=True)
+        self._thread.start()
+        log.info(f"Recording session events to {self.path}.")
+        return self
+
+    def stop(self, timeout=2.0):
+        """Flush what is queued and stop the writer."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run_thread(self):
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_s)
+                self._wake.clear()
+                self._flush()
+            self._flush()
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _flush(self):
+        if not self._pending:
+            return
+        started = time.perf_counter()
+        lines = []
+        while self._pending:
+            try:
+                event = self._pending.popleft()
+            except IndexError:
+                break
+            try:
+                lines.append(json_codec.dumps(event))
+            except TypeError:
+                lines.append(json.dumps(event, ensure_ascii=False, separators=(',', ':'), default=_jsonable))
+        if not lines:
+            return
+        try:
+            f = self._open()
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+        except OSError as e:
+            self.dropped += len(lines)
+            metrics.incr('recorder.dropped', len(lines))
+            log.error(f"Session recorder: writing {self.path} failed, {len(lines)} events lost: {e}")
+            return
+        self.written += len(lines)
+        if f.tell() >= self.max_bytes:
+            try:
+                self._rotate()
+            except OSError as e:  # The batch is on disk; the next write reopens the file and the next batch retries
+                metrics.incr('recorder.rotate_failures')
+                log.warning(f"Session recorder: rotating {self.path} failed: {e}")
+        metrics.incr('recorder.written', len(lines))
+        metrics.observe('recorder.batch_events', len(lines))
+        metrics.observe('recorder.batch_write_ms', (time.perf_counter() - started) * 1000.0)
+
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _rotate(self):
+        f, self._file = self._file, None
+        f.close()
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+# Shared by every session of the process
+recorder = SessionRecorder()
@@ -0,0 +1,488 @@
+"""
+Session runtime for the realtime voice servers.
+
+Owns a dedicated asyncio event loop thread and the per-session coroutines that
+run on it. Socket.IO handlers (Flask threads) talk to it through two paths:
+
+* control (start/stop) goes through an asyncio.Queue drained by one coroutine,
+  so session lifecycle changes are serialized on the loop;
+* audio is handed straight to the owning session's asyncio.Queue with
+  loop.call_soon_threadsafe - no thread-pool hop and no shared FIFO, so a slow
+  session can no longer delay everyone else's chunks.
+
+ShardedSessionRuntime spreads sessions over several runtimes by sid hash, so
+JSON parsing, logging and trigger checks of different calls no longer compete
+for one loop. Shards are loop threads in this process or, with
+WorkerProcessRuntime, child processes (one GIL each) that forward their
+client emits back to the parent's Socket.IO server.
+"""
+import asyncio
+import collections
+import logging
+import multiprocessing
+import os
+import threading
+import traceback
+import zlib
+
+log = logging.getLogger(__name__)
+
+RUNTIME_MODE_THREADS = "threads"
+SESSION_DONE_EVENT = "__session_done__"  # Outbox marker: a child session ended (not a client emit)
+RUNTIME_MODE_PROCESSES = "processes"
+SESSION_RUNTIME_SHARDS = max(1, int(os.environ.get("SESSION_RUNTIME_SHARDS", "1")))
+SESSION_RUNTIME_MODE = os.environ.get("SESSION_RUNTIME_MODE", RUNTIME_MODE_THREADS)
+
+
+class SessionRuntime:
+    """Runs one coroutine per client sid on a dedicated asyncio loop thread.
+
+    session_factory(sid, input_queue, updates=..., **options) must return the
+    session coroutine; input_queue receives audio items and a final None on
+    stop, updates receives the dicts passed to update_session() mid-call.
+    is_client_connected(sid) is checked on the loop before a session starts.
+    queue_factory(sid) builds each session's input queue (default: unbounded
+    asyncio.Queue); queues that define push_from_thread(loop, item) apply their
+    own backpressure/drop policy to incoming audio.
+    background_tasks is a list of coroutine functions started on the loop
+    alongside the control processor (e.g. an upstream connection pool) and
+    cancelled when the runtime shuts down.
+    on_session_done(sid) is called on the loop exactly once per start_session:
+    when its task ends, or right away if the start was skipped (admission
+    control uses it to free the session's slot).
+    """
+
+    def __init__(self, session_factory, is_client_connected=None, name="AsyncioThread", queue_factory=None,
+                 background_tasks=(), on_session_done=None):
+        self.session_factory = session_factory
+        self.is_client_connected = is_client_connected or (lambda sid: True)
+        self.queue_factory = queue_factory or (lambda sid: asyncio.Queue())
+        self.name = name
+        self.background_tasks = list(background_tasks)
+        self.on_session_done = on_session_done
+        self.loop = None
+        self.thread = None
+        # sessions[sid] = {'task': Task, 'input_queue': asyncio.Queue}
+        # Mutated only on the loop thread; handler threads only read it.
+        self.sessions = {}
+        self._control_queue = None
+        self._ready = threading.Event()
+
+    # --- Thread-safe API (called from Socket.IO handlers) ---
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.loop = asyncio.new_event_loop()
+        self._ready.clear()
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        if not self._ready.wait(timeout=5):
+            log.warning(f"{self.name}: control channel not ready after 5s")
+        log.info(f"{self.name}: dedicated asyncio thread started.")
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive() and self._control_queue is not None
+
+    def start_session(self, sid, **options):
+        self._submit_control(('start', sid, options))
+
+    def stop_session(self, sid):
+        self._submit_control(('stop', sid, None))
+
+    def update_session(self, sid, **changes):
+        self._submit_control(('update', sid, changes))
+
+    def push_audio(self, sid, data):
+        """Hand an audio item to sid's session queue. Returns False if there is no live session."""
+        session = self.sessions.get(sid)
+        if session is None or session['task'].done():
+            return False
+        input_queue = session['input_queue']
+        try:
+            if hasattr(input_queue, 'push_from_thread'):
+                return input_queue.push_from_thread(self.loop, data)
+            self.loop.call_soon_threadsafe(input_queue.put_nowait, data)
+        except RuntimeError:  # Loop closed during shutdown
+            return False
+        return True
+
+    def shutdown(self, timeout=5):
+        if not self.is_running():
+            return
+        self._submit_control(None)
+        self.thread.join(timeout=timeout)
+        if self.thread.is_alive():
+            log.warning(f"{self.name}: asyncio thread did not stop.")
+
+    def _submit_control(self, item):
+        if not self.is_running():
+            log.warning(f"{self.name}: runtime not running, dropping control item {item!r}")
+            return
+        self.loop.call_soon_threadsafe(self._control_queue.put_nowait, item)
+
+    # --- Loop thread ---
+    def _run(self):
+        log.info(f"{self.name}: asyncio thread started.")
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._process_control())
+        except Exception as e:
+            log.error(f"{self.name}: exception in control processor: {e}")
+            log.error(traceback.format_exc())
+        finally:
+            log.info(f"{self.name}: asyncio loop stopping...")
+            try:
+                tasks = asyncio.all_tasks(loop=self.loop)
+                for task in tasks:
+                    if not task.done(): task.cancel()
+                if tasks: self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            except Exception as e: log.error(f"{self.name}: error during asyncio loop cleanup: {e}")
+            finally:
+                self._control_queue = None
+                self.loop.close(); log.info(f"{self.name}: asyncio loop closed.")
+
+    async def _process_control(self):
+        self._control_queue = asyncio.Queue()
+        self._ready.set()
+        log.info(f"{self.name}: control processor started.")
+        background = [self.loop.create_task(factory()) for factory in self.background_tasks]
+        while True:
+            item = await self._control_queue.get()
+            if item is None:
+                log.info(f"{self.name}: stop signal. Shutting down...")
+                break
+            action, sid, options = item
+            try:
+                if action == 'start':
+                    self._start_session(sid, options)
+                elif action == 'stop':
+                    self._stop_session(sid)
+                elif action == 'update':
+                    self._update_session(sid, options)
+                else:
+                    log.warning(f"[{sid}] Unknown control action '{action}'.")
+            except Exception as e:
+                log.error(f"[{sid}] Error handling '{action}': {e}\n{traceback.format_exc()}")
+        for sid, session in list(self.sessions.items()):
+            log.warning(f"[{sid}] Cancelling remaining session task on runtime exit.")
+            session['task'].cancel()
+            del self.sessions[sid]
+        for task in background:
+            task.cancel()
+        if background:
+            await asyncio.gather(*background, return_exceptions=True)
+        log.info(f"{self.name}: control processor finished.")
+
+    def _start_session(self, sid, options):
+        session = self.sessions.get(sid)
+        if session is not None and not session['task'].done():
+            log.warning(f"[{sid}] 'start' received, task active.")
+            self._session_done(sid)
+            return
+        if not self.is_client_connected(sid):
+            log.warning(f"[{sid}] 'start', client '{sid}' not connected.")
+            self._session_done(sid)
+            return
+        log.info(f"[{sid}] 'start', launching session task.")
+        input_queue = self.queue_factory(sid)
+        updates = asyncio.Queue()
+        task = self.loop.create_task(self.session_factory(sid, input_queue, updates=updates, **options))
+        task.add_done_callback(lambda t, sid=sid: self._forget_session(sid, t))
+        self.sessions[sid] = {'task': task, 'input_queue': input_queue, 'updates': updates}
+
+    def _stop_session(self, sid):
+        session = self.sessions.pop(sid, None)
+        if session is None:
+            log.warning(f"[{sid}] 'stop' received, no active session.")
+            return
+        log.info(f"[{sid}] 'stop', signalling task.")
+        session['input_queue'].put_nowait(None)
+
+    def _update_session(self, sid, changes):
+        session = self.sessions.get(sid)
+        if session is None or session['task'].done():
+            log.warning(f"[{sid}] 'update' received, no active session.")
+            return
+        session['updates'].put_nowait(changes)
+
+    def _forget_session(self, sid, task):
+        session = self.sessions.get(sid)
+        if session is not None and session['task'] is task:
+            del self.sessions[sid]
+        self._session_done(sid)
+
+    def _session_done(self, sid):
+        if self.on_session_done is None:
+            return
+        try:
+            self.on_session_done(sid)
+        except Exception as e:
+            log.error(f"[{sid}] {self.name}: error in on_session_done: {e}")
+
+
+class InLoopSessionRuntime(SessionRuntime):
+    """SessionRuntime for servers whose handlers already run on the event loop (ASGI mode).
+
+    Sessions run on the caller's loop: start() must be called from a coroutine
+    on that loop, and start_session/stop_session/push_audio act immediately,
+    with no control queue and no thread hop. push_audio uses the queue's
+    non-blocking offer(), so the 'block' input policy degrades to dropping.
+    """
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._background = [self.loop.create_task(factory()) for factory in self.background_tasks]
+        log.info(f"{self.name}: sessions run on the server event loop.")
+
+    def is_running(self):
+        return self.loop is not None and not self.loop.is_closed()
+
+    def start_session(self, sid, **options):
+        try:
+            self._start_session(sid, options)
+        except Exception as e:
+            log.error(f"[{sid}] Error handling 'start': {e}\n{traceback.format_exc()}")
+
+    def stop_session(self, sid):
+        self._stop_session(sid)
+
+    def update_session(self, sid, **changes):
+        self._update_session(sid, changes)
+
+    def push_audio(self, sid, data):
+        session = self.sessions.get(sid)
+        if session is None or session['task'].done():
+            return False
+        input_queue = session['input_queue']
+        if hasattr(input_queue, 'offer'):
+            input_queue.offer(data)
+        else:
+            input_queue.put_nowait(data)
+        return True
+
+    async def aclose(self, timeout=5):
+        """Cancel sessions and background tasks (the in-loop counterpart of shutdown())."""
+        tasks = [session['task'] for session in self.sessions.values()] + getattr(self, '_background', [])
+        self.sessions.clear()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+
+def shard_index(sid, shards):
+    """Stable shard for a sid (crc32, so every process agrees on it)."""
+    return zlib.crc32(str(sid).encode('utf-8')) % shards
+
+
+class ShardedSessionRuntime:
+    """Same API as SessionRuntime, spread over several runtimes by sid hash.
+
+    Every control and audio message for a sid goes to the same shard, so a
+    session's ordering guarantees are those of a single SessionRuntime.
+    """
+
+    def __init__(self, runtimes):
+        self.runtimes = list(runtimes)
+
+    def shard_for(self, sid):
+        return self.runtimes[shard_index(sid, len(self.runtimes))]
+
+    @property
+    def sessions(self):
+        merged = {}
+        for runtime in self.runtimes:
+            merged.update(runtime.sessions)
+        return merged
+
+    def start(self):
+        for runtime in self.runtimes:
+            runtime.start()
+
+    def is_running(self):
+        return all(runtime.is_running() for runtime in self.runtimes)
+
+    def start_session(self, sid, **options):
+        self.shard_for(sid).start_session(sid, **options)
+
+    def stop_session(self, sid):
+        self.shard_for(sid).stop_session(sid)
+
+    def update_session(self, sid, **changes):
+        self.shard_for(sid).update_session(sid, **changes)
+
+    def push_audio(self, sid, data):
+        return self.shard_for(sid).push_audio(sid, data)
+
+    def shutdown(self, timeout=5):
+        for runtime in self.runtimes:
+            runtime.shutdown(timeout=timeout)
+
+
+class WorkerProcessRuntime:
+    """SessionRuntime API backed by a SessionRuntime in a forked child process.
+
+    make_runtime(forward_emit) runs in the child and returns its SessionRuntime;
+    session code there must emit through forward_emit(event, data, room), which
+    ships the emit to on_emit(event, data, room) in the parent. Client state
+    the session reads (connected flag, capture rate, ...) is taken with
+    client_state(sid) in the parent at start and handed to
+    apply_client_state(sid, state) in the child (state None on stop).
+    The child's on_session_done calls come back to on_session_done(sid) in the
+    parent over the same channel as the emits.
+    Uses the fork start method (Linux/macOS): make_runtime may be a closure.
+    """
+
+    def __init__(self, make_runtime, on_emit, name="SessionWorker", client_state=None, apply_client_state=None,
+                 on_session_done=None):
+        self.make_runtime = make_runtime
+        self.on_emit = on_emit
+        self.on_session_done = on_session_done
+        self.name = name
+        self.client_state = client_state or (lambda sid: None)
+        self.apply_client_state = apply_client_state or (lambda sid, state: None)
+        self.process = None
+        self._inbox = None
+        self._outbox = None
+        self._reader = None
+        self._live = set()  # sids started and not yet stopped or ended (parent view)
+        self._outstanding = collections.Counter()  # sid -> start_session calls whose session-done has not come back
+        self._live_lock = threading.Lock()  # Socket.IO handler threads and the emit reader both change _live/_outstanding
+
+    @property
+    def sessions(self):
+        with self._live_lock:
+            return {sid: {} for sid in self._live}
+
+    # --- Parent side ---
+    def start(self):
+        if self.is_running():
+            return
+        ctx = multiprocessing.get_context('fork')
+        self._inbox, self._outbox = ctx.Queue(), ctx.Queue()
+        self.process = ctx.Process(target=self._worker_main, name=self.name, daemon=True)
+        self.process.start()
+        self._reader = threading.Thread(target=self._read_outbox, name=f"{self.name}-emits", daemon=True)
+        self._reader.start()
+        log.info(f"{self.name}: worker process {self.process.pid} started.")
+
+    def is_running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start_session(self, sid, **options):
+        with self._live_lock:
+            self._live.add(sid)
+            self._outstanding[sid] += 1
+        self._send(('start', sid, options, self.client_state(sid)))
+
+    def stop_session(self, sid):
+        with self._live_lock:
+            self._live.discard(sid)
+        self._send(('stop', sid, None, None))
+
+    def update_session(self, sid, **changes):
+        if sid in self._live:
+            self._send(('update', sid, changes, None))
+
+    def push_audio(self, sid, data):
+        if sid not in self._live:
+            return False
+        return self._send(('audio', sid, data, None))
+
+    def shutdown(self, timeout=5):
+        if not self.is_running():
+            return
+        self._send(None)
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            log.warning(f"{self.name}: worker did not stop, terminating.")
+            self.process.terminate()
+            self._outbox.put(None)  # Release the emit reader
+        with self._live_lock:
+            self._live.clear()
+            self._outstanding.clear()
+
+    def _send(self, item):
+        if not self.is_running():
+            log.warning(f"{self.name}: worker not running, dropping {item[0] if item else 'shutdown'!r}")
+            return False
+        self._inbox.put(item)
+        return True
+
+    def _read_outbox(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                break
+            event, data, room = item
+            try:
+                if event == SESSION_DONE_EVENT:
+                    self._session_ended(room)
+                    if self.on_session_done is not None:
+                        self.on_session_done(room)
+                    continue
+                self.on_emit(event, data, room)
+            except Exception as e:
+                log.warning(f"[{room}] {self.name}: error relaying '{event}': {e}")
+
+    def _session_ended(self, sid):
+        # A session that ended on its own (upstream error, failed resume) stops taking audio, as in thread mode.
+        # A done for a session replaced by a newer start_session of the same sid leaves the newer one live.
+        with self._live_lock:
+            self._outstanding[sid] -= 1
+            if self._outstanding[sid] <= 0:
+                del self._outstanding[sid]
+                self._live.discard(sid)
+
+    # --- Child process ---
+    def _worker_main(self):
+        outbox = self._outbox
+        runtime = self.make_runtime(lambda event, data, room: outbox.put((event, data, room)))
+        runtime.on_session_done = lambda sid: outbox.put((SESSION_DONE_EVENT, None, sid))
+        runtime.start()
+        try:
+            while True:
+                item = self._inbox.get()
+                if item is None:
+                    break
+                action, sid, payload, state = item
+                if action == 'audio':
+                    runtime.push_audio(sid, payload)
+                elif action == 'start':
+                    self.apply_client_state(sid, state)
+                    runtime.start_session(sid, **payload)
+                elif action == 'stop':
+                    runtime.stop_session(sid)
+                    self.apply_client_state(sid, None)
+                elif action == 'update':
+                    runtime.update_session(sid, **payload)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            runtime.shutdown(timeout=5)
+            outbox.put(None)
+
+
+def build_session_runtime(make_runtime, shards=SESSION_RUNTIME_SHARDS, mode=SESSION_RUNTIME_MODE,
+                          on_emit=None, client_state=None, apply_client_state=None, on_session_done=None,
+                          name="AsyncioThread"):
+    """ShardedSessionRuntime of `shards` loop threads, or of worker processes when mode is 'processes'.
+
+    make_runtime(index, forward_emit) builds one shard's SessionRuntime;
+    forward_emit is None for in-process shards. on_session_done(sid) is
+    installed on every shard (see SessionRuntime).
+    """
+    if mode == RUNTIME_MODE_PROCESSES:
+        runtimes = [WorkerProcessRuntime(lambda forward_emit, i=i: make_runtime(i, forward_emit), on_emit,
+                                         name=f"{name}-worker-{i}", client_state=client_state,
+                                         apply_client_state=apply_client_state, on_session_done=on_session_done)
+                    for i in range(shards)]
+    else:
+        if mode != RUNTIME_MODE_THREADS:
+            log.warning(f"Unknown SESSION_RUNTIME_MODE '{mode}', using '{RUNTIME_MODE_THREADS}'")
+        runtimes = [make_runtime(i, None) for i in range(shards)]
+        for runtime in runtimes:
+            runtime.on_session_done = on_session_done
+    log.info(f"{name}: {len(runtimes)} session shard(s) in {mode if mode == RUNTIME_MODE_PROCESSES else RUNTIME_MODE_THREADS} mode.")
+    return ShardedSessionRuntime(runtimes)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Sticky router: run several server workers on one host behind one port.
+
+Each worker is a normal app.py (or elevenlabs_app.py) process on its own port,
+started with WORKER_INDEX and a shared SOCKETIO_MESSAGE_QUEUE. Socket.IO
+needs every request of a session (the polling requests and the websocket
+upgrade) to reach the worker that accepted the handshake, so workers tag their
+Engine.IO session ids with their index ("w2-...") and the router reads the
+`sid` query parameter from each new connection's request line:
+
+* sid present  - forward to the worker named in the prefix;
+* no sid       - a new handshake (or a plain page/API request): round-robin.
+
+After the request head the router is a plain byte pipe, so websockets work.
+Plain HTTP requests are forwarded with `Connection: close`, so a kept-alive
+browser connection can never carry another session's polls to the wrong
+worker.
+
+Cross-worker emits go over the message bus (message_bus.py); the router hosts
+a BusHub for it unless SOCKETIO_MESSAGE_QUEUE already points elsewhere.
+
+    python sticky_router.py --workers 4 [--port 5050] [--app app.py]
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+
+from message_bus import UNIX_SCHEME, BusHub, private_socket_path
+
+log = logging.getLogger(__name__)
+
+MAX_HEAD_BYTES = 64 * 1024
+_SID_RE = re.compile(rb'[?&]sid=w(\d+)-')
+_CONNECTION_HEADER_RE = re.compile(rb'\r\n(?:connection|keep-alive):[^\r]*', re.IGNORECASE)
+
+
+def tag_worker_sids(server, worker_index):
+    """Prefix the Engine.IO session ids of a python-socketio server with this worker's index."""
+    eio = server.eio
+    generate = eio.generate_id
+    eio.generate_id = lambda: f"w{worker_index}-{generate()}"
+
+
+def one_request_per_connection(head):
+    """Rewrite a plain HTTP request head to `Connection: close` (websocket upgrades pass through)."""
+    if b'upgrade: websocket' in head.lower():
+        return head
+    return _CONNECTION_HEADER_RE.sub(b'', head[:-4]) + b'\r\nConnection: close\r\n\r\n'
+
+
+def worker_for_request(head, workers):
+    """Worker index named by the request's sid, or None for new sessions."""
+    request_line = head.split(b'\r\n', 1)[0]
+    match = _SID_RE.search(request_line)
+    if match is None:
+        return None
+    index = int(match.group(1))
+    return index if index < workers else None
+
+
+class StickyRouter:
+    def __init__(self, backends):
+        self.backends = list(backends)  # [(host, port)] indexed by worker
+        self._round_robin = itertools.cycle(range(len(self.backends)))
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            head = await client_reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+        index = worker_for_request(head, len(self.backends))
+        if index is None:
+            index = next(self._round_robin)
+        host, port = self.backends[index]
+        try:
+            backend_reader, backend_writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            log.warning(f"Worker {index} ({host}:{port}) unavailable: {e}")
+            client_writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await client_writer.drain()
+            client_writer.close()
+            return
+        backend_writer.write(one_request_per_connection(head))
+        await asyncio.gather(self._pipe(client_reader, backend_writer), self._pipe(backend_reader, client_writer))
+
+    async def _pipe(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+
+def start_workers(app_script, workers, base_port, message_queue):
+    procs = []
+    for index in range(workers):
+        env = dict(os.environ, WORKER_INDEX=str(index), PORT=str(base_port + index), SOCKETIO_MESSAGE_QUEUE=message_queue)
+        procs.append(subprocess.Popen([sys.executable, app_script], env=env))
+        log.info(f"Worker {index}: {app_script} on port {base_port + index} (pid {procs[-1].pid})")
+    return procs
+
+
+async def serve(port, backends):
+    router = StickyRouter(backends)
+    server = await asyncio.start_server(router.handle, '0.0.0.0', port, limit=MAX_HEAD_BYTES)
+    log.info(f"Sticky router on port {port} -> {len(backends)} worker(s)")
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sticky Socket.IO router with local worker processes")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--worker-base-port', type=int, default=5100)
+    parser.add_argument('--app', default='app.py', help="server script each worker runs")
+    parser.add_argument('--bus', default=os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None,
+                        help="message bus URL (default: a hub on a socket in a private temporary directory)")
+    args = parser.parse_args()
+    private_bus = args.bus is None
+    if private_bus:
+        args.bus = UNIX_SCHEME + private_socket_path()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    hub = BusHub(args.bus[len(UNIX_SCHEME):]).start() if args.bus.startswith(UNIX_SCHEME) else None
+    procs = start_workers(args.app, args.workers, args.worker_base_port, args.bus)
+    try:
+        asyncio.run(serve(args.port, [('127.0.0.1', args.worker_base_port + i) for i in range(args.workers)]))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+        if hub is not None:
+            hub.close()
+        if private_bus:
+            os.rmdir(os.path.dirname(args.bus[len(UNIX_SCHEME):]))
+        log.info("Router and workers stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test the multi-worker deployment mode locally: sticky routing + message bus.
+
+Starts a BusHub, three small Flask-SocketIO workers (this script with
+--worker, configured exactly like app.py: socketio_queue_options() and
+tag_worker_sids()) and the sticky router in front of them, then connects
+clients through the router with the default polling -> websocket transport.
+
+Checks:
+1. every client completes its handshake and upgrade through the router
+   (requests for one session always reach the same worker);
+2. new sessions are spread over the workers;
+3. an emit made on one worker reaches a client connected to another worker
+   (cross-worker delivery over the Unix-socket bus).
+
+    pip install Flask Flask-SocketIO "python-socketio[client]"
+    python test_multiworker.py
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+WORKERS = 3
+CLIENTS = 6
+ROUTER_PORT = 5600
+WORKER_BASE_PORT = 5610
+
+
+def run_worker():
+    """Minimal worker wired like app.py."""
+    from flask import Flask, request
+    from flask_socketio import SocketIO, emit
+
+    from message_bus import socketio_queue_options
+    from sticky_router import tag_worker_sids
+
+    index = os.environ["WORKER_INDEX"]
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode="threading", cors_allowed_origins="*", **socketio_queue_options())
+    tag_worker_sids(socketio.server, index)
+
+    @socketio.on('whoami')
+    def whoami():
+        emit('worker', {'index': index, 'sid': request.sid})
+
+    @socketio.on('relay')
+    def relay(data):
+        # Emitted on this worker; the target sid may live on any worker
+        socketio.emit('relayed', {'text': data['text'], 'via': index}, room=data['to'])
+
+    socketio.run(app, host='127.0.0.1', port=int(os.environ["PORT"]), use_reloader=False, log_output=False,
+                 allow_unsafe_werkzeug=True)
+
+
+def start_router():
+    from message_bus import UNIX_SCHEME, BusHub, private_socket_path
+
+    hub = BusHub(private_socket_path()).start()  # Workers unpickle bus frames: keep the socket in a private directory
+    worker_cmd = os.path.abspath(__file__)
+    procs = []
+    for index in range(WORKERS):
+        env = dict(os.environ, WORKER_INDEX=str(index), PORT=str(WORKER_BASE_PORT + index),
+                   SOCKETIO_MESSAGE_QUEUE=f"{UNIX_SCHEME}{hub.path}")
+        procs.append(subprocess.Popen([sys.executable, worker_cmd, '--worker'], env=env))
+    backends = [('127.0.0.1', WORKER_BASE_PORT + i) for i in range(WORKERS)]
+    router_loop = asyncio.new_event_loop()
+    threading.Thread(target=router_loop.run_until_complete, args=(serve_until_stopped(backends),), daemon=True).start()
+    return hub, procs
+
+
+async def serve_until_stopped(backends):
+    from sticky_router import StickyRouter
+    server = await asyncio.start_server(StickyRouter(backends).handle, '127.0.0.1', ROUTER_PORT)
+    async with server:
+        await asyncio.Event().wait()
+
+
+def connect_clients():
+    import socketio
+
+    clients = []
+    for n in range(CLIENTS):
+        client = socketio.Client()
+        state = {'worker': None, 'sid': None, 'relayed': [], 'ready': threading.Event()}
+
+        def on_worker(data, state=state):
+            state['worker'], state['sid'] = data['index'], data['sid']
+            state['ready'].set()
+
+        client.on('worker', on_worker)
+        client.on('relayed', lambda data, state=state: state['relayed'].append(data))
+        client.connect(f"http://127.0.0.1:{ROUTER_PORT}", wait_timeout=10)
+        client.emit('whoami')
+        clients.append((client, state))
+    return clients
+
+
+def main():
+    print("🔍 Starting bus hub, workers and sticky router...")
+    hub, procs = start_router()
+    time.sleep(3)
+    passed = True
+    clients = []
+    try:
+        # 1. Handshakes and upgrades through the router
+        clients = connect_clients()
+        ok = all(state['ready'].wait(10) for _, state in clients)
+        transports = {client.transport() for client, _ in clients}
+        print(f"{'✅' if ok else '❌'} {CLIENTS} clients connected through the router (transports: {transports})")
+        passed &= ok
+
+        # 2. Sessions spread over workers
+        workers_used = {state['worker'] for _, state in clients}
+        ok = len(workers_used) > 1
+        print(f"{'✅' if ok else '❌'} sessions spread over workers {sorted(workers_used)}")
+        passed &= ok
+
+        # 3. Cross-worker emits
+        pairs = [(a, b) for a in clients for b in clients if a[1]['worker'] != b[1]['worker']][:CLIENTS]
+        for (sender, sender_state), (_, target_state) in pairs:
+            sender.emit('relay', {'to': target_state['sid'], 'text': f"from worker {sender_state['worker']}"})
+        time.sleep(1)
+        delivered = sum(len(state['relayed']) for _, state in clients)
+        ok = bool(pairs) and delivered == len(pairs)
+        print(f"{'✅' if ok else '❌'} cross-worker emits delivered: {delivered}/{len(pairs)}")
+        passed &= ok
+    except Exception as e:
+        print(f"❌ Multi-worker test error: {e}")
+        passed = False
+    finally:
+        for client, _ in clients:
+            client.disconnect()
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+        hub.close()
+        os.rmdir(os.path.dirname(hub.path))
+
+    print("\n" + "=" * 60)
+    print("MULTI-WORKER TEST " + ("PASSED" if passed else "FAILED"))
+    print("=" * 60)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    if '--worker' in sys.argv:
+        run_worker()
+    else:
+        main()
@@ -0,0 +1,114 @@
+"""
+Coalescing of streamed assistant text into fewer 'response_text_update' emits.
+
+The OpenAI session emits one response.text.delta / response.audio_transcript.delta
+per token or two, and each one used to become its own Socket.IO packet and its
+own DOM update in the browser: hundreds of tiny emits per turn. The page only
+appends the text, so merging consecutive deltas changes nothing it shows.
+
+TextCoalescer buffers deltas and emits them:
+  * immediately up to a sentence end (. ! ? or a newline followed by a space
+    or the end of the delta), so captions keep up sentence by sentence;
+  * otherwise TRANSCRIPT_COALESCE_MS after the first buffered delta, cut at the
+    last word boundary (a partial word waits for the next flush, unless the
+    buffer holds no space at all);
+  * on flush(), which the session calls on response.done before the final
+    is_final emit.
+discard() drops the buffer on a barge-in, where the page clears the reply.
+TRANSCRIPT_COALESCE_MS=0 emits every delta as it arrives.
+"""
+import asyncio
+import logging
+import os
+import re
+
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Max milliseconds a transcript delta is held before it is emitted (0 disables coalescing)
+TRANSCRIPT_COALESCE_MS = int(os.environ.get("TRANSCRIPT_COALESCE_MS", "100"))
+
+# Sentence-ending punctuation (and closing quotes) followed by whitespace or the end of the delta; "25.4" does not match
+SENTENCE_END = re.compile(r'[.!?\n]["\')\]]*(?:\s+|$)')
+
+# Histogram buckets for deltas merged into one emit
+DELTAS_PER_EMIT_BOUNDS = (1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+
+
+def _sentence_end(text):
+    """Index just past the last sentence end in text (0 if there is none)."""
+    end = 0
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+    return end
+
+
+class TextCoalescer:
+    """Buffers text deltas for one session and hands merged text to emit(text) on the session's loop."""
+
+    def __init__(self, emit, interval_ms=TRANSCRIPT_COALESCE_MS, provider="openai", session_metrics=None):
+        self.emit = emit
+        self.interval_s = interval_ms / 1000.0
+        self.provider = provider
+        self.session_metrics = session_metrics
+        self._parts = []
+        self._deltas = 0  # Deltas merged into the pending text
+        self._timer = None
+        self._loop = asyncio.get_running_loop() if self.interval_s > 0 else None
+
+    def push(self, text):
+        if not text:
+            return
+        self._deltas += 1
+        if self._loop is None:
+            self._emit(text)
+            return
+        end = _sentence_end(text)
+        if end:
+            self._parts.append(text[:end])
+            self.flush()
+            text = text[end:]
+            if not text:
+                return
+            self._deltas = 1
+        self._parts.append(text)
+        if self._timer is None:
+            self._timer = self._loop.call_later(self.interval_s, self._on_timer)
+
+    def flush(self):
+        """Emit everything buffered now."""
+        self._cancel_timer()
+        if self._parts:
+            text, self._parts = "".join(self._parts), []
+            self._emit(text)
+
+    def discard(self):
+        """Drop the buffered text (the reply it belonged to was interrupted)."""
+        self._cancel_timer()
+        self._parts = []
+        self._deltas = 0
+
+    def _on_timer(self):
+        self._timer = None
+        text, self._parts = "".join(self._parts), []
+        cut = max(text.rfind(' '), text.rfind('\n')) + 1
+        if 0 < cut < len(text):
+            self._parts = [text[cut:]]  # Hold the partial word back; it goes out with the next flush
+            text = text[:cut]
+            self._timer = self._loop.call_later(self.interval_s, self._on_timer)
+        if text:
+            self._emit(text)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _emit(self, text):
+        deltas, self._deltas = max(self._deltas, 1), 0
+        metrics.observe(f"{self.provider}.text_deltas_per_emit", deltas, DELTAS_PER_EMIT_BOUNDS)
+        if self.session_metrics is not None:
+            self.session_metrics.incr('text_emits')
+            self.session_metrics.incr('text_deltas', deltas)
+        self.emit(text)
@@ -0,0 +1,98 @@
+"""
+Streaming multi-pattern matcher for the meeting-confirmation triggers.
+
+The servers decide that a meeting was confirmed when the agent's reply
+contains a confirmation phrase ("perfect", "we're set", ...) and a weekday.
+They used to append every text delta to the accumulated reply and re-run
+`any(trigger in reply.lower() ...)` over the whole string for each phrase
+list, so a turn cost O(length^2) and every delta got slower than the last.
+
+TriggerMatcher compiles all phrase groups into one Aho-Corasick automaton,
+flattened into a DFA (one dict of transitions per state), once at import. A
+TriggerScanner carries the automaton state across deltas: feed() looks at
+each new character exactly once, phrases split across deltas are still
+found, and once every group has been seen further deltas are not scanned at
+all. Matching is case-insensitive, like the `.lower()` checks it replaces.
+"""
+import collections
+
+CONFIRMATION_TRIGGERS = ("perfect", "great", "we're set", "confirmed", "scheduled for")
+MEETING_DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday")
+
+CONFIRMATION = "confirmation"
+DAY = "day"
+
+
+class TriggerMatcher:
+    """Compiled automaton for {group: phrases}; scanner() gives per-stream state."""
+
+    def __init__(self, groups):
+        self.groups = frozenset(groups)
+        goto = [{}]
+        out = [set()]
+        for group, phrases in groups.items():
+            for phrase in phrases:
+                state = 0
+                for ch in phrase.lower():
+                    if ch not in goto[state]:
+                        goto.append({})
+                        out.append(set())
+                        goto[state][ch] = len(goto) - 1
+                    state = goto[state][ch]
+                out[state].add(group)
+        # Breadth-first: a state's failure link is always finished before the state itself
+        fail = [0] * len(goto)
+        table = [None] * len(goto)
+        table[0] = dict(goto[0])
+        pending = collections.deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            out[state] |= out[fail[state]]
+            table[state] = {**table[fail[state]], **goto[state]}  # Missing transitions follow the failure link
+            for ch, child in goto[state].items():
+                fail[child] = table[fail[state]].get(ch, 0) if state else 0
+                pending.append(child)
+        self._table = table
+        self._out = [frozenset(groups) for groups in out]
+
+    def scanner(self):
+        return TriggerScanner(self)
+
+    def search(self, text):
+        """Groups found anywhere in a complete text."""
+        return frozenset(self.scanner().feed(text))
+
+
+class TriggerScanner:
+    """Match state of one text stream (an agent reply being streamed)."""
+
+    __slots__ = ('matcher', 'state', 'found')
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.state = 0
+        self.found = set()
+
+    def feed(self, text):
+        """Scan the next delta; returns every group seen since the last reset."""
+        if not text or len(self.found) == len(self.matcher.groups):
+            return self.found
+        table, out = self.matcher._table, self.matcher._out
+        state = self.state
+        for ch in text.lower():
+            state = table[state].get(ch, 0)
+            if out[state]:
+                self.found |= out[state]
+        self.state = state
+        return self.found
+
+    def matched(self, *groups):
+        return all(group in self.found for group in groups)
+
+    def reset(self):
+        self.state = 0
+        self.found = set()
+
+
+# Shared by the realtime servers: confirmation phrase + weekday in the agent's reply
+MEETING_CONFIRMATION = TriggerMatcher({CONFIRMATION: CONFIRMATION_TRIGGERS, DAY: MEETING_DAYS})
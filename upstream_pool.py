@@ -0,0 +1,128 @@
+"""
+Pool of pre-connected, pre-configured upstream realtime sessions.
+
+Opening the OpenAI realtime websocket, sending the large session.update and
+waiting for it to take effect used to happen after the client pressed start,
+all before the greeting could even be requested. UpstreamPool keeps a few of
+those sessions ready on the runtime loop: a new client claims one with
+acquire() and can request the greeting immediately.
+
+* replenish - run() keeps `size` idle sessions open, reconnecting in the
+              background whenever one is claimed, expires or drops;
+* expiry    - sessions idle for longer than max_age_s are closed and replaced,
+              so a claimed session is never close to the provider's session
+              lifetime limit;
+* fallback  - acquire() returns None when nothing is ready (pool disabled,
+              warming up, upstream failing) and the caller connects cold.
+
+connect() must return an open websocket whose session is already configured.
+"""
+import asyncio
+import collections
+import logging
+import time
+
+from realtime_metrics import metrics
+
+log = logging.getLogger(__name__)
+
+RETRY_BACKOFF_S = (1, 2, 5, 10, 30)
+
+
+class UpstreamPool:
+    def __init__(self, connect, size, max_age_s, name="upstream"):
+        self.connect = connect
+        self.size = size
+        self.max_age_s = max_age_s
+        self.name = name
+        self._idle = collections.deque()  # (ready_at, websocket), oldest first
+        self._wakeup = None
+        self._failures = 0
+
+    # --- Runtime loop side ---
+    async def acquire(self):
+        """Claim a ready session, or None if none is available."""
+        now = time.monotonic()
+        while self._idle:
+            ready_at, ws = self._idle.pop()  # Newest first: furthest from expiry
+            if ws.open and now - ready_at < self.max_age_s:
+                metrics.incr(f"{self.name}.pool_hits")
+                self._changed()
+                return ws
+            asyncio.ensure_future(self._discard(ws, "stale on acquire"))  # Don't make the client wait for the close handshake
+        if self.size:
+            metrics.incr(f"{self.name}.pool_misses")
+        self._changed()
+        return None
+
+    async def run(self):
+        """Replenish and expire pooled sessions until cancelled (closes them on exit)."""
+        if not self.size:
+            return
+        self._wakeup = asyncio.Event()
+        log.info(f"{self.name} pool: keeping {self.size} session(s) warm (max age {self.max_age_s}s).")
+        try:
+            while True:
+                await self._expire()
+                if len(self._idle) < self.size:
+                    if await self._add_one():
+                        continue
+                    delay = RETRY_BACKOFF_S[min(self._failures, len(RETRY_BACKOFF_S)) - 1]
+                else:
+                    oldest_ready_at = self._idle[0][0]
+                    delay = max(0.0, oldest_ready_at + self.max_age_s - time.monotonic())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            while self._idle:
+                _, ws = self._idle.popleft()
+                await self._discard(ws, "pool shutting down")
+            metrics.set_gauge(f"{self.name}.pool_idle", 0)
+
+    async def _add_one(self):
+        started = time.monotonic()
+        try:
+            ws = await self.connect()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._failures += 1
+            metrics.incr(f"{self.name}.pool_connect_failures")
+            log.warning(f"{self.name} pool: warm-up failed ({self._failures} in a row): {e}")
+            return False
+        self._failures = 0
+        self._idle.append((time.monotonic(), ws))
+        metrics.observe(f"{self.name}.pool_warmup_ms", (time.monotonic() - started) * 1000.0)
+        metrics.set_gauge(f"{self.name}.pool_idle", len(self._idle))
+        log.info(f"{self.name} pool: session ready ({len(self._idle)}/{self.size} idle).")
+        return True
+
+    async def _expire(self):
+        now = time.monotonic()
+        kept = collections.deque()
+        while self._idle:
+            ready_at, ws = self._idle.popleft()
+            if not ws.open:
+                await self._discard(ws, "closed by upstream")
+            elif now - ready_at >= self.max_age_s:
+                metrics.incr(f"{self.name}.pool_expired")
+                await self._discard(ws, "expired")
+            else:
+                kept.append((ready_at, ws))
+        self._idle = kept
+        metrics.set_gauge(f"{self.name}.pool_idle", len(self._idle))
+
+    async def _discard(self, ws, reason):
+        log.debug(f"{self.name} pool: closing session ({reason}).")
+        try:
+            await ws.close()
+        except Exception as e:
+            log.debug(f"{self.name} pool: error closing session: {e}")
+
+    def _changed(self):
+        metrics.set_gauge(f"{self.name}.pool_idle", len(self._idle))
+        if self._wakeup is not None:
+            self._wakeup.set()
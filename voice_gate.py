@@ -0,0 +1,104 @@
+"""
+Server-side voice activity gate for upstream audio.
+
+While the advisor is listening the browser still streams a chunk every ~85 ms,
+and every one of them used to be resampled, base64-encoded and sent upstream.
+The gate classifies each chunk with a cheap energy + zero-crossing test
+(vectorized over 20 ms frames with NumPy) and only lets speech through.
+
+Two paddings keep the provider's own turn detection working:
+
+* pre-roll: the last VOICE_GATE_PREROLL_MS of gated audio is released when
+  speech starts, so server VAD still gets its prefix_padding_ms;
+* hangover: audio keeps flowing for VOICE_GATE_HANGOVER_MS after the last
+  speech frame, long enough for server VAD to see silence_duration_ms of quiet
+  and emit speech_stopped.
+
+Gate transitions are marked with SPEECH_BOUNDARY so the coalescer never merges
+audio across them.
+"""
+import collections
+import os
+
+import numpy as np
+
+from audio_coalescer import SPEECH_BOUNDARY
+from audio_transport import BYTES_PER_SAMPLE, pcm_duration_ms
+
+VOICE_GATE_ENABLED = os.environ.get("VOICE_GATE_ENABLED", "false").lower() in ("1", "true", "yes")
+VOICE_GATE_THRESHOLD_DBFS = float(os.environ.get("VOICE_GATE_THRESHOLD_DBFS", "-50"))
+VOICE_GATE_HANGOVER_MS = int(os.environ.get("VOICE_GATE_HANGOVER_MS", "600"))
+VOICE_GATE_PREROLL_MS = int(os.environ.get("VOICE_GATE_PREROLL_MS", "300"))
+
+FRAME_MS = 20
+MAX_SPEECH_ZCR = 0.35  # Zero-crossing rate above this at low energy is hiss, not voice
+LOUD_MARGIN_DB = 12.0  # Frames this far above threshold count as speech regardless of ZCR (fricatives)
+
+
+class VoiceActivityGate:
+    """Per-session gate; process() maps one PCM16 chunk to the items to enqueue."""
+
+    def __init__(self, sample_rate, threshold_dbfs=VOICE_GATE_THRESHOLD_DBFS,
+                 hangover_ms=VOICE_GATE_HANGOVER_MS, preroll_ms=VOICE_GATE_PREROLL_MS,
+                 session_metrics=None):
+        self.sample_rate = sample_rate
+        self.frame_len = max(1, sample_rate * FRAME_MS // 1000)
+        self.threshold_dbfs = threshold_dbfs
+        self.hangover_ms = hangover_ms
+        self.preroll_bytes = int(sample_rate * preroll_ms / 1000) * BYTES_PER_SAMPLE
+        self.session_metrics = session_metrics
+        self.is_open = False
+        self._ms_since_speech = 0.0
+        self._preroll = collections.deque()
+        self._preroll_size = 0
+
+    def speech_frames(self, pcm):
+        """Boolean speech decision per 20 ms frame of a PCM16 chunk."""
+        x = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+        full = len(x) // self.frame_len * self.frame_len
+        frames = x[:full].reshape(-1, self.frame_len)
+        if full < len(x):  # Cover the tail with one overlapping frame
+            tail = x[-self.frame_len:] if len(x) >= self.frame_len else x
+            frames = tail[None, :] if not full else np.vstack((frames, tail[None, :]))
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        dbfs = 20.0 * np.log10(rms / 32768.0 + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1) if frames.shape[1] > 1 else np.zeros(len(frames))
+        return (dbfs > self.threshold_dbfs) & ((zcr < MAX_SPEECH_ZCR) | (dbfs > self.threshold_dbfs + LOUD_MARGIN_DB))
+
+    def process(self, pcm):
+        chunk_ms = pcm_duration_ms(len(pcm), self.sample_rate)
+        speech = self.speech_frames(pcm)
+        if speech.any():
+            last = int(np.flatnonzero(speech)[-1])
+            self._ms_since_speech = max(0.0, chunk_ms - (last + 1) * FRAME_MS)
+            if not self.is_open:
+                self.is_open = True
+                items = [SPEECH_BOUNDARY, *self._preroll, pcm]
+                self._count('voice_gate_forwarded_frames', 1)
+                self._count('voice_gate_preroll_frames', len(self._preroll))
+                self._preroll.clear()
+                self._preroll_size = 0
+                return items
+            self._count('voice_gate_forwarded_frames', 1)
+            return [pcm]
+
+        self._ms_since_speech += chunk_ms
+        if self.is_open:
+            self._count('voice_gate_forwarded_frames', 1)
+            if self._ms_since_speech >= self.hangover_ms:
+                self.is_open = False
+                return [pcm, SPEECH_BOUNDARY]
+            return [pcm]
+
+        self._count('voice_gate_gated_frames', 1)
+        self._count('voice_gate_gated_ms', int(chunk_ms))
+        self._preroll.append(pcm)
+        self._preroll_size += len(pcm)
+        while self._preroll and self._preroll_size - len(self._preroll[0]) >= self.preroll_bytes:
+            self._preroll_size -= len(self._preroll.popleft())
+        return []
+
+    def _count(self, name, value):
+        if self.session_metrics is not None and value:
+            self.session_metrics.incr(name, value)